@@ -1,7 +1,12 @@
+import os
+import hmac
 from fastapi import Header, HTTPException, Depends, APIRouter
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from .database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_db, get_async_db
 from .models import Merchant
+from .utils.cache import TTLCache
 from pydantic import BaseModel
 
 # 1. Initialize the router (This line solves the AttributeError)
@@ -30,22 +35,42 @@ def login(payload: LoginRequest, db: Session = Depends(get_db)):
         "api_key": merchant.api_key
     }
 
+# 4. Credential cache: api_key -> (detached Merchant, api_secret)
+# Each process keeps its own copy, so the TTL bounds how stale another worker can be.
+MERCHANT_CACHE_TTL = float(os.getenv("MERCHANT_CACHE_TTL", 60))
+MERCHANT_CACHE_SIZE = int(os.getenv("MERCHANT_CACHE_SIZE", 1024))
+merchant_cache = TTLCache(maxsize=MERCHANT_CACHE_SIZE, ttl=MERCHANT_CACHE_TTL)
+
+def invalidate_merchant(api_key: str):
+    """Drops a merchant from the credential cache after its row changes."""
+    merchant_cache.invalidate(api_key)
+
+def _secret_matches(expected: str, provided: str) -> bool:
+    return hmac.compare_digest(expected.encode(), provided.encode())
+
 async def get_authenticated_merchant(
     x_api_key: str = Header(None, alias="X-Api-Key"),
     x_api_secret: str = Header(None, alias="X-Api-Secret"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     if not x_api_key or not x_api_secret:
         raise HTTPException(status_code=401, detail={
             "error": {"code": "AUTHENTICATION_ERROR", "description": "Invalid API credentials"}
         })
     
-    merchant = db.query(Merchant).filter(
-        Merchant.api_key == x_api_key, 
-        Merchant.api_secret == x_api_secret
-    ).first()
-    
-    if not merchant:
+    cached = merchant_cache.get(x_api_key)
+    if cached is not None:
+        merchant, api_secret = cached
+    else:
+        result = await db.execute(select(Merchant).where(Merchant.api_key == x_api_key))
+        merchant = result.scalars().first()
+        if merchant:
+            api_secret = merchant.api_secret
+            # Detach so the instance survives commits/closes of this request's session
+            db.expunge(merchant)
+            merchant_cache.set(x_api_key, (merchant, api_secret))
+
+    if not merchant or not _secret_matches(api_secret, x_api_secret):
         raise HTTPException(status_code=401, detail={
             "error": {"code": "AUTHENTICATION_ERROR", "description": "Invalid API credentials"}
         })
@@ -0,0 +1,96 @@
+import sqlalchemy
+from .database import engine, Base, SessionLocal, wait_for_database
+from .models import Merchant, IDEMPOTENCY_PARTITIONED
+from .maintenance import ensure_idempotency_partitions
+
+# One-off schema + seed step. Run it once per deploy, before the API scales out:
+#   python -m app.bootstrap
+# API processes only run it themselves when DB_BOOTSTRAP_ON_STARTUP is true (the
+# default, for single-process setups). Concurrent runs are serialized by a
+# Postgres advisory lock, so replicas booting together cannot race on DDL.
+BOOTSTRAP_LOCK_ID = 7240519
+
+# create_all only creates missing tables. Columns added to existing tables since
+# the first deploy are listed here as (table, column, definition) and added on
+# Postgres when the catalog shows them missing; `backfill` runs only in that case.
+ADDED_COLUMNS = (
+    ("merchants", "webhook_batch_enabled", "BOOLEAN"),
+    ("merchants", "webhook_batch_window", "INTEGER"),
+    ("merchants", "webhook_batch_max_events", "INTEGER"),
+    ("idempotency_keys", "fingerprint", "VARCHAR(64)"),
+    ("payments", "refunded_amount", "INTEGER NOT NULL DEFAULT 0"),
+)
+BACKFILLS = {
+    # Refunds created before refunded_amount existed still count against the payment
+    ("payments", "refunded_amount"): (
+        "UPDATE payments SET refunded_amount = r.total "
+        "FROM (SELECT payment_id, SUM(amount) AS total FROM refunds WHERE status != 'failed' GROUP BY payment_id) r "
+        "WHERE r.payment_id = payments.id"
+    ),
+}
+
+def migrate_existing_tables(connection):
+    """Two catalog reads on an up-to-date database; DDL only for what is missing."""
+    existing = set(connection.execute(sqlalchemy.text(
+        "SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = current_schema()"
+    )).all())
+    for table, column, definition in ADDED_COLUMNS:
+        if (table, column) in existing:
+            continue
+        connection.execute(sqlalchemy.text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}"))
+        if (table, column) in BACKFILLS:
+            connection.execute(sqlalchemy.text(BACKFILLS[(table, column)]))
+
+    # Indexes declared after their table was first created
+    present = set(connection.execute(sqlalchemy.text(
+        "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"
+    )).scalars())
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in present:
+                connection.execute(sqlalchemy.schema.CreateIndex(index, if_not_exists=True))
+
+def bootstrap():
+    wait_for_database()
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(sqlalchemy.text("SELECT pg_advisory_xact_lock(:id)"), {"id": BOOTSTRAP_LOCK_ID})
+        Base.metadata.create_all(bind=connection)
+        if connection.dialect.name == "postgresql":
+            migrate_existing_tables(connection)
+    if IDEMPOTENCY_PARTITIONED:
+        db = SessionLocal()
+        try:
+            ensure_idempotency_partitions(db)
+        finally:
+            db.close()
+    seed_test_merchant()
+
+def seed_test_merchant():
+    db = SessionLocal()
+    try:
+        test_id = "550e8400-e29b-41d4-a716-446655440000"
+        test_email = "test@example.com"
+        
+        exists = db.query(Merchant).filter(Merchant.email == test_email).first()
+        
+        if not exists:
+            test_merchant = Merchant(
+                id=test_id,
+                name="Test Merchant",
+                email=test_email,
+                api_key="key_test_abc123",
+                api_secret="secret_test_xyz789",
+                webhook_url="http://host.docker.internal:3002/api/webhooks",
+                webhook_secret="whsec_test_abc123"
+            )
+            db.add(test_merchant)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    bootstrap()
+    print("Database schema and seed data are in place.")
@@ -0,0 +1,124 @@
+import os
+import math
+import time
+import redis
+from email.utils import parsedate_to_datetime
+from .redis_client import redis_client
+
+# Per-merchant circuit breaker for webhook endpoints, shared by every worker
+# through Redis.
+#   closed    - deliveries go out normally
+#   open      - after WEBHOOK_BREAKER_THRESHOLD consecutive failures nothing is sent
+#               until the cool-down ends; events are parked in webhook_logs
+#   half-open - once the cool-down ends a single probe is sent; success closes the
+#               breaker, failure re-opens it with a longer cool-down
+# If Redis is unavailable the breaker stays closed.
+CLOSED, OPEN, PROBE = "closed", "open", "probe"
+
+WEBHOOK_BREAKER_THRESHOLD = int(os.getenv("WEBHOOK_BREAKER_THRESHOLD", 5))
+WEBHOOK_BREAKER_COOLDOWN = float(os.getenv("WEBHOOK_BREAKER_COOLDOWN", 30))
+WEBHOOK_BREAKER_MAX_COOLDOWN = float(os.getenv("WEBHOOK_BREAKER_MAX_COOLDOWN", 3600))
+# Cool-downs never drop below this many times the endpoint's typical response time
+WEBHOOK_BREAKER_LATENCY_FACTOR = float(os.getenv("WEBHOOK_BREAKER_LATENCY_FACTOR", 10))
+PROBE_TTL = 30
+LATENCY_ALPHA = 0.3
+
+def _key(merchant_id) -> str:
+    return f"webhooks:breaker:{merchant_id}"
+
+def _probe_key(merchant_id) -> str:
+    return f"webhooks:breaker_probe:{merchant_id}"
+
+def check(merchant_id) -> str:
+    """CLOSED or PROBE when the caller may send (PROBE: exactly one request), else OPEN."""
+    try:
+        state = redis_client.hmget(_key(merchant_id), "failures", "open_until")
+        failures, open_until = int(state[0] or 0), float(state[1] or 0)
+        if failures < WEBHOOK_BREAKER_THRESHOLD:
+            return CLOSED
+        if time.time() < open_until:
+            return OPEN
+        # Cool-down over: whoever sets the probe key first sends the probe
+        if redis_client.set(_probe_key(merchant_id), 1, nx=True, ex=PROBE_TTL):
+            return PROBE
+        return OPEN
+    except redis.RedisError:
+        return CLOSED
+
+def reopens_in(merchant_id) -> float:
+    """Seconds until the breaker lets a probe through (0 when closed)."""
+    try:
+        open_until = redis_client.hget(_key(merchant_id), "open_until")
+    except redis.RedisError:
+        return 0.0
+    return max(float(open_until or 0) - time.time(), 0.0)
+
+def record_result(merchant_id, ok: bool, latency: float, probe: bool = False) -> float:
+    """
+    Feeds one delivery outcome back into the breaker (`probe` when the request was
+    sent in the half-open state). Returns seconds until it reopens (0 if closed).
+    Retry-After is not an input: it only delays that one event's retry.
+    """
+    key = _key(merchant_id)
+    try:
+        previous = redis_client.hget(key, "latency")
+        smoothed = latency if previous is None else (
+            LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * float(previous)
+        )
+        if ok:
+            pipe = redis_client.pipeline()
+            pipe.hset(key, mapping={"failures": 0, "trips": 0, "open_until": 0, "latency": smoothed})
+            pipe.delete(_probe_key(merchant_id))
+            pipe.execute()
+            return 0.0
+
+        pipe = redis_client.pipeline()
+        pipe.hincrby(key, "failures", 1)
+        pipe.hset(key, "latency", smoothed)
+        failures, _ = pipe.execute()
+        # Only the failure that crosses the threshold (or a failed probe) trips the
+        # breaker; requests already in flight when it opened must not keep extending
+        # the cool-down
+        if not (failures == WEBHOOK_BREAKER_THRESHOLD or probe):
+            return reopens_in(merchant_id)
+
+        # Open (or re-open after a failed probe). Each trip doubles the cool-down;
+        # slow endpoints can only push it further out.
+        trips = redis_client.hincrby(key, "trips", 1)
+        cooldown = min(max(
+            WEBHOOK_BREAKER_COOLDOWN * 2 ** (trips - 1),
+            smoothed * WEBHOOK_BREAKER_LATENCY_FACTOR
+        ), WEBHOOK_BREAKER_MAX_COOLDOWN)
+        pipe = redis_client.pipeline()
+        pipe.hset(key, mapping={
+            "failures": max(failures, WEBHOOK_BREAKER_THRESHOLD),
+            "open_until": time.time() + cooldown,
+        })
+        pipe.expire(key, int(WEBHOOK_BREAKER_MAX_COOLDOWN * 2))
+        pipe.delete(_probe_key(merchant_id))
+        pipe.execute()
+        return cooldown
+    except redis.RedisError:
+        return 0.0
+
+def retry_after_seconds(response) -> float:
+    """
+    Parses a Retry-After header (delta-seconds or HTTP date); None when absent or
+    malformed. The value is merchant-controlled, so it is capped at
+    WEBHOOK_BREAKER_MAX_COOLDOWN.
+    """
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError, OverflowError):
+            return None
+    if not math.isfinite(seconds):
+        return None
+    return min(max(seconds, 0.0), WEBHOOK_BREAKER_MAX_COOLDOWN)
@@ -1,30 +1,163 @@
+import os
+from datetime import datetime
+import redis
+from sqlalchemy import func, literal_column
 from sqlalchemy.orm import Session
 from . import models
+from .redis_client import redis_client, async_redis_client
 
-def get_merchant_stats(db: Session, merchant_id: str):
-    """
-    Calculates real-time data for the dashboard stats-container.
-    """
-    # Fetch all payments for the specific merchant
-    payments = db.query(models.Payment).filter(models.Payment.merchant_id == merchant_id).all()
-    
-    total_transactions = len(payments)
-    
-    # Calculate total-amount from the sum of all successful payment amounts
-    successful_payments = [p for p in payments if p.status == "success"]
-    total_amount = sum(p.amount for p in successful_payments)
-    
+# Incremental per-merchant rollup in Redis. Counts match the SQL path: every payment
+# counts towards total_transactions from creation (pending included), settled
+# successes towards successful/total_amount.
+STATS_ROLLUP_ENABLED = os.getenv("STATS_ROLLUP_ENABLED", "false").lower() == "true"
+# The hash is re-seeded from Postgres once it expires, so an update that raced the
+# seed (or was lost with Redis) is off for at most this long
+STATS_ROLLUP_TTL = int(os.getenv("STATS_ROLLUP_TTL", 3600))
+STATS_BUCKETS = {"hour", "day"}
+
+# Only bump counters once the hash has been seeded from Postgres, otherwise
+# a merchant's pre-existing history would be missing from the rollup.
+INCR_IF_SEEDED = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    for i = 1, #ARGV, 2 do
+        redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+"""
+_incr_if_seeded = redis_client.register_script(INCR_IF_SEEDED)
+_async_incr_if_seeded = async_redis_client.register_script(INCR_IF_SEEDED)
+
+# Seeds only if no other request has (HSETNX semantics for the whole hash), so a
+# concurrent seed cannot overwrite counters that were already bumped
+_seed_if_missing = redis_client.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], 'total_transactions', ARGV[2], 'successful', ARGV[3], 'total_amount', ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return redis.call('HMGET', KEYS[1], 'total_transactions', 'successful', 'total_amount')
+""")
+
+def _stats_key(merchant_id) -> str:
+    return f"merchant_stats:{merchant_id}"
+
+def _format_stats(total_transactions: int, successful: int, total_amount: int) -> dict:
     # Calculate success-rate as (successful payments / total payments) × 100
     success_rate = 0
     if total_transactions > 0:
-        success_rate = (len(successful_payments) / total_transactions) * 100
-        
+        success_rate = (successful / total_transactions) * 100
+
     return {
         "total_transactions": total_transactions,
         "total_amount": total_amount,
         "success_rate": round(success_rate, 2)
     }
 
+def _aggregate_columns():
+    is_success = models.Payment.status == "success"
+    return (
+        func.count(models.Payment.id),
+        func.count(models.Payment.id).filter(is_success),
+        func.coalesce(func.sum(models.Payment.amount).filter(is_success), 0),
+    )
+
+def get_merchant_stats(db: Session, merchant_id: str, use_rollup: bool = STATS_ROLLUP_ENABLED):
+    """
+    Calculates real-time data for the dashboard stats-container.
+    Reads the Redis rollup when enabled, otherwise runs a single aggregate query.
+    """
+    if use_rollup:
+        rollup = get_rollup_stats(merchant_id)
+        if rollup is None:
+            rollup = seed_rollup_stats(db, merchant_id)
+        if rollup is not None:
+            return rollup
+
+    total, successful, amount = db.query(*_aggregate_columns()).filter(
+        models.Payment.merchant_id == merchant_id
+    ).one()
+    return _format_stats(total, successful, amount)
+
+def get_merchant_stats_timeseries(db: Session, merchant_id: str, bucket: str = "day", since: datetime = None):
+    """
+    Same figures as get_merchant_stats, grouped into hourly or daily buckets for charts.
+    """
+    if bucket not in STATS_BUCKETS:
+        raise ValueError(f"Unsupported bucket: {bucket}")
+
+    # Inline the (validated) unit so SELECT and GROUP BY render the identical expression
+    bucket_col = func.date_trunc(literal_column(f"'{bucket}'"), models.Payment.created_at).label("bucket")
+    query = db.query(bucket_col, *_aggregate_columns()).filter(
+        models.Payment.merchant_id == merchant_id
+    )
+    if since:
+        query = query.filter(models.Payment.created_at >= since)
+
+    rows = query.group_by(bucket_col).order_by(bucket_col).all()
+    return [
+        {"bucket": row[0].isoformat() + "Z", **_format_stats(row[1], row[2], row[3])}
+        for row in rows
+    ]
+
+def get_rollup_stats(merchant_id: str):
+    """O(1) stats from the Redis rollup. Returns None if there is nothing to read."""
+    try:
+        counters = redis_client.hgetall(_stats_key(merchant_id))
+    except redis.RedisError:
+        return None
+    if not counters:
+        return None
+    return _format_stats(
+        int(counters.get("total_transactions", 0)),
+        int(counters.get("successful", 0)),
+        int(counters.get("total_amount", 0)),
+    )
+
+def seed_rollup_stats(db: Session, merchant_id: str):
+    """Initialises the rollup from Postgres, unless another request got there first."""
+    total, successful, amount = db.query(*_aggregate_columns()).filter(
+        models.Payment.merchant_id == merchant_id
+    ).one()
+    try:
+        counters = _seed_if_missing(
+            keys=[_stats_key(merchant_id)], args=[STATS_ROLLUP_TTL, total, successful, amount]
+        )
+    except redis.RedisError:
+        return None
+    return _format_stats(*(int(value or 0) for value in counters))
+
+def _rollup_args(deltas: dict) -> list:
+    args = []
+    for field, delta in deltas.items():
+        args += [field, delta]
+    return args
+
+def _bump_rollup(merchant_id: str, **deltas):
+    if not STATS_ROLLUP_ENABLED:
+        return
+    try:
+        _incr_if_seeded(keys=[_stats_key(merchant_id)], args=_rollup_args(deltas))
+    except redis.RedisError as e:
+        print(f"Stats rollup update failed for merchant {merchant_id}: {e}")
+
+async def record_payments_created(merchant_id: str, count: int = 1):
+    """Called by the API after committing new (pending) payments."""
+    if not STATS_ROLLUP_ENABLED:
+        return
+    try:
+        await _async_incr_if_seeded(keys=[_stats_key(merchant_id)], args=_rollup_args({"total_transactions": count}))
+    except redis.RedisError as e:
+        print(f"Stats rollup update failed for merchant {merchant_id}: {e}")
+
+def record_payment_outcome(merchant_id: str, amount: int, success: bool):
+    """Called by complete_payment_job once a payment reaches success/failed."""
+    # Already counted in total_transactions at creation; failures change nothing else
+    if success:
+        _bump_rollup(merchant_id, successful=1, total_amount=amount)
+
+def record_payment_refunded(merchant_id: str, amount: int):
+    """Called by complete_refund_job when a payment moves from success to refunded."""
+    _bump_rollup(merchant_id, successful=-1, total_amount=-amount)
+
 def get_all_merchant_payments(db: Session, merchant_id: str):
     """
     Fetches all payments for the transactions-table on the dashboard.
@@ -40,4 +173,4 @@ def get_merchant_by_api_keys(db: Session, api_key: str, api_secret: str):
     return db.query(models.Merchant).filter(
         models.Merchant.api_key == api_key,
         models.Merchant.api_secret == api_secret
-    ).first()
\ No newline at end of file
+    ).first()
@@ -1,9 +1,14 @@
 import os
 import time
-from sqlalchemy import create_engine
+import uuid
+import threading
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
+from .metrics import instrument_engine, instrument_pool
 
 # 1. Fetch URL from environment
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
@@ -12,28 +17,202 @@ SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 if SQLALCHEMY_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
     SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-# 3. Connection Resilience
-engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
+# 3. Pool sizing. Each process (uvicorn worker, Celery child) gets its own pool, so
+# size it per process: processes x (DB_POOL_SIZE + DB_MAX_OVERFLOW) must stay
+# below Postgres max_connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+# Connections are replaced before server/firewall idle timeouts can cut them
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# Pre-ping costs a round trip on every checkout; recycling plus SQLAlchemy's
+# invalidate-the-pool-on-disconnect covers the common cases without it
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+# Behind PgBouncer in transaction mode: no client-side pool and no server-side
+# prepared statements (a later transaction may land on another backend)
+PGBOUNCER_MODE = os.getenv("PGBOUNCER_MODE", "false").lower() == "true"
 
-# Loop to wait for the external network to stabilize
-for i in range(12): 
-    try:
-        with engine.connect() as connection:
-            print("Successfully connected to the database!")
-            break
-    except OperationalError as e:
-        if i == 11:
-            print("Final database connection attempt failed.")
-            raise e
-        print(f"Database connection attempt {i+1}/12 failed. Retrying in 5s...")
-        time.sleep(5)
+def engine_options(url: str, is_async: bool = False) -> dict:
+    if url.startswith("sqlite"):
+        return {}
+    if PGBOUNCER_MODE:
+        options = {"poolclass": NullPool}
+        if is_async:
+            # asyncpg prepares every statement; disable its caches and use unique names
+            options["connect_args"] = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+            }
+        return options
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+
+instrument_engine(engine)
+instrument_pool(engine, "sync")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# 4. Async engine for the API handlers (Celery tasks keep using SessionLocal)
+def to_async_url(url: str) -> str:
+    """Maps a sync driver URL onto its asyncio driver (asyncpg / aiosqlite)."""
+    if url.startswith("postgresql+psycopg2://"):
+        return url.replace("postgresql+psycopg2://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(SQLALCHEMY_DATABASE_URL)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, is_async=True))
+# expire_on_commit=False: attribute access after commit must not trigger implicit IO
+instrument_engine(async_engine.sync_engine)
+instrument_pool(async_engine.sync_engine, "async")
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# 5. Optional read replica for dashboard reads (lists, stats). Writes and the
+# request/worker payment path always use the primary. A replica lagging more than
+# READ_REPLICA_MAX_LAG seconds (or unreachable) is bypassed until it catches up.
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+if READ_DATABASE_URL and READ_DATABASE_URL.startswith("postgres://"):
+    READ_DATABASE_URL = READ_DATABASE_URL.replace("postgres://", "postgresql://", 1)
+READ_REPLICA_MAX_LAG = float(os.getenv("READ_REPLICA_MAX_LAG", 5))
+READ_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("READ_REPLICA_LAG_CHECK_INTERVAL", 1))
+# A blackholed replica must fail fast instead of holding a request for the OS TCP timeout
+READ_REPLICA_CONNECT_TIMEOUT = int(os.getenv("READ_REPLICA_CONNECT_TIMEOUT", 2))
+
+def read_engine_options(url: str, is_async: bool = False) -> dict:
+    options = engine_options(url, is_async)
+    if url.startswith("postgresql"):
+        # psycopg2 takes connect_timeout, asyncpg takes timeout
+        timeout = {"timeout": READ_REPLICA_CONNECT_TIMEOUT} if is_async else {"connect_timeout": READ_REPLICA_CONNECT_TIMEOUT}
+        options["connect_args"] = {**options.get("connect_args", {}), **timeout}
+    return options
+
+if READ_DATABASE_URL:
+    read_engine = create_engine(READ_DATABASE_URL, **read_engine_options(READ_DATABASE_URL))
+    instrument_engine(read_engine)
+    instrument_pool(read_engine, "read")
+    ASYNC_READ_DATABASE_URL = os.getenv("ASYNC_READ_DATABASE_URL") or to_async_url(READ_DATABASE_URL)
+    async_read_engine = create_async_engine(ASYNC_READ_DATABASE_URL, **read_engine_options(ASYNC_READ_DATABASE_URL, is_async=True))
+    instrument_engine(async_read_engine.sync_engine)
+    instrument_pool(async_read_engine.sync_engine, "async_read")
+else:
+    read_engine, async_read_engine = engine, async_engine
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Zero when the replica has replayed everything it received (an idle primary
+# produces no new transactions, so the replay timestamp alone would look stale)
+REPLICA_LAG_SQL = text(
+    "SELECT COALESCE(CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END, 0)"
+)
+_replica_state = {"checked_at": float("-inf"), "fresh": False}
+_replica_check_lock = threading.Lock()
+
+def _record_replica_lag(lag) -> bool:
+    fresh = lag is not None and lag <= READ_REPLICA_MAX_LAG
+    _replica_state.update(checked_at=time.monotonic(), fresh=fresh)
+    if not fresh:
+        print(f"Read replica bypassed (lag: {lag})")
+    return fresh
+
+def _claim_replica_check() -> bool:
+    """
+    True for the one caller that should probe now. The interval is stamped before
+    probing, so requests arriving meanwhile keep using the last verdict instead of
+    each opening their own connection.
+    """
+    with _replica_check_lock:
+        now = time.monotonic()
+        if now - _replica_state["checked_at"] < READ_REPLICA_LAG_CHECK_INTERVAL:
+            return False
+        _replica_state["checked_at"] = now
+        return True
+
+def replica_is_fresh() -> bool:
+    if read_engine is engine:
+        return False
+    if not _claim_replica_check():
+        return _replica_state["fresh"]
+    try:
+        with read_engine.connect() as connection:
+            lag = float(connection.execute(REPLICA_LAG_SQL).scalar()) if connection.dialect.name == "postgresql" else 0.0
+    except Exception:
+        lag = None
+    return _record_replica_lag(lag)
+
+async def async_replica_is_fresh() -> bool:
+    if async_read_engine is async_engine:
+        return False
+    if not _claim_replica_check():
+        return _replica_state["fresh"]
+    try:
+        async with async_read_engine.connect() as connection:
+            lag = float((await connection.execute(REPLICA_LAG_SQL)).scalar()) if connection.dialect.name == "postgresql" else 0.0
+    except Exception:
+        lag = None
+    return _record_replica_lag(lag)
+
+# Engines connect lazily on first use, so importing this module never touches the
+# network. Code that must have a database up front (app.bootstrap) waits explicitly.
+def wait_for_database(attempts: int = 12, delay: float = 5):
+    for i in range(attempts):
+        try:
+            with engine.connect():
+                print("Successfully connected to the database!")
+                return
+        except OperationalError as e:
+            if i == attempts - 1:
+                print("Final database connection attempt failed.")
+                raise e
+            print(f"Database connection attempt {i+1}/{attempts} failed. Retrying in {delay}s...")
+            time.sleep(delay)
+
+def dispose_after_fork():
+    """
+    Run in each forked child (Celery worker_process_init). Drops the pooled
+    connections inherited from the parent without closing them, since they
+    are still owned by the parent process.
+    """
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    if read_engine is not engine:
+        read_engine.dispose(close=False)
+        async_read_engine.sync_engine.dispose(close=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Read-only endpoints: the replica when it is within the staleness tolerance, else the primary
+def get_read_db():
+    db = ReadSessionLocal() if replica_is_fresh() else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db():
+    session_factory = AsyncReadSessionLocal if await async_replica_is_fresh() else AsyncSessionLocal
+    async with session_factory() as db:
+        yield db
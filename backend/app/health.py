@@ -0,0 +1,30 @@
+import os
+import asyncio
+import sqlalchemy
+import redis
+from .database import async_engine
+from .redis_client import async_redis_client
+
+# Dependency checks for the readiness probe. Liveness never calls these: a slow
+# database should take an instance out of rotation, not get it restarted.
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 2))
+
+async def check_database() -> bool:
+    async def ping():
+        async with async_engine.connect() as connection:
+            await connection.execute(sqlalchemy.text("SELECT 1"))
+    try:
+        await asyncio.wait_for(ping(), timeout=HEALTH_CHECK_TIMEOUT)
+        return True
+    except Exception:
+        return False
+
+async def check_redis() -> bool:
+    try:
+        return bool(await asyncio.wait_for(async_redis_client.ping(), timeout=HEALTH_CHECK_TIMEOUT))
+    except (redis.RedisError, asyncio.TimeoutError):
+        return False
+
+async def check_dependencies() -> dict:
+    database_ok, redis_ok = await asyncio.gather(check_database(), check_redis())
+    return {"database": database_ok, "redis": redis_ok}
@@ -0,0 +1,97 @@
+import os
+import json
+import asyncio
+import hmac
+import hashlib
+import redis
+from .redis_client import async_redis_client
+
+# Redis fast path for Idempotency-Key handling. Postgres (idempotency_keys)
+# stays the durable record; every helper here degrades to "no answer" if
+# Redis is unavailable so callers fall back to the database.
+IDEMPOTENCY_TTL = 24 * 60 * 60
+LOCK_TTL = 30
+WAIT_TIMEOUT = 10.0
+WAIT_INTERVAL = 0.05
+
+# Keys the fingerprint HMAC so stored fingerprints cannot be matched against guesses
+IDEMPOTENCY_FINGERPRINT_KEY = os.getenv("IDEMPOTENCY_FINGERPRINT_KEY", "")
+
+def _without_card_secrets(body: dict) -> dict:
+    """Card number and CVV never reach the fingerprint, which is kept for 24h."""
+    card = body.get("card")
+    if not isinstance(card, dict):
+        return body
+    number = str(card.get("number") or "")
+    return {**body, "card": {
+        "last4": number[-4:],
+        "expiry_month": card.get("expiry_month"),
+        "expiry_year": card.get("expiry_year"),
+        "holder_name": card.get("holder_name"),
+    }}
+
+def fingerprint(body: dict) -> str:
+    """Stable keyed hash of a request body, used to reject key reuse with a different payload."""
+    canonical = json.dumps(_without_card_secrets(body), sort_keys=True, separators=(',', ':'), default=str)
+    return hmac.new(IDEMPOTENCY_FINGERPRINT_KEY.encode(), canonical.encode(), hashlib.sha256).hexdigest()
+
+def _result_key(merchant_id, key: str) -> str:
+    return f"idempotency:{merchant_id}:{key}"
+
+def _lock_key(merchant_id, key: str) -> str:
+    return f"idempotency_lock:{merchant_id}:{key}"
+
+async def get_result(merchant_id, key: str):
+    """Returns (fingerprint, response) for a completed request, or None."""
+    try:
+        raw = await async_redis_client.get(_result_key(merchant_id, key))
+    except redis.RedisError:
+        return None
+    if raw is None:
+        return None
+    stored = json.loads(raw)
+    return stored["fingerprint"], stored["response"]
+
+async def store_result(merchant_id, key: str, request_fingerprint: str, response: dict, ttl: int = IDEMPOTENCY_TTL):
+    try:
+        await async_redis_client.set(
+            _result_key(merchant_id, key),
+            json.dumps({"fingerprint": request_fingerprint, "response": response}),
+            ex=max(int(ttl), 1)
+        )
+    except redis.RedisError:
+        pass
+
+async def acquire_lock(merchant_id, key: str) -> bool:
+    """
+    Marks a key as in flight. Returns False if another request already holds it.
+    If Redis is down the lock is reported as acquired; the idempotency_keys
+    primary key still prevents duplicate inserts (with IDEMPOTENCY_PARTITIONED,
+    the advisory lock in routers/payments.py does instead).
+    """
+    try:
+        return bool(await async_redis_client.set(_lock_key(merchant_id, key), "1", nx=True, ex=LOCK_TTL))
+    except redis.RedisError:
+        return True
+
+async def release_lock(merchant_id, key: str):
+    try:
+        await async_redis_client.delete(_lock_key(merchant_id, key))
+    except redis.RedisError:
+        pass
+
+async def wait_for_result(merchant_id, key: str, timeout: float = WAIT_TIMEOUT):
+    """Polls for the outcome of an in-flight duplicate. Returns None on timeout or if the lock is dropped without a result."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        await asyncio.sleep(WAIT_INTERVAL)
+        result = await get_result(merchant_id, key)
+        if result is not None:
+            return result
+        try:
+            if not await async_redis_client.exists(_lock_key(merchant_id, key)):
+                return None
+        except redis.RedisError:
+            return None
+    return None
@@ -0,0 +1,82 @@
+import os
+import time
+from redis.exceptions import RedisError
+from .redis_client import redis_client, async_redis_client
+
+# Job counters kept in one Redis hash and updated from Celery signals, so the
+# status endpoint is a single HGETALL instead of a broadcast to every worker.
+#   pending    - published, not yet started (countdown/ETA tasks included)
+#   processing - currently running
+#   completed / failed - cumulative since the counters were last reset
+# Tasks on the maintenance queue (beat housekeeping) are not counted.
+JOB_STATUS_KEY = "jobs:status"
+# Refreshed by worker start-up and every task run; beat ticks keep it fresh while idle
+WORKER_HEARTBEAT_KEY = "jobs:worker_heartbeat"
+WORKER_HEARTBEAT_TTL = int(os.getenv("WORKER_HEARTBEAT_TTL", 30))
+
+FIELDS = ("pending", "processing", "completed", "failed")
+
+def _bump(*changes, heartbeat: bool = False):
+    """changes: (field, amount) pairs applied in one round trip. Never raises."""
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for field, amount in changes:
+            pipe.hincrby(JOB_STATUS_KEY, field, amount)
+        if heartbeat:
+            pipe.set(WORKER_HEARTBEAT_KEY, int(time.time()), ex=WORKER_HEARTBEAT_TTL)
+        pipe.execute()
+    except RedisError as e:
+        print(f"Job status counters unavailable: {e}")
+
+def track_job_status(celery_app):
+    from celery import signals
+
+    routes = celery_app.conf.task_routes or {}
+
+    def counted(sender) -> bool:
+        # Beat-driven housekeeping (outbox relay, retry dispatch, sweeper) runs every
+        # few seconds and is not work anyone waits on; it only keeps the heartbeat fresh
+        name = getattr(sender, "name", sender)
+        return routes.get(name, {}).get("queue") != "maintenance"
+
+    @signals.before_task_publish.connect(weak=False)
+    def _published(sender=None, **kwargs):
+        if counted(sender):
+            _bump(("pending", 1))
+
+    @signals.task_prerun.connect(weak=False)
+    def _started(sender=None, **kwargs):
+        _bump(*([("pending", -1), ("processing", 1)] if counted(sender) else []), heartbeat=True)
+
+    @signals.task_success.connect(weak=False)
+    def _succeeded(sender=None, **kwargs):
+        _bump(*([("processing", -1), ("completed", 1)] if counted(sender) else []), heartbeat=True)
+
+    @signals.task_failure.connect(weak=False)
+    def _failed(sender=None, **kwargs):
+        _bump(*([("processing", -1), ("failed", 1)] if counted(sender) else []), heartbeat=True)
+
+    @signals.task_retry.connect(weak=False)
+    def _retried(sender=None, **kwargs):
+        # The retry was re-published (pending +1); this run is simply over
+        _bump(*([("processing", -1)] if counted(sender) else []), heartbeat=True)
+
+    @signals.worker_ready.connect(weak=False)
+    def _ready(**kwargs):
+        _bump(heartbeat=True)
+
+def format_job_status(counts: dict, heartbeat) -> dict:
+    # Counters can dip below zero if the broker was flushed mid-flight
+    status = {field: max(int(counts.get(field, 0)), 0) for field in FIELDS}
+    status["worker_status"] = "running" if heartbeat else "stopped"
+    return status
+
+async def read_job_status() -> dict:
+    try:
+        pipe = async_redis_client.pipeline(transaction=False)
+        pipe.hgetall(JOB_STATUS_KEY)
+        pipe.get(WORKER_HEARTBEAT_KEY)
+        counts, heartbeat = await pipe.execute()
+    except RedisError:
+        counts, heartbeat = {}, None
+    return format_job_status(counts, heartbeat)
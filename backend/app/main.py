@@ -1,15 +1,21 @@
-from fastapi import FastAPI, Depends, HTTPException
+import os
+import time
+import asyncio
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, HttpUrl, Field
+from typing import Optional
 
 from celery.result import AsyncResult
 from .tasks import celery_app
-from . import auth
+from . import auth, metrics
+from .job_status import read_job_status
 
-from .database import engine, Base, SessionLocal, get_db
+from .database import get_db
 from .models import Merchant
+from . import bootstrap, health
 from .routers import orders, payments 
 import sqlalchemy
 
@@ -21,44 +27,63 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Full templates of included routes, keyed by route object: scope["route"] is the
+# router's own route, whose path does not carry the include prefix
+_route_labels = {}
+
+def include_router(router, prefix: str, **options):
+    app.include_router(router, prefix=prefix, **options)
+    for route in router.routes:
+        _route_labels[id(route)] = prefix + route.path
+
+def route_label(request: Request) -> str:
+    """Route template (/api/v1/payments/{payment_id}/capture) so IDs don't explode label cardinality."""
+    route = request.scope.get("route")
+    if route is None:
+        return "unmatched"
+    return _route_labels.get(id(route)) or route.path or "unmatched"
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_REQUEST_LATENCY.labels(
+            method=request.method,
+            route=route_label(request),
+            status=str(status),
+        ).observe(time.perf_counter() - started)
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
+
 class WebhookUpdate(BaseModel):
     webhook_url: HttpUrl
+    webhook_batch_enabled: Optional[bool] = None
+    webhook_batch_window: Optional[int] = Field(None, ge=1, le=300)
+    webhook_batch_max_events: Optional[int] = Field(None, ge=1, le=1000)
+
+# Schema and seed data normally come from a one-off `python -m app.bootstrap`;
+# per-process bootstrapping is kept for single-process setups
+BOOTSTRAP_ON_STARTUP = os.getenv("DB_BOOTSTRAP_ON_STARTUP", "true").lower() == "true"
 
 @app.on_event("startup")
 def startup_event():
-    Base.metadata.create_all(bind=engine)
-    seed_test_merchant()
+    if BOOTSTRAP_ON_STARTUP:
+        bootstrap.bootstrap()
 
-def seed_test_merchant():
-    db = SessionLocal()
-    try:
-        test_id = "550e8400-e29b-41d4-a716-446655440000"
-        test_email = "test@example.com"
-        
-        exists = db.query(Merchant).filter(Merchant.email == test_email).first()
-        
-        if not exists:
-            test_merchant = Merchant(
-                id=test_id,
-                name="Test Merchant",
-                email=test_email,
-                api_key="key_test_abc123",
-                api_secret="secret_test_xyz789",
-                webhook_url="http://host.docker.internal:3002/api/webhooks",
-                webhook_secret="whsec_test_abc123"
-            )
-            db.add(test_merchant)
-            db.commit()
-    except Exception as e:
-        db.rollback()
-    finally:
-        db.close()
-
-app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
-app.include_router(orders.router, prefix="/api/v1/orders", tags=["Orders"])
-app.include_router(payments.router, prefix="/api/v1/payments", tags=["Payments"])
+include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
+include_router(orders.router, prefix="/api/v1/orders", tags=["Orders"])
+include_router(payments.router, prefix="/api/v1/payments", tags=["Payments"])
 
 
 @app.patch("/api/v1/test/merchant")
@@ -68,28 +93,42 @@ def update_merchant_webhook(payload: WebhookUpdate, db: Session = Depends(get_db
         raise HTTPException(status_code=404, detail="Merchant not found")
     
     merchant.webhook_url = str(payload.webhook_url)
+    for field in ("webhook_batch_enabled", "webhook_batch_window", "webhook_batch_max_events"):
+        value = getattr(payload, field)
+        if value is not None:
+            setattr(merchant, field, value)
     db.commit()
-    return {"status": "success", "webhook_url": merchant.webhook_url}
+    auth.invalidate_merchant(merchant.api_key)
+    return {
+        "status": "success",
+        "webhook_url": merchant.webhook_url,
+        "webhook_batch_enabled": bool(merchant.webhook_batch_enabled)
+    }
 
 @app.get("/health")
-def health_check():
-    db_status = "disconnected"
-    try:
-        db = SessionLocal()
-        db.execute(sqlalchemy.text("SELECT 1"))
-        db_status = "connected"
-        db.close()
-    except Exception:
-        db_status = "disconnected"
-
+async def health_check():
+    checks, jobs = await asyncio.gather(health.check_dependencies(), read_job_status())
     return {
         "status": "healthy",
-        "database": db_status,
-        "redis": "connected", 
-        "worker": "running",   
+        "database": "connected" if checks["database"] else "disconnected",
+        "redis": "connected" if checks["redis"] else "disconnected",
+        "worker": jobs["worker_status"],
         "timestamp": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
     }
 
+@app.get("/health/live")
+async def liveness():
+    # No I/O: only proves the event loop is serving requests
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness(response: Response):
+    checks = await health.check_dependencies()
+    ready = all(checks.values())
+    if not ready:
+        response.status_code = 503
+    return {"status": "ready" if ready else "not_ready", **checks}
+
 @app.get("/api/v1/test/merchant")
 def get_test_merchant(db: Session = Depends(get_db)):
     merchant = db.query(Merchant).filter(Merchant.email == "test@example.com").first()
@@ -108,18 +147,5 @@ def get_test_merchant(db: Session = Depends(get_db)):
     
 @app.get("/api/v1/test/jobs/status")
 async def get_job_status():
-    inspector = celery_app.control.inspect()
-    
-    active = inspector.active() or {}
-    reserved = inspector.reserved() or {}
-    
-    processing_count = sum(len(tasks) for tasks in active.values())
-    pending_count = sum(len(tasks) for tasks in reserved.values())
-    
-    return {
-        "pending": pending_count,
-        "processing": processing_count,
-        "completed": 0,
-        "failed": 0,
-        "worker_status": "running" if active else "stopped"
-    }
\ No newline at end of file
+    # O(1) read of the signal-maintained counters; polled by the docker healthcheck
+    return await read_job_status()
@@ -0,0 +1,111 @@
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import text, tuple_
+from sqlalchemy.orm import Session
+from . import models
+
+# Housekeeping for the idempotency_keys table.
+IDEMPOTENCY_SWEEP_BATCH_SIZE = int(os.getenv("IDEMPOTENCY_SWEEP_BATCH_SIZE", 1000))
+IDEMPOTENCY_SWEEP_MAX_BATCHES = int(os.getenv("IDEMPOTENCY_SWEEP_MAX_BATCHES", 50))
+# Days of future partitions kept ahead of expires_at (keys live for 24h)
+IDEMPOTENCY_PARTITION_DAYS_AHEAD = int(os.getenv("IDEMPOTENCY_PARTITION_DAYS_AHEAD", 3))
+
+def sweep_expired_idempotency_keys(db: Session, now: datetime = None,
+                                   batch_size: int = IDEMPOTENCY_SWEEP_BATCH_SIZE,
+                                   max_batches: int = IDEMPOTENCY_SWEEP_MAX_BATCHES) -> dict:
+    """
+    Deletes expired keys in bounded batches (each its own short transaction),
+    walking idx_idempotency_keys_expires_at. Returns purge statistics.
+    """
+    now = now or datetime.utcnow()
+    started = time.monotonic()
+    purged = 0
+    for _ in range(max_batches):
+        expired = db.query(models.IdempotencyKey.key, models.IdempotencyKey.merchant_id).filter(
+            models.IdempotencyKey.expires_at < now
+        ).order_by(models.IdempotencyKey.expires_at).limit(batch_size).all()
+        if not expired:
+            break
+
+        db.query(models.IdempotencyKey).filter(
+            tuple_(models.IdempotencyKey.key, models.IdempotencyKey.merchant_id).in_(
+                [(row.key, row.merchant_id) for row in expired]
+            ),
+            models.IdempotencyKey.expires_at < now
+        ).delete(synchronize_session=False)
+        db.commit()
+        purged += len(expired)
+        if len(expired) < batch_size:
+            break
+
+    elapsed = time.monotonic() - started
+    return {
+        "purged": purged,
+        "seconds": round(elapsed, 3),
+        "purged_per_second": round(purged / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+def idempotency_table_size(db: Session) -> dict:
+    """Table and index footprint in bytes (Postgres only), for tracking bloat."""
+    row = db.execute(text(
+        "SELECT pg_table_size('idempotency_keys'), pg_indexes_size('idempotency_keys')"
+    )).one()
+    return {"table_bytes": row[0], "index_bytes": row[1]}
+
+# --- Optional range partitioning on expires_at (IDEMPOTENCY_PARTITIONED=true) ---
+# One partition per day of expiry: once a day has passed every row in it is
+# expired, so the whole partition is dropped instead of deleted row by row.
+
+def _partition_name(day: datetime) -> str:
+    return f"idempotency_keys_p{day:%Y%m%d}"
+
+def _create_day_partition(db: Session, day: datetime):
+    name = _partition_name(day)
+    if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return
+    # Rows for this day that already landed in the default partition (e.g. beat was
+    # down for longer than days_ahead) would make CREATE ... FOR VALUES fail, so they
+    # are moved into the new partition in the same transaction
+    bounds = {"lo": day, "hi": day + timedelta(days=1)}
+    db.execute(text("CREATE TEMP TABLE IF NOT EXISTS idempotency_keys_moving (LIKE idempotency_keys) ON COMMIT DROP"))
+    db.execute(text(
+        "INSERT INTO idempotency_keys_moving SELECT * FROM idempotency_keys_default "
+        "WHERE expires_at >= :lo AND expires_at < :hi"
+    ), bounds)
+    db.execute(text("DELETE FROM idempotency_keys_default WHERE expires_at >= :lo AND expires_at < :hi"), bounds)
+    db.execute(text(
+        f"CREATE TABLE {name} PARTITION OF idempotency_keys "
+        f"FOR VALUES FROM ('{day:%Y-%m-%d}') TO ('{day + timedelta(days=1):%Y-%m-%d}')"
+    ))
+    db.execute(text("INSERT INTO idempotency_keys SELECT * FROM idempotency_keys_moving"))
+    db.execute(text("TRUNCATE idempotency_keys_moving"))
+
+def ensure_idempotency_partitions(db: Session, now: datetime = None, days_ahead: int = IDEMPOTENCY_PARTITION_DAYS_AHEAD):
+    today = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    # Catch-all so inserts never fail if the sweeper falls behind
+    db.execute(text("CREATE TABLE IF NOT EXISTS idempotency_keys_default PARTITION OF idempotency_keys DEFAULT"))
+    for offset in range(days_ahead + 1):
+        _create_day_partition(db, today + timedelta(days=offset))
+    db.commit()
+
+def drop_expired_idempotency_partitions(db: Session, now: datetime = None) -> list:
+    """Drops daily partitions whose whole range is in the past. Returns their names."""
+    today = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    children = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'idempotency_keys'"
+    )).scalars().all()
+
+    dropped = []
+    for name in children:
+        if not name.startswith("idempotency_keys_p"):
+            continue
+        day = datetime.strptime(name[len("idempotency_keys_p"):], "%Y%m%d")
+        if day + timedelta(days=1) <= today:
+            db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped.append(name)
+    db.commit()
+    return dropped
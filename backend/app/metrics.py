@@ -0,0 +1,156 @@
+import os
+import time
+from datetime import datetime
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, REGISTRY,
+    generate_latest, start_http_server, CONTENT_TYPE_LATEST,
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+
+# Prometheus metrics for the API and the Celery workers.
+# With several uvicorn workers or prefork children, set PROMETHEUS_MULTIPROC_DIR
+# (an empty, writable directory) before start-up so every process writes its
+# samples there and a scrape aggregates them.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+HTTP_REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "API request latency",
+    ["method", "route", "status"],
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "SQL statement latency",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+# Pool saturation: checked_out approaching capacity means requests queue for a connection
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool",
+    ["engine"], multiprocess_mode="livesum",
+)
+DB_POOL_CAPACITY = Gauge(
+    "db_pool_capacity", "pool_size + max_overflow (0 when the pool is disabled)",
+    ["engine"], multiprocess_mode="livesum",
+)
+TASK_DURATION = Histogram(
+    "celery_task_duration_seconds", "Celery task run time",
+    ["task"],
+)
+TASK_QUEUE_WAIT = Histogram(
+    "celery_task_queue_wait_seconds", "Time between a task becoming due and a worker starting it",
+    ["task"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+TASK_RETRIES = Counter("celery_task_retries_total", "Celery task retries", ["task"])
+TASK_FAILURES = Counter("celery_task_failures_total", "Celery task failures", ["task"])
+WEBHOOK_RESPONSES = Counter(
+    "webhook_responses_total", "Webhook delivery outcomes by HTTP status ('error' when no response)",
+    ["code"],
+)
+
+def render_latest():
+    """Returns (body, content type) for a scrape, aggregating across processes when configured."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+def observe_webhook_response(response):
+    WEBHOOK_RESPONSES.labels(code=str(response.status_code) if response is not None else "error").inc()
+
+# --- SQLAlchemy ---
+def instrument_engine(engine):
+    """Times every statement on a sync Engine (pass async_engine.sync_engine for async)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_LATENCY.labels(operation=operation).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # after_cursor_execute never runs for a failed statement; drop its start time
+        # so the next statement on this connection does not pop the stale one
+        connection = context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+
+def instrument_pool(engine, name: str):
+    pool = engine.pool
+    # Only QueuePool (and its async variant) has a fixed capacity
+    size = pool.size() if callable(getattr(pool, "size", None)) else 0
+    overflow = max(getattr(pool, "_max_overflow", 0), 0)
+    DB_POOL_CAPACITY.labels(engine=name).set(size + overflow)
+    checked_out = DB_POOL_CHECKED_OUT.labels(engine=name)
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        checked_out.dec()
+
+# --- Celery ---
+_task_started = {}
+
+def instrument_celery(celery_app):
+    from celery import signals
+
+    @signals.before_task_publish.connect(weak=False)
+    def _stamp(headers=None, **kwargs):
+        if headers is not None:
+            headers["published_at"] = time.time()
+
+    @signals.task_prerun.connect(weak=False)
+    def _prerun(task_id=None, task=None, **kwargs):
+        now = time.time()
+        _task_started[task_id] = time.perf_counter()
+        published_at = getattr(task.request, "published_at", None)
+        if published_at:
+            # Countdown/ETA tasks only start "waiting" once they are due
+            due_at = max(published_at, _eta_timestamp(task.request.eta) or 0)
+            TASK_QUEUE_WAIT.labels(task=task.name).observe(max(now - due_at, 0))
+
+    @signals.task_postrun.connect(weak=False)
+    def _postrun(task_id=None, task=None, **kwargs):
+        started = _task_started.pop(task_id, None)
+        if started is not None:
+            TASK_DURATION.labels(task=task.name).observe(time.perf_counter() - started)
+
+    @signals.task_retry.connect(weak=False)
+    def _retry(request=None, **kwargs):
+        TASK_RETRIES.labels(task=request.task).inc()
+
+    @signals.task_failure.connect(weak=False)
+    def _failure(sender=None, **kwargs):
+        TASK_FAILURES.labels(task=sender.name).inc()
+
+    @signals.worker_ready.connect(weak=False)
+    def _serve(**kwargs):
+        port = os.getenv("WORKER_METRICS_PORT")
+        if port:
+            if MULTIPROC_DIR:
+                registry = CollectorRegistry()
+                multiprocess.MultiProcessCollector(registry)
+                start_http_server(int(port), registry=registry)
+            else:
+                start_http_server(int(port))
+
+    @signals.worker_process_shutdown.connect(weak=False)
+    def _mark_dead(pid=None, **kwargs):
+        if MULTIPROC_DIR:
+            multiprocess.mark_process_dead(pid or os.getpid())
+
+def _eta_timestamp(eta):
+    if not eta:
+        return None
+    if isinstance(eta, str):
+        eta = datetime.fromisoformat(eta)
+    return eta.timestamp()
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, Text, Index, JSON
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Boolean, ForeignKey, Text, Index, JSON
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
+import os
 import uuid
 from datetime import datetime, timedelta
 from .database import Base
@@ -14,6 +15,10 @@ class Merchant(Base):
     api_secret = Column(String(64), nullable=False)
     webhook_url = Column(String(255), nullable=True)
     webhook_secret = Column(String(64), nullable=True) # Required for signature
+    # Opt-in batch mode: events within the window (or up to N) go out as one array
+    webhook_batch_enabled = Column(Boolean, default=False)
+    webhook_batch_window = Column(Integer, default=5) # seconds
+    webhook_batch_max_events = Column(Integer, default=100)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class Order(Base):
@@ -37,6 +42,9 @@ class Payment(Base):
     method = Column(String(20), nullable=False)
     status = Column(String(20), default="pending") # Task 7.1 requires 'pending' start
     captured = Column(Boolean, default=False) # Required for capture endpoint
+    # Sum of refunds reserved against this payment (pending + processed); maintained
+    # by a conditional UPDATE in create_refund so concurrent refunds cannot over-refund
+    refunded_amount = Column(Integer, nullable=False, default=0, server_default="0")
     error_code = Column(String(50), nullable=True)
     error_description = Column(String(255), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -67,17 +75,38 @@ class WebhookLog(Base):
     response_body = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+# Range-partition idempotency_keys by expires_at (see maintenance.py).
+# Postgres requires the partition key in the primary key, so (key, merchant_id)
+# alone is no longer unique; create_payment serializes on an advisory lock instead.
+IDEMPOTENCY_PARTITIONED = os.getenv("IDEMPOTENCY_PARTITIONED", "false").lower() == "true"
+
 class IdempotencyKey(Base):
     __tablename__ = "idempotency_keys"
+    __table_args__ = {"postgresql_partition_by": "RANGE (expires_at)"} if IDEMPOTENCY_PARTITIONED else {}
     # Scoped with merchant_id as a composite primary key
     key = Column(String(255), primary_key=True)
     merchant_id = Column(UUID(as_uuid=True), ForeignKey("merchants.id"), primary_key=True)
     response = Column(JSON, nullable=False)
+    fingerprint = Column(String(64), nullable=True) # HMAC-SHA256 of the request body, card secrets excluded
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, default=lambda: datetime.utcnow() + timedelta(hours=24), primary_key=IDEMPOTENCY_PARTITIONED)
+
+class OutboxMessage(Base):
+    """Celery job written in the same transaction as the change that triggers it (see outbox.py)."""
+    __tablename__ = "outbox_messages"
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    task_name = Column(String(100), nullable=False)
+    args = Column(JSON, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
-    expires_at = Column(DateTime, default=lambda: datetime.utcnow() + timedelta(hours=24))
 
 # Required Indexes for Task 7.1
 Index("idx_refunds_payment_id", Refund.payment_id)
+Index("idx_idempotency_keys_expires_at", IdempotencyKey.expires_at)
+# Composite indexes backing keyset pagination of the merchant list endpoints
+Index("idx_orders_merchant_created", Order.merchant_id, Order.created_at.desc(), Order.id.desc())
+Index("idx_payments_merchant_created", Payment.merchant_id, Payment.created_at.desc(), Payment.id.desc())
+Index("idx_refunds_merchant_created", Refund.merchant_id, Refund.created_at.desc(), Refund.id.desc())
+Index("idx_webhook_logs_merchant_created", WebhookLog.merchant_id, WebhookLog.created_at.desc(), WebhookLog.id.desc())
 Index("idx_webhook_logs_merchant_id", WebhookLog.merchant_id)
 Index("idx_webhook_logs_status", WebhookLog.status)
 # Partial index for efficient retry scheduling
@@ -0,0 +1,64 @@
+import os
+import json
+import hashlib
+import redis
+from .redis_client import redis_client
+from .utils.cache import TTLCache
+from . import models
+
+# Read-through cache for the public order view served to every checkout load.
+# Lookups go in-process LRU -> Redis -> Postgres. Unknown ids are cached too
+# (negative entries, shorter TTL) so id enumeration cannot reach the database.
+# The local tier keeps a short TTL because other processes only learn about
+# invalidations through Redis.
+ORDER_CACHE_TTL = int(os.getenv("ORDER_CACHE_TTL", 300))
+ORDER_NEGATIVE_CACHE_TTL = int(os.getenv("ORDER_NEGATIVE_CACHE_TTL", 30))
+ORDER_LOCAL_CACHE_TTL = float(os.getenv("ORDER_LOCAL_CACHE_TTL", 5))
+ORDER_LOCAL_CACHE_SIZE = int(os.getenv("ORDER_LOCAL_CACHE_SIZE", 10000))
+# Browser/nginx freshness for the public view; status is the only field that changes
+ORDER_PUBLIC_MAX_AGE = int(os.getenv("ORDER_PUBLIC_MAX_AGE", 10))
+
+NOT_FOUND = "null" # Cached marker for an unknown id (TTLCache reserves None for misses)
+
+local_cache = TTLCache(maxsize=ORDER_LOCAL_CACHE_SIZE, ttl=ORDER_LOCAL_CACHE_TTL)
+
+def _key(order_id: str) -> str:
+    return f"orders:public:{order_id}"
+
+def public_view(order) -> dict:
+    return {
+        "id": order.id,
+        "amount": order.amount,
+        "currency": order.currency,
+        "status": order.status
+    }
+
+def get_public_order(db, order_id: str):
+    """The public view of an order, or None if it does not exist."""
+    raw = local_cache.get(order_id)
+    if raw is None:
+        try:
+            raw = redis_client.get(_key(order_id))
+        except redis.RedisError:
+            raw = None
+        if raw is None:
+            order = db.query(models.Order).filter(models.Order.id == order_id).first()
+            raw = json.dumps(public_view(order)) if order else NOT_FOUND
+            try:
+                redis_client.set(_key(order_id), raw, ex=ORDER_CACHE_TTL if order else ORDER_NEGATIVE_CACHE_TTL)
+            except redis.RedisError:
+                pass
+        local_cache.set(order_id, raw)
+    return json.loads(raw)
+
+def invalidate(order_id: str):
+    """Call after an order's status changes (or an id that was looked up before gets created)."""
+    local_cache.invalidate(order_id)
+    try:
+        redis_client.delete(_key(order_id))
+    except redis.RedisError:
+        pass
+
+def etag(view: dict) -> str:
+    digest = hashlib.sha1(json.dumps(view, sort_keys=True).encode()).hexdigest()[:16]
+    return f'"{digest}"'
@@ -0,0 +1,94 @@
+import os
+import json
+import asyncio
+from collections import defaultdict
+import redis
+from .redis_client import redis_client, async_redis_client
+
+# Payment status push for the checkout page.
+# Workers publish every final payment status on one Redis channel; each API process
+# holds a single subscription and fans messages out to its waiting SSE streams, so
+# thousands of open checkouts cost one Redis connection and no database polling.
+PAYMENT_STATUS_CHANNEL = "payments:status"
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", 15))
+# Streams are closed after this long; EventSource reconnects on its own
+SSE_MAX_WAIT = float(os.getenv("SSE_MAX_WAIT", 120))
+
+def status_message(payment) -> dict:
+    return {
+        "id": payment.id,
+        "order_id": payment.order_id,
+        "status": payment.status,
+        "error_code": payment.error_code,
+        "error_description": payment.error_description,
+    }
+
+def publish_status(payment):
+    """Called by workers once a payment reaches a final status. Never raises."""
+    try:
+        redis_client.publish(PAYMENT_STATUS_CHANNEL, json.dumps(status_message(payment)))
+    except redis.RedisError as e:
+        print(f"Payment status publish failed for {payment.id}: {e}")
+
+def is_final(status: str) -> bool:
+    """Anything past pending (success, failed, refunded, ...) will not be published again."""
+    return status != "pending"
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class PaymentStatusHub:
+    """Per-process fan-out from the shared Redis subscription to waiting streams."""
+
+    def __init__(self):
+        self._waiters = defaultdict(set)
+        self._listener = None
+        self._loop = None
+        self._ready = None
+
+    async def subscribe(self, payment_id: str) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._listener is None or self._listener.done() or self._loop is not loop:
+            self._loop = loop
+            self._ready = asyncio.Event()
+            self._listener = loop.create_task(self._listen())
+        queue = asyncio.Queue()
+        self._waiters[payment_id].add(queue)
+        # Only the first subscriber in a process waits for the Redis SUBSCRIBE
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=1)
+        except asyncio.TimeoutError:
+            pass
+        return queue
+
+    def unsubscribe(self, payment_id: str, queue: asyncio.Queue):
+        waiters = self._waiters.get(payment_id)
+        if waiters is not None:
+            waiters.discard(queue)
+            if not waiters:
+                del self._waiters[payment_id]
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def _dispatch(self, raw):
+        message = json.loads(raw)
+        for queue in self._waiters.get(message["id"], ()):
+            queue.put_nowait(message)
+
+    async def _listen(self):
+        while True:
+            pubsub = async_redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(PAYMENT_STATUS_CHANNEL)
+                self._ready.set()
+                async for message in pubsub.listen():
+                    self._dispatch(message["data"])
+            except redis.RedisError as e:
+                print(f"Payment status subscription lost, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+hub = PaymentStatusHub()
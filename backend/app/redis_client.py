@@ -0,0 +1,12 @@
+import os
+import redis
+import redis.asyncio
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis_v2:6379/0")
+
+# Shared client for application state kept in Redis (separate from the Celery broker usage).
+# redis-py connects lazily, so importing this module never blocks.
+redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+
+# asyncio flavour for use inside async request handlers
+async_redis_client = redis.asyncio.Redis.from_url(REDIS_URL, decode_responses=True)
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
+from pydantic import ValidationError
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 from .. import auth
-from .. import models, schemas, database
-from ..utils.id_generator import generate_custom_id
+from .. import models, schemas, database, order_cache
+from ..utils.id_generator import generate_custom_id, generate_custom_ids
+from ..utils.pagination import keyset_paginate, split_page, clamp_limit
+from ..utils.validation import describe_validation_error
 
 # Create the router
 router = APIRouter()
@@ -29,6 +35,36 @@ def create_order(
     db.refresh(new_order)
     return new_order
 
+@router.post("/batch")
+def create_orders_batch(
+    batch_in: schemas.OrderBatchCreate,
+    db: Session = Depends(database.get_db),
+    merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
+):
+    results, rows = [], []
+    now = datetime.utcnow()
+    order_ids = generate_custom_ids("order_", len(batch_in.items))
+    for index, item in enumerate(batch_in.items):
+        try:
+            order_in = schemas.OrderCreate.model_validate(item)
+        except ValidationError as e:
+            results.append({"index": index, "status": "error", "error": {"code": "BAD_REQUEST_ERROR", "description": describe_validation_error(e)}})
+            continue
+        row = {
+            "id": order_ids[index], "merchant_id": merchant.id,
+            "amount": order_in.amount, "currency": order_in.currency,
+            "receipt": order_in.receipt, "notes": order_in.notes,
+            "status": "created", "created_at": now
+        }
+        rows.append(row)
+        results.append({"index": index, "status": "created", "order": schemas.OrderResponse.model_validate(row)})
+
+    # One multi-row INSERT and a single commit for the whole batch
+    if rows:
+        db.execute(insert(models.Order), rows)
+        db.commit()
+    return {"data": results, "created": len(rows), "failed": len(results) - len(rows)}
+
 # GET single order
 @router.get("/{order_id}", response_model=schemas.OrderResponse)
 def get_order(order_id: str, db: Session = Depends(database.get_db), merchant: models.Merchant = Depends(auth.get_authenticated_merchant)):
@@ -39,19 +75,47 @@ def get_order(order_id: str, db: Session = Depends(database.get_db), merchant: m
 
 # GET all orders
 @router.get("", response_model=list[schemas.OrderResponse])
-def list_orders(db: Session = Depends(database.get_db), merchant: models.Merchant = Depends(auth.get_authenticated_merchant)):
-    return db.query(models.Order).filter(models.Order.merchant_id == merchant.id).all()
+def list_orders(
+    response: Response,
+    limit: Optional[int] = None, cursor: Optional[str] = None,
+    db: Session = Depends(database.get_read_db),
+    merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
+):
+    query = db.query(models.Order).filter(models.Order.merchant_id == merchant.id)
+    # Without a limit the full list is returned, as the dashboard expects
+    if limit is None and cursor is None:
+        return query.all()
+
+    limit = clamp_limit(limit or 10)
+    try:
+        page_query = keyset_paginate(query, models.Order, cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "Invalid cursor"}})
+    orders, next_cursor = split_page(page_query.all(), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return orders
 
 
 @router.get("/{order_id}/public")
-def get_order_public(order_id: str, db: Session = Depends(database.get_db)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND_ERROR", "description": "Order not found"}})
+def get_order_public(
+    order_id: str, response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(database.get_db)
+):
+    # Served from order_cache; the session only connects on a full cache miss
+    order = order_cache.get_public_order(db, order_id)
+    if order is None:
+        raise HTTPException(
+            status_code=404,
+            detail={"error": {"code": "NOT_FOUND_ERROR", "description": "Order not found"}},
+            headers={"Cache-Control": f"public, max-age={order_cache.ORDER_NEGATIVE_CACHE_TTL}"}
+        )
+
+    etag = order_cache.etag(order)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={order_cache.ORDER_PUBLIC_MAX_AGE}"}
+    if if_none_match and etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     # Return only basic info
-    return {
-        "id": order.id,
-        "amount": order.amount,
-        "currency": order.currency,
-        "status": order.status
-    }
\ No newline at end of file
+    return order
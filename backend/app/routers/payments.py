@@ -1,58 +1,67 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Request, status
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, insert, update, text
+from sqlalchemy.exc import IntegrityError
+from pydantic import ValidationError
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from .. import schemas
-from .. import auth, models, database
-from ..utils.id_generator import generate_custom_id
-from ..tasks import process_payment_job, process_refund_job, deliver_webhook_job
-from ..worker import celery_app
+from .. import auth, models, database, crud, idempotency, outbox, payment_events
+from ..utils.id_generator import generate_custom_id, generate_custom_ids
+from ..utils.pagination import keyset_paginate, split_page, clamp_limit
+from ..utils.validation import describe_validation_error
+from ..tasks import process_payment_job, process_refund_job, deliver_webhook_job, WEBHOOK_RETRY_LEASE
+from ..job_status import read_job_status
 
 router = APIRouter()
 
-# UPDATED: Corrected endpoint path and logic for automated evaluation
 @router.get("/test/jobs/status", tags=["Evaluation"])
 async def get_job_status():
-    try:
-        inspector = celery_app.control.inspect()
-        active = inspector.active() or {}
-        reserved = inspector.reserved() or {}
-        
-        # Calculate totals from all worker nodes
-        processing_count = sum(len(tasks) for tasks in active.values())
-        pending_count = sum(len(tasks) for tasks in reserved.values())
-        
-        return {
-            "pending": pending_count,
-            "processing": processing_count,
-            "completed": 0, # Optional per spec
-            "failed": 0,
-            "worker_status": "running" if active else "stopped"
-        }
-    except Exception:
-        return {
-            "pending": 0, "processing": 0, "completed": 0, "failed": 0,
-            "worker_status": "stopped"
-        }
+    return await read_job_status()
 
-def get_cached_idempotency_response(db: Session, merchant_id: str, ikey: Optional[str]):
+async def get_cached_idempotency_response(db: AsyncSession, merchant_id: str, ikey: Optional[str]):
+    """Durable fallback behind the Redis fast path. Returns (fingerprint, response) or None."""
     if not ikey: return None
-    record = db.query(models.IdempotencyKey).filter(
+    result = await db.execute(select(models.IdempotencyKey).where(
         models.IdempotencyKey.key == ikey,
         models.IdempotencyKey.merchant_id == merchant_id
-    ).first()
+    ).order_by(models.IdempotencyKey.expires_at.desc()))
+    record = result.scalars().first()
     if record:
         if record.expires_at > datetime.utcnow():
-            return record.response
+            ttl = (record.expires_at - datetime.utcnow()).total_seconds()
+            await idempotency.store_result(merchant_id, ikey, record.fingerprint, record.response, ttl)
+            return record.fingerprint, record.response
         else:
-            db.delete(record)
-            db.commit()
+            # No commit here: the new key row replaces it in the same transaction
+            await db.delete(record)
     return None
 
+async def lock_idempotency_key(db: AsyncSession, merchant_id, ikey: str):
+    """
+    With IDEMPOTENCY_PARTITIONED the primary key includes expires_at, so it no
+    longer makes (key, merchant_id) unique. A transaction-scoped advisory lock on
+    the pair takes its place: holders re-check the table before inserting, at the
+    cost of one extra round trip per keyed request.
+    """
+    if not models.IDEMPOTENCY_PARTITIONED or db.bind.dialect.name != "postgresql":
+        return
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtextextended(:lock_key, 0))"),
+                     {"lock_key": f"idempotency:{merchant_id}:{ikey}"})
+
+def replay_idempotent_response(cached, request_fingerprint: str):
+    stored_fingerprint, response = cached
+    if stored_fingerprint and stored_fingerprint != request_fingerprint:
+        raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "Idempotency-Key was already used with a different request body"}})
+    return response
+
 @router.post("/public", status_code=201)
-async def create_payment_public(payment_in: schemas.PaymentCreate, db: Session = Depends(database.get_db)):
-    order = db.query(models.Order).filter(models.Order.id == payment_in.order_id).first()
+async def create_payment_public(payment_in: schemas.PaymentCreate, db: AsyncSession = Depends(database.get_async_db)):
+    result = await db.execute(select(models.Order).where(models.Order.id == payment_in.order_id))
+    order = result.scalars().first()
     if not order: raise HTTPException(status_code=404, detail="Order not found")
     
     payment_id = generate_custom_id("pay_")
@@ -62,29 +71,62 @@ async def create_payment_public(payment_in: schemas.PaymentCreate, db: Session =
         status="pending", captured=False
     )
     db.add(new_payment)
-    db.commit()
-    process_payment_job.delay(payment_id)
+    outbox.enqueue(db, process_payment_job.name, payment_id)
+    await db.commit()
+    await crud.record_payments_created(order.merchant_id)
     return {"payment_id": payment_id, "status": "pending", "order_id": order.id}
 
 @router.post("", response_model=schemas.PaymentResponse, status_code=201)
 async def create_payment(
     payment_in: schemas.PaymentCreate, 
     idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
 ):
-    cached_res = get_cached_idempotency_response(db, merchant.id, idempotency_key)
-    if cached_res: return cached_res
-    
-    order = db.query(models.Order).filter(
+    if not idempotency_key:
+        return await _create_payment(payment_in, db, merchant)
+
+    request_fingerprint = idempotency.fingerprint(payment_in.model_dump())
+    cached = await idempotency.get_result(merchant.id, idempotency_key)
+    if cached is None:
+        cached = await get_cached_idempotency_response(db, merchant.id, idempotency_key)
+    if cached is not None:
+        return replay_idempotent_response(cached, request_fingerprint)
+
+    # Concurrent duplicates wait for the first request's result instead of racing it
+    if not await idempotency.acquire_lock(merchant.id, idempotency_key):
+        cached = await idempotency.wait_for_result(merchant.id, idempotency_key)
+        if cached is None:
+            raise HTTPException(status_code=409, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "A request with this Idempotency-Key is still in progress"}})
+        return replay_idempotent_response(cached, request_fingerprint)
+
+    try:
+        return await _create_payment(payment_in, db, merchant, idempotency_key, request_fingerprint)
+    finally:
+        await idempotency.release_lock(merchant.id, idempotency_key)
+
+async def _create_payment(
+    payment_in: schemas.PaymentCreate, db: AsyncSession, merchant: models.Merchant,
+    idempotency_key: Optional[str] = None, request_fingerprint: Optional[str] = None
+):
+    if idempotency_key and models.IDEMPOTENCY_PARTITIONED:
+        # Held until commit/rollback; a concurrent duplicate replays once we commit
+        await lock_idempotency_key(db, merchant.id, idempotency_key)
+        cached = await get_cached_idempotency_response(db, merchant.id, idempotency_key)
+        if cached is not None:
+            await db.rollback()
+            return replay_idempotent_response(cached, request_fingerprint)
+
+    result = await db.execute(select(models.Order).where(
         models.Order.id == payment_in.order_id, 
         models.Order.merchant_id == merchant.id
-    ).first()
+    ))
+    order = result.scalars().first()
     if not order: raise HTTPException(status_code=404, detail="Order not found")
     
     payment_id = generate_custom_id("pay_")
     response_data = {
-        "id": payment_id, "order_id": order.id, "amount": order.amount,
+        "id": payment_id, "order_id": order.id, "merchant_id": str(merchant.id), "amount": order.amount,
         "currency": order.currency, "status": "pending", "method": payment_in.method,
         "created_at": datetime.utcnow().isoformat() + "Z"
     }
@@ -99,27 +141,92 @@ async def create_payment(
     if idempotency_key:
         db.add(models.IdempotencyKey(
             key=idempotency_key, merchant_id=merchant.id, response=response_data,
+            fingerprint=request_fingerprint,
             expires_at=datetime.utcnow() + timedelta(hours=24)
         ))
+    outbox.enqueue(db, process_payment_job.name, payment_id)
+    outbox.enqueue(db, deliver_webhook_job.name, str(merchant.id), "payment.created", response_data)
     
-    db.commit()
-    process_payment_job.delay(payment_id)
-    deliver_webhook_job.delay(merchant.id, "payment.created", response_data)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Same key committed by a concurrent request (only reachable when Redis is down)
+        await db.rollback()
+        cached = await get_cached_idempotency_response(db, merchant.id, idempotency_key) if idempotency_key else None
+        if cached is None:
+            raise
+        return replay_idempotent_response(cached, request_fingerprint)
+
+    await crud.record_payments_created(merchant.id)
+    if idempotency_key:
+        await idempotency.store_result(merchant.id, idempotency_key, request_fingerprint, response_data)
     return response_data
 
+@router.post("/batch")
+async def create_payments_batch(
+    batch_in: schemas.PaymentBatchCreate,
+    db: AsyncSession = Depends(database.get_async_db),
+    merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
+):
+    results, rows, valid = [], [], []
+    for index, item in enumerate(batch_in.items):
+        try:
+            valid.append((index, schemas.PaymentCreate.model_validate(item)))
+        except ValidationError as e:
+            results.append({"index": index, "status": "error", "error": {"code": "BAD_REQUEST_ERROR", "description": describe_validation_error(e)}})
+
+    # Resolve every referenced order in one query
+    order_ids = {payment_in.order_id for _, payment_in in valid}
+    result = await db.execute(select(models.Order).where(
+        models.Order.id.in_(order_ids), models.Order.merchant_id == merchant.id
+    ))
+    orders = {order.id: order for order in result.scalars().all()}
+
+    now = datetime.utcnow()
+    payment_ids = generate_custom_ids("pay_", len(valid))
+    for (index, payment_in), payment_id in zip(valid, payment_ids):
+        order = orders.get(payment_in.order_id)
+        if not order:
+            results.append({"index": index, "status": "error", "error": {"code": "NOT_FOUND_ERROR", "description": "Order not found"}})
+            continue
+        row = {
+            "id": payment_id, "order_id": order.id, "merchant_id": merchant.id,
+            "amount": order.amount, "currency": order.currency, "method": payment_in.method,
+            "status": "pending", "captured": False, "created_at": now, "updated_at": now
+        }
+        rows.append(row)
+        results.append({"index": index, "status": "created", "payment": {
+            "id": row["id"], "order_id": order.id, "merchant_id": str(merchant.id), "amount": order.amount,
+            "currency": order.currency, "status": "pending", "method": payment_in.method,
+            "created_at": now.isoformat() + "Z"
+        }})
+    results.sort(key=lambda r: r["index"])
+
+    if rows:
+        # One multi-row INSERT per table and a single commit; jobs go out via the outbox relay
+        created = [r["payment"] for r in results if r["status"] == "created"]
+        jobs = [(process_payment_job.name, [payment["id"]]) for payment in created] + \
+               [(deliver_webhook_job.name, [str(merchant.id), "payment.created", payment]) for payment in created]
+        await db.execute(insert(models.Payment), rows)
+        await db.execute(insert(models.OutboxMessage), outbox.bulk_rows(jobs))
+        await db.commit()
+        await crud.record_payments_created(merchant.id, len(rows))
+    return {"data": results, "created": len(rows), "failed": len(results) - len(rows)}
+
 @router.post("/{payment_id}/capture")
 async def capture_payment(
-    payment_id: str, db: Session = Depends(database.get_db),
+    payment_id: str, db: AsyncSession = Depends(database.get_async_db),
     merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
 ):
-    payment = db.query(models.Payment).filter(
+    result = await db.execute(select(models.Payment).where(
         models.Payment.id == payment_id, models.Payment.merchant_id == merchant.id
-    ).first()
+    ))
+    payment = result.scalars().first()
     if not payment or payment.status != "success":
         raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "Payment not in capturable state"}})
     
     payment.captured = True
-    db.commit()
+    await db.commit()
     return {
         "id": payment.id, "order_id": payment.order_id, "amount": payment.amount,
         "status": payment.status, "captured": True,
@@ -130,30 +237,39 @@ async def capture_payment(
 @router.post("/{payment_id}/refunds", response_model=schemas.RefundResponse, status_code=201)
 async def create_refund(
     payment_id: str, refund_in: schemas.RefundCreate,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_async_db),
     merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
 ):
-    payment = db.query(models.Payment).filter(
-        models.Payment.id == payment_id, models.Payment.merchant_id == merchant.id
-    ).first()
-    
-    if not payment or payment.status != "success":
-        raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "Payment not refundable"}})
-    
-    total_refunded = db.query(func.sum(models.Refund.amount)).filter(models.Refund.payment_id == payment_id).scalar() or 0
-    if refund_in.amount > (payment.amount - total_refunded):
+    # Reserve the amount atomically: the row is only updated if enough is left,
+    # so parallel refunds serialize on the payment row instead of racing a SUM
+    reserved = await db.execute(
+        update(models.Payment)
+        .where(
+            models.Payment.id == payment_id, models.Payment.merchant_id == merchant.id,
+            models.Payment.status == "success",
+            models.Payment.amount - models.Payment.refunded_amount >= refund_in.amount
+        )
+        .values(refunded_amount=models.Payment.refunded_amount + refund_in.amount)
+        .returning(models.Payment.id)
+        .execution_options(synchronize_session=False)
+    )
+    if reserved.first() is None:
+        result = await db.execute(select(models.Payment.status).where(
+            models.Payment.id == payment_id, models.Payment.merchant_id == merchant.id
+        ))
+        if result.scalar() != "success":
+            raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "Payment not refundable"}})
         raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "Refund amount exceeds available amount"}})
-    
+
     refund_id = generate_custom_id("rfnd_")
     new_refund = models.Refund(
         id=refund_id, payment_id=payment_id, merchant_id=merchant.id,
         amount=refund_in.amount, reason=refund_in.reason, status="pending"
     )
     db.add(new_refund)
-    db.commit()
-    db.refresh(new_refund) # Reload object state from database
-    
-    process_refund_job.delay(refund_id)
+    outbox.enqueue(db, process_refund_job.name, refund_id)
+    await db.commit()
+    await db.refresh(new_refund) # Reload object state from database
     
     # FIX: Explicitly validate the database model to Pydantic schema
     return schemas.RefundResponse.model_validate(new_refund)
@@ -161,59 +277,175 @@ async def create_refund(
 @router.get("/refunds", response_model=Dict[str, Any])
 async def list_refunds(
     limit: int = 10, offset: int = 0,
-    db: Session = Depends(database.get_db),
+    cursor: Optional[str] = None, include_total: bool = True,
+    db: AsyncSession = Depends(database.get_async_read_db),
     merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
 ):
-    query = db.query(models.Refund).filter(models.Refund.merchant_id == merchant.id)
-    total = query.count()
-    refunds = query.order_by(models.Refund.created_at.desc()).offset(offset).limit(limit).all()
+    limit = clamp_limit(limit)
+    query = select(models.Refund).where(models.Refund.merchant_id == merchant.id)
+    try:
+        page_query = keyset_paginate(query, models.Refund, cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "Invalid cursor"}})
+    # Offset is kept for existing clients; a cursor makes it unnecessary
+    if offset and not cursor:
+        page_query = page_query.offset(offset)
+
+    # Exact counts scan every row for the merchant, so callers can opt out
+    total = None
+    if include_total:
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    result = await db.execute(page_query)
+    refunds, next_cursor = split_page(result.scalars().all(), limit)
     
     # FIX: Manually cast each list item to solve the Serialization Error
     return {
         "data": [schemas.RefundResponse.model_validate(r) for r in refunds], 
         "total": total, 
         "limit": limit, 
-        "offset": offset
+        "offset": offset,
+        "next_cursor": next_cursor
     }
 
 @router.get("/refunds/{refund_id}", response_model=schemas.RefundResponse)
 async def get_refund(
-    refund_id: str, db: Session = Depends(database.get_db),
+    refund_id: str, db: AsyncSession = Depends(database.get_async_db),
     merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
 ):
-    refund = db.query(models.Refund).filter(
+    result = await db.execute(select(models.Refund).where(
         models.Refund.id == refund_id, models.Refund.merchant_id == merchant.id
-    ).first()
+    ))
+    refund = result.scalars().first()
     if not refund: raise HTTPException(status_code=404, detail="Refund not found")
     return refund
 
 @router.get("/webhooks")
 async def list_webhook_logs(
     limit: int = 10, offset: int = 0,
-    db: Session = Depends(database.get_db),
+    cursor: Optional[str] = None, include_total: bool = True,
+    db: AsyncSession = Depends(database.get_async_read_db),
     merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
 ):
-    query = db.query(models.WebhookLog).filter(models.WebhookLog.merchant_id == merchant.id)
-    total = query.count()
-    logs = query.order_by(models.WebhookLog.created_at.desc()).offset(offset).limit(limit).all()
-    return {"data": logs, "total": total, "limit": limit, "offset": offset}
+    limit = clamp_limit(limit)
+    query = select(models.WebhookLog).where(models.WebhookLog.merchant_id == merchant.id)
+    try:
+        page_query = keyset_paginate(query, models.WebhookLog, cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "Invalid cursor"}})
+    if offset and not cursor:
+        page_query = page_query.offset(offset)
+
+    total = None
+    if include_total:
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    result = await db.execute(page_query)
+    logs, next_cursor = split_page(result.scalars().all(), limit)
+    return {"data": logs, "total": total, "limit": limit, "offset": offset, "next_cursor": next_cursor}
 
 @router.post("/webhooks/{webhook_id}/retry")
 async def retry_webhook(
-    webhook_id: str, db: Session = Depends(database.get_db),
+    webhook_id: str, db: AsyncSession = Depends(database.get_async_db),
     merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
 ):
-    log = db.query(models.WebhookLog).filter(
+    result = await db.execute(select(models.WebhookLog).where(
         models.WebhookLog.id == webhook_id, models.WebhookLog.merchant_id == merchant.id
-    ).first()
+    ))
+    log = result.scalars().first()
     if not log: raise HTTPException(status_code=404, detail="Webhook log not found")
     
     log.attempts = 0
     log.status = "pending"
-    db.commit()
-    deliver_webhook_job.delay(merchant.id, log.event, log.payload)
+    # Sent right away below; the lease lets the retry scheduler resend it if this publish is lost
+    log.next_retry_at = datetime.utcnow() + timedelta(seconds=WEBHOOK_RETRY_LEASE)
+    await db.commit()
+    deliver_webhook_job.delay(str(merchant.id), log.event, log.payload, 1, str(log.id))
     return {"id": str(log.id), "status": "pending", "message": "Webhook retry scheduled"}
 
+@router.get("/stats")
+def get_payment_stats(db: Session = Depends(database.get_read_db), merchant: models.Merchant = Depends(auth.get_authenticated_merchant)):
+    return crud.get_merchant_stats(db, merchant.id)
+
+@router.get("/stats/timeseries")
+def get_payment_stats_timeseries(
+    bucket: str = "day", since: Optional[datetime] = None,
+    db: Session = Depends(database.get_read_db),
+    merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
+):
+    if bucket not in crud.STATS_BUCKETS:
+        raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "bucket must be 'hour' or 'day'"}})
+    return {"bucket": bucket, "data": crud.get_merchant_stats_timeseries(db, merchant.id, bucket, since)}
+
 @router.get("", response_model=List[schemas.PaymentResponse])
-def list_payments(db: Session = Depends(database.get_db), merchant: models.Merchant = Depends(auth.get_authenticated_merchant)):
-    return db.query(models.Payment).filter(models.Payment.merchant_id == merchant.id).all()
\ No newline at end of file
+def list_payments(
+    response: Response,
+    limit: Optional[int] = None, cursor: Optional[str] = None,
+    db: Session = Depends(database.get_read_db),
+    merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
+):
+    query = db.query(models.Payment).filter(models.Payment.merchant_id == merchant.id)
+    # Without a limit the full list is returned, as the dashboard expects
+    if limit is None and cursor is None:
+        return query.all()
+
+    limit = clamp_limit(limit or 10)
+    try:
+        page_query = keyset_paginate(query, models.Payment, cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "Invalid cursor"}})
+    payments, next_cursor = split_page(page_query.all(), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return payments
+
+# --- Checkout status (public, keyed by the unguessable payment id) ---
+async def get_public_payment(payment_id: str):
+    # Short-lived session: SSE streams must not hold a pooled connection while they wait
+    async with database.AsyncSessionLocal() as db:
+        result = await db.execute(select(models.Payment).where(models.Payment.id == payment_id))
+        payment = result.scalars().first()
+    if not payment:
+        raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND_ERROR", "description": "Payment not found"}})
+    return payment
+
+@router.get("/{payment_id}/public")
+async def get_payment_public(payment_id: str):
+    """Polling fallback for clients without EventSource."""
+    return payment_events.status_message(await get_public_payment(payment_id))
+
+@router.get("/{payment_id}/events")
+async def stream_payment_status(payment_id: str, request: Request):
+    """
+    Server-Sent Events: one `status` event once the payment is final, with
+    comment keep-alives while the bank responds.
+    """
+    # Subscribe before reading, so a status published in between is not missed
+    queue = await payment_events.hub.subscribe(payment_id)
+    try:
+        payment = await get_public_payment(payment_id)
+    except HTTPException:
+        payment_events.hub.unsubscribe(payment_id, queue)
+        raise
+
+    async def events():
+        try:
+            if payment_events.is_final(payment.status):
+                yield payment_events.sse_event("status", payment_events.status_message(payment))
+                return
+            deadline = asyncio.get_running_loop().time() + payment_events.SSE_MAX_WAIT
+            while asyncio.get_running_loop().time() < deadline:
+                if await request.is_disconnected():
+                    return
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=payment_events.SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield payment_events.sse_event("status", message)
+                return
+        finally:
+            payment_events.hub.unsubscribe(payment_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
@@ -50,9 +50,19 @@ class PaymentResponse(BaseModel):
     created_at: datetime
     model_config = ConfigDict(from_attributes=True)
 
+# --- Batch Schemas ---
+# Items are validated one by one so a bad item yields its own error instead of failing the batch
+BATCH_MAX_ITEMS = 1000
+
+class OrderBatchCreate(BaseModel):
+    items: List[Dict[str, Any]] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class PaymentBatchCreate(BaseModel):
+    items: List[Dict[str, Any]] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
 # --- Refund Schemas ---
 class RefundCreate(BaseModel):
-    amount: int  # Amount in smallest unit (e.g., paise)
+    amount: int = Field(..., gt=0)  # Amount in smallest unit (e.g., paise)
     reason: Optional[str] = None
 
 # backend/app/schemas.py
@@ -80,9 +90,10 @@ class WebhookLogResponse(BaseModel):
 
 class WebhookListResponse(BaseModel):
     data: List[WebhookLogResponse]
-    total: int
+    total: Optional[int] = None
     limit: int
     offset: int
+    next_cursor: Optional[str] = None
 
 class WebhookUpdate(BaseModel):
     webhook_url: HttpUrl # Required for the Save Configuration button
@@ -4,11 +4,15 @@ import random
 import json
 import hmac
 import hashlib
+import uuid
+import redis
 import requests
 from datetime import datetime, timedelta
+from sqlalchemy import select, func, update
 from .worker import celery_app
 from .database import SessionLocal
-from . import models
+from . import models, crud, webhooks, webhook_batching, maintenance, outbox, metrics, circuit_breaker, payment_events
+from .webhook_logs import WebhookLogWriter, save_webhook_attempt
 
 def generate_webhook_signature(payload_dict, secret):
     payload_string = json.dumps(payload_dict, separators=(',', ':'))
@@ -18,33 +22,61 @@ def generate_webhook_signature(payload_dict, secret):
         hashlib.sha256
     ).hexdigest()
 
+def is_test_mode() -> bool:
+    return os.getenv("TEST_MODE", "false").lower() == "true"
+
+def bank_response_delay() -> float:
+    """Simulated bank latency for a payment, in seconds."""
+    if is_test_mode():
+        return int(os.getenv("TEST_PROCESSING_DELAY", 1000)) / 1000.0
+    return random.randint(5, 10)
+
+# Payments and refunds are two-step state machines: the first task validates and
+# schedules the bank response with a countdown, so no worker slot or DB session
+# is held while the simulated bank is "thinking".
 @celery_app.task(name="app.tasks.process_payment")
 def process_payment_job(payment_id: str):
     db = SessionLocal()
     try:
         payment = db.query(models.Payment).filter(models.Payment.id == payment_id).first()
-        if not payment:
+        if not payment or payment.status != "pending":
             return
+    finally:
+        db.close()
 
-        test_mode = os.getenv("TEST_MODE", "false").lower() == "true"
-        if test_mode:
-            delay = int(os.getenv("TEST_PROCESSING_DELAY", 1000)) / 1000.0
-        else:
-            delay = random.randint(5, 10)
-        time.sleep(delay)
+    complete_payment_job.apply_async(args=[payment_id], countdown=bank_response_delay())
 
-        if test_mode:
+@celery_app.task(name="app.tasks.complete_payment")
+def complete_payment_job(payment_id: str):
+    db = SessionLocal()
+    try:
+        payment = db.query(models.Payment).filter(models.Payment.id == payment_id).first()
+        if not payment or payment.status != "pending":
+            return
+
+        if is_test_mode():
             success = os.getenv("TEST_PAYMENT_SUCCESS", "true").lower() == "true"
         else:
             threshold = 0.90 if payment.method == "upi" else 0.95
             success = random.random() < threshold
 
-        payment.status = "success" if success else "failed"
+        values = {"status": "success" if success else "failed", "updated_at": datetime.utcnow()}
         if not success:
-            payment.error_code = "BANK_DECLINED"
-            payment.error_description = "The transaction was rejected by the bank."
-        
-        db.commit()
+            values["error_code"] = "BANK_DECLINED"
+            values["error_description"] = "The transaction was rejected by the bank."
+
+        # Claim the transition in one statement: a duplicate run (at-least-once relay,
+        # acks_late redelivery) finds the row no longer pending and does nothing
+        claimed = db.execute(
+            update(models.Payment)
+            .where(models.Payment.id == payment_id, models.Payment.status == "pending")
+            .values(**values)
+            .returning(models.Payment.id)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if claimed is None:
+            db.rollback()
+            return
 
         event = "payment.success" if success else "payment.failed"
         webhook_payload = {
@@ -57,71 +89,380 @@ def process_payment_job(payment_id: str):
                     "amount": payment.amount,
                     "currency": payment.currency,
                     "method": payment.method,
-                    "status": payment.status,
+                    "status": values["status"],
                     "created_at": payment.created_at.isoformat() + "Z"
                 }
             }
         }
-        deliver_webhook_job.delay(payment.merchant_id, event, webhook_payload)
-
+        # Committed with the status change; the relay sends it through the batch dispatcher
+        outbox.enqueue(db, deliver_webhook_job.name, str(payment.merchant_id), event, webhook_payload)
+        db.commit()
+        db.refresh(payment)
+        crud.record_payment_outcome(payment.merchant_id, payment.amount, success)
+        payment_events.publish_status(payment)
     finally:
         db.close()
 
-@celery_app.task(name="app.tasks.deliver_webhook", bind=True)
-def deliver_webhook_job(self, merchant_id: str, event: str, payload: dict, attempt: int = 1):
+def webhook_retry_delay(attempt: int):
+    """Countdown before the next attempt, or None once all 5 attempts are used."""
+    if attempt >= 5:
+        return None
+    test_retries = os.getenv("WEBHOOK_RETRY_INTERVALS_TEST", "false").lower() == "true"
+    intervals = [0, 5, 10, 15, 20] if test_retries else [0, 60, 300, 1800, 7200]
+    return intervals[attempt]
+
+def webhook_attempt_values(attempt: int, response=None, min_delay: float = 0):
+    """
+    Column values describing one delivery attempt.
+    `response` is None when the request itself failed (timeout, refused, ...).
+    A retry is never scheduled before the endpoint's Retry-After or `min_delay`
+    (e.g. an open circuit breaker).
+    Returns (values, retry countdown in seconds or None if no retry is needed).
+    """
+    metrics.observe_webhook_response(response)
+    values = {
+        "attempts": attempt,
+        "last_attempt_at": datetime.utcnow(),
+        "response_code": None,
+        "response_body": None,
+        "next_retry_at": None,
+    }
+    if response is not None:
+        values["response_code"] = response.status_code
+        values["response_body"] = response.text[:500]
+        if 200 <= response.status_code < 300:
+            values["status"] = "success"
+            return values, None
+
+    next_delay = webhook_retry_delay(attempt)
+    if next_delay is None:
+        values["status"] = "failed"
+    else:
+        next_delay = max(next_delay, circuit_breaker.retry_after_seconds(response) or 0, min_delay)
+        values["status"] = "pending"
+        values["next_retry_at"] = datetime.utcnow() + timedelta(seconds=next_delay)
+    return values, next_delay
+
+def parked_attempt_values(attempt: int, delay: float):
+    """An event held back by an open breaker: nothing was sent, so the attempt is not used up."""
+    return {
+        "status": "pending",
+        "attempts": attempt - 1,
+        "next_retry_at": datetime.utcnow() + timedelta(seconds=delay),
+    }
+
+def undeliverable_values():
+    """A logged delivery whose merchant no longer has a webhook URL: give up on it."""
+    return {"status": "failed", "next_retry_at": None, "last_attempt_at": datetime.utcnow()}
+
+def is_delivered(response) -> bool:
+    return response is not None and 200 <= response.status_code < 300
+
+@celery_app.task(name="app.tasks.deliver_webhook")
+def deliver_webhook_job(merchant_id: str, event: str, payload: dict, attempt: int = 1, log_id: str = None):
     db = SessionLocal()
     try:
         merchant = db.query(models.Merchant).filter(models.Merchant.id == merchant_id).first()
         if not merchant or not merchant.webhook_url:
+            if log_id is not None:
+                save_webhook_attempt(db, uuid.UUID(str(log_id)), merchant_id, event, payload, undeliverable_values(), is_new=False)
             return
 
-        signature = generate_webhook_signature(payload, merchant.webhook_secret or "whsec_test_abc123")
-        
-        log = models.WebhookLog(
-            merchant_id=merchant.id,
-            event=event,
-            payload=payload,
-            attempts=attempt,
-            status="pending"
-        )
-        db.add(log)
-        db.commit()
+        # Batch mode: buffer first attempts; flush_webhook_batch_job sends them as one array
+        if merchant.webhook_batch_enabled and event != webhook_batching.BATCH_EVENT and log_id is None:
+            try:
+                queue_for_batch(merchant, event, payload)
+                return
+            except redis.RedisError:
+                pass # Deliver individually rather than drop the event
 
-        try:
-            response = requests.post(
-                merchant.webhook_url,
-                json=payload,
-                headers={
-                    "Content-Type": "application/json",
-                    "X-Webhook-Signature": signature
-                },
-                timeout=5
+        # Per-merchant fairness: a merchant already at its in-flight cap waits its turn
+        # at the back of the queue instead of taking another worker slot
+        if not webhooks.acquire_merchant_slot(str(merchant.id)):
+            deliver_webhook_job.apply_async(
+                args=[merchant_id, event, payload, attempt, log_id],
+                countdown=webhooks.WEBHOOK_FAIRNESS_DEFER, priority=9
             )
-            
-            log.response_code = response.status_code
-            log.response_body = response.text[:500]
-            log.last_attempt_at = datetime.utcnow()
-
-            if 200 <= response.status_code < 300:
-                log.status = "success"
-                db.commit()
-            else:
-                raise Exception(f"Status {response.status_code}")
-
-        except Exception:
-            log.status = "pending"
-            if attempt < 5:
-                test_retries = os.getenv("WEBHOOK_RETRY_INTERVALS_TEST", "false").lower() == "true"
-                intervals = [0, 5, 10, 15, 20] if test_retries else [0, 60, 300, 1800, 7200]
-                
-                next_delay = intervals[attempt]
-                log.next_retry_at = datetime.utcnow() + timedelta(seconds=next_delay)
-                db.commit()
-                
-                self.retry(args=[merchant_id, event, payload, attempt + 1], countdown=next_delay)
-            else:
-                log.status = "failed"
-                db.commit()
+            return
+
+        # The log row is written once, after the attempt; retries update the same row
+        is_new = log_id is None
+        log_uuid = uuid.uuid4() if is_new else uuid.UUID(str(log_id))
+
+        try:
+            breaker = circuit_breaker.check(merchant.id)
+            if breaker == circuit_breaker.OPEN:
+                # Endpoint known to be down: park the event until the breaker allows a probe
+                # (or, while a probe is in flight, until its verdict should be in)
+                delay = circuit_breaker.reopens_in(merchant.id) or webhooks.WEBHOOK_TIMEOUT
+                values = parked_attempt_values(attempt, delay)
+                save_webhook_attempt(db, log_uuid, merchant.id, event, payload, values, is_new)
+                return
+
+            signature = generate_webhook_signature(payload, merchant.webhook_secret or "whsec_test_abc123")
+            started = time.monotonic()
+            try:
+                response = webhooks.post_webhook(merchant.webhook_url, payload, signature)
+            except requests.RequestException:
+                response = None
+        finally:
+            webhooks.release_merchant_slot(str(merchant.id))
+
+        reopens_in = circuit_breaker.record_result(
+            merchant.id, is_delivered(response), time.monotonic() - started,
+            probe=breaker == circuit_breaker.PROBE
+        )
+        # Failed attempts stay 'pending' with next_retry_at set; dispatch_webhook_retries_job picks them up
+        values, _ = webhook_attempt_values(attempt, response, min_delay=reopens_in)
+        save_webhook_attempt(db, log_uuid, merchant.id, event, payload, values, is_new)
+        if batch_finished(event, values):
+            flush_webhook_batch_job.delay(str(merchant.id))
+    finally:
+        db.close()
+
+def queue_for_batch(merchant, event: str, payload: dict):
+    size = webhook_batching.buffer_event(merchant.id, event, payload)
+    if size == (merchant.webhook_batch_max_events or 100):
+        flush_webhook_batch_job.delay(str(merchant.id))
+    elif size == 1:
+        # First event of a new window starts the timer
+        flush_webhook_batch_job.apply_async(args=[str(merchant.id)], countdown=merchant.webhook_batch_window or 5)
+
+def batch_finished(event: str, values: dict) -> bool:
+    return event == webhook_batching.BATCH_EVENT and values.get("status") != "pending"
+
+@celery_app.task(name="app.tasks.flush_webhook_batch")
+def flush_webhook_batch_job(merchant_id: str):
+    """
+    Starts the merchant's next batch, unless one is still pending (in flight or
+    waiting for a retry): batch N+1 is never sent before batch N has finished,
+    so retries cannot reorder events. Finishing a batch triggers the next flush.
+    """
+    if not webhook_batching.acquire_flush_lock(merchant_id):
+        # The flush holding the lock may have just seen the previous batch as pending
+        flush_webhook_batch_job.apply_async(args=[merchant_id], countdown=1)
+        return
+    db = SessionLocal()
+    try:
+        merchant = db.query(models.Merchant).filter(models.Merchant.id == merchant_id).first()
+        if not merchant:
+            return
+        in_flight = db.query(models.WebhookLog.id).filter(
+            models.WebhookLog.merchant_id == merchant.id,
+            models.WebhookLog.event == webhook_batching.BATCH_EVENT,
+            models.WebhookLog.status == "pending"
+        ).first()
+        if in_flight:
+            return
+
+        events, _ = webhook_batching.pop_batch(merchant_id, merchant.webhook_batch_max_events or 100)
+        if not events:
+            return
+        # The row exists before the first attempt, so the next flush sees the batch
+        # as pending; the lease lets the retry scheduler resend it if this publish is lost
+        log_id = uuid.uuid4()
+        save_webhook_attempt(db, log_id, merchant.id, webhook_batching.BATCH_EVENT, events, {
+            "status": "pending",
+            "attempts": 0,
+            "next_retry_at": datetime.utcnow() + timedelta(seconds=WEBHOOK_RETRY_LEASE),
+        }, is_new=True)
+    finally:
+        db.close()
+        webhook_batching.release_flush_lock(merchant_id)
+
+    # Signed and delivered (with retries) like any single event, as a JSON array
+    deliver_webhook_job.delay(merchant_id, webhook_batching.BATCH_EVENT, events, 1, str(log_id))
+
+@celery_app.task(name="app.tasks.deliver_webhook_batch")
+def deliver_webhook_batch_job(deliveries: list):
+    """
+    Delivers many webhooks concurrently from a single worker slot.
+    deliveries: list of [merchant_id, event, payload, attempt] with an optional
+    trailing log_id when the delivery already has a webhook_logs row.
+
+    Each merchant gets its in-flight slots (see webhooks.acquire_merchant_slots) and
+    at most WEBHOOK_BATCH_MERCHANT_ROUNDS events per slot; the rest of its events
+    are parked for the retry scheduler. Outcomes are logged as they come in, and a
+    merchant whose breaker opens mid-batch has its remaining events parked too.
+    """
+    db = SessionLocal()
+    try:
+        merchant_ids = {uuid.UUID(str(d[0])) for d in deliveries}
+        merchants = {
+            str(m.id): m for m in
+            db.query(models.Merchant).filter(models.Merchant.id.in_(merchant_ids)).all()
+        }
+        finished_batches = set()
+
+        with WebhookLogWriter(db) as writer:
+            def park(merchant, event, payload, attempt, log_id, delay):
+                is_new = log_id is None
+                log_uuid = uuid.uuid4() if is_new else uuid.UUID(str(log_id))
+                writer.record(log_uuid, merchant.id, event, payload, parked_attempt_values(attempt, delay), is_new)
+
+            by_merchant = {}
+            for merchant_id, event, payload, attempt, *rest in deliveries:
+                merchant = merchants.get(str(merchant_id))
+                log_id = rest[0] if rest else None
+                if not merchant or not merchant.webhook_url:
+                    # A claimed row would otherwise be re-leased forever
+                    if log_id is not None:
+                        writer.record(uuid.UUID(str(log_id)), merchant_id, event, None, undeliverable_values(), is_new=False)
+                    continue
+                # First attempts relayed from the outbox: batch-mode merchants buffer them
+                if merchant.webhook_batch_enabled and event != webhook_batching.BATCH_EVENT and log_id is None:
+                    try:
+                        queue_for_batch(merchant, event, payload)
+                        continue
+                    except redis.RedisError:
+                        pass
+                by_merchant.setdefault(str(merchant.id), []).append((event, payload, attempt, log_id))
+
+            # One breaker decision per merchant: open merchants are parked, a half-open
+            # merchant gets a single probe and the rest of its events wait for the verdict
+            jobs, slots = [], {}
+            for key, items in by_merchant.items():
+                merchant = merchants[key]
+                breaker = circuit_breaker.check(merchant.id)
+                if breaker == circuit_breaker.OPEN:
+                    delay = circuit_breaker.reopens_in(merchant.id) or webhooks.WEBHOOK_TIMEOUT
+                    for item in items:
+                        park(merchant, *item, delay)
+                    continue
+                probe = breaker == circuit_breaker.PROBE
+                granted = webhooks.acquire_merchant_slots(key, 1 if probe else min(len(items), webhooks.WEBHOOK_MERCHANT_CONCURRENCY))
+                share = 0 if not granted else 1 if probe else granted * webhooks.WEBHOOK_BATCH_MERCHANT_ROUNDS
+                if granted:
+                    slots[key] = granted
+                for event, payload, attempt, log_id in items[:share]:
+                    signature = generate_webhook_signature(payload, merchant.webhook_secret or "whsec_test_abc123")
+                    jobs.append((merchant, event, payload, attempt, signature, log_id, probe))
+                # Parked behind a probe: retry shortly after its verdict is in
+                delay = webhooks.WEBHOOK_TIMEOUT if probe else webhooks.WEBHOOK_FAIRNESS_DEFER
+                for item in items[share:]:
+                    park(merchant, *item, delay)
+
+            halted = set()
+
+            def record(index, result):
+                merchant, event, payload, attempt, signature, log_id, probe = jobs[index]
+                key = str(merchant.id)
+                if result is webhooks.SKIPPED:
+                    park(merchant, event, payload, attempt, log_id,
+                         circuit_breaker.reopens_in(merchant.id) or webhooks.WEBHOOK_TIMEOUT)
+                    return
+                is_new = log_id is None
+                log_uuid = uuid.uuid4() if is_new else uuid.UUID(str(log_id))
+                response = None if isinstance(result, Exception) else result
+                latency = response.elapsed.total_seconds() if response is not None else webhooks.WEBHOOK_TIMEOUT
+                reopens_in = circuit_breaker.record_result(
+                    merchant.id, is_delivered(response), latency, probe=probe
+                )
+                if reopens_in:
+                    halted.add(key)
+                values, _ = webhook_attempt_values(attempt, response, min_delay=reopens_in)
+                writer.record(log_uuid, merchant.id, event, payload, values, is_new)
+                if batch_finished(event, values):
+                    finished_batches.add(key)
+
+            try:
+                webhooks.run_deliveries(
+                    [(str(merchant.id), merchant.webhook_url, payload, signature)
+                     for merchant, event, payload, attempt, signature, log_id, probe in jobs],
+                    limits=slots, halted=halted, on_result=record
+                )
+            finally:
+                for key, count in slots.items():
+                    webhooks.release_merchant_slots(key, count)
+
+        # Only after the writer has committed, so the flush no longer sees them pending
+        for merchant_id in finished_batches:
+            flush_webhook_batch_job.delay(merchant_id)
+    finally:
+        db.close()
+
+# Durable retry scheduling: due retries live in webhook_logs (status='pending',
+# next_retry_at <= now, served by idx_webhook_logs_next_retry) rather than as
+# delayed broker messages. Claims use SKIP LOCKED so any number of workers can poll.
+WEBHOOK_RETRY_BATCH_SIZE = int(os.getenv("WEBHOOK_RETRY_BATCH_SIZE", 500))
+WEBHOOK_RETRY_MAX_BATCHES = int(os.getenv("WEBHOOK_RETRY_MAX_BATCHES", 20))
+# A claimed row becomes due again after the lease if its delivery never reports back
+WEBHOOK_RETRY_LEASE = int(os.getenv("WEBHOOK_RETRY_LEASE", 300))
+
+# Per claim, no merchant gets more than this many retries, so one dead endpoint's
+# backlog cannot fill every batch while other merchants' retries wait
+WEBHOOK_RETRY_MERCHANT_CAP = int(os.getenv("WEBHOOK_RETRY_MERCHANT_CAP", 50))
+# The cap is applied to the earliest (batch size x this) due rows only, so a deep
+# backlog costs one bounded index scan per claim instead of ranking every due row
+WEBHOOK_RETRY_SCAN_FACTOR = int(os.getenv("WEBHOOK_RETRY_SCAN_FACTOR", 10))
+
+def claim_due_webhook_retries(db, limit: int):
+    now = datetime.utcnow()
+    due = (
+        models.WebhookLog.status == "pending",
+        models.WebhookLog.next_retry_at <= now
+    )
+    window = select(
+        models.WebhookLog.id, models.WebhookLog.merchant_id, models.WebhookLog.next_retry_at
+    ).where(*due).order_by(models.WebhookLog.next_retry_at).limit(limit * WEBHOOK_RETRY_SCAN_FACTOR).subquery()
+    ranked = select(
+        window.c.id,
+        func.row_number().over(
+            partition_by=window.c.merchant_id,
+            order_by=window.c.next_retry_at
+        ).label("merchant_rank")
+    ).subquery()
+    fair_ids = select(ranked.c.id).where(ranked.c.merchant_rank <= WEBHOOK_RETRY_MERCHANT_CAP)
+
+    logs = db.query(models.WebhookLog).filter(
+        *due, models.WebhookLog.id.in_(fair_ids)
+    ).order_by(models.WebhookLog.next_retry_at).limit(limit).with_for_update(skip_locked=True).all()
+
+    deliveries = []
+    for log in logs:
+        log.next_retry_at = now + timedelta(seconds=WEBHOOK_RETRY_LEASE)
+        deliveries.append([str(log.merchant_id), log.event, log.payload, (log.attempts or 0) + 1, str(log.id)])
+    db.commit()
+    return deliveries
+
+@celery_app.task(name="app.tasks.dispatch_webhook_retries")
+def dispatch_webhook_retries_job():
+    db = SessionLocal()
+    try:
+        for _ in range(WEBHOOK_RETRY_MAX_BATCHES):
+            deliveries = claim_due_webhook_retries(db, WEBHOOK_RETRY_BATCH_SIZE)
+            if deliveries:
+                deliver_webhook_batch_job.delay(deliveries)
+            if len(deliveries) < WEBHOOK_RETRY_BATCH_SIZE:
+                break
+    finally:
+        db.close()
+
+@celery_app.task(name="app.tasks.relay_outbox")
+def relay_outbox_job():
+    return outbox.relay_pending()
+
+@celery_app.task(name="app.tasks.sweep_idempotency_keys")
+def sweep_idempotency_keys_job():
+    db = SessionLocal()
+    try:
+        if models.IDEMPOTENCY_PARTITIONED:
+            # A failed partition step must not stop the row sweep below
+            try:
+                maintenance.ensure_idempotency_partitions(db)
+                dropped = maintenance.drop_expired_idempotency_partitions(db)
+                if dropped:
+                    print(f"Dropped expired idempotency partitions: {', '.join(dropped)}")
+            except Exception as e:
+                db.rollback()
+                print(f"Idempotency partition maintenance failed: {e}")
+
+        stats = maintenance.sweep_expired_idempotency_keys(db)
+        if db.bind.dialect.name == "postgresql":
+            stats.update(maintenance.idempotency_table_size(db))
+        if stats["purged"]:
+            print(f"Purged {stats['purged']} expired idempotency keys ({stats['purged_per_second']}/s)")
+        return stats
     finally:
         db.close()
 
@@ -131,37 +472,65 @@ def process_refund_job(refund_id: str):
     try:
         # 1. Fetch refund record
         refund = db.query(models.Refund).filter(models.Refund.id == refund_id).first()
-        if not refund:
+        if not refund or refund.status != "pending":
             return
 
         # 2. Verify payment state: Must be 'success' to be refundable
         payment = db.query(models.Payment).filter(models.Payment.id == refund.payment_id).first()
         if not payment or payment.status != "success":
             refund.status = "failed"
+            if payment:
+                # Give the reserved amount back (see create_refund)
+                db.execute(
+                    update(models.Payment)
+                    .where(models.Payment.id == payment.id)
+                    .values(refunded_amount=models.Payment.refunded_amount - refund.amount)
+                    .execution_options(synchronize_session=False)
+                )
             db.commit()
             return
+    finally:
+        db.close()
 
-        # 3. Simulate refund processing delay (3-5 seconds)
-        time.sleep(random.randint(3, 5))
+    # 3. Schedule completion after the simulated processing delay (3-5 seconds)
+    complete_refund_job.apply_async(args=[refund_id], countdown=random.randint(3, 5))
+
+@celery_app.task(name="app.tasks.complete_refund")
+def complete_refund_job(refund_id: str):
+    db = SessionLocal()
+    try:
+        # 4. Claim the refund in one statement (status + timestamp); duplicate runs
+        # of this task find it already processed and do nothing
+        claimed = db.execute(
+            update(models.Refund)
+            .where(models.Refund.id == refund_id, models.Refund.status == "pending")
+            .values(status="processed", processed_at=datetime.utcnow())
+            .returning(models.Refund.id)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if claimed is None:
+            db.rollback()
+            return
+        refund = db.query(models.Refund).filter(models.Refund.id == refund_id).first()
+        # Completions of the same payment serialize on its row: once the lock is held,
+        # the SUM below (a new statement, so a fresh snapshot) sees every refund that
+        # a concurrent run has committed
+        payment = db.query(models.Payment).filter(
+            models.Payment.id == refund.payment_id
+        ).with_for_update().first()
 
-        # 4. Update refund status and timestamps
-        refund.status = "processed"
-        refund.processed_at = datetime.utcnow()
-        
-        # 5. Calculate total refunded to handle partial/full refund logic
-        all_processed_refunds = db.query(models.Refund).filter(
+        # 5. Total processed so far, this refund included
+        total_refunded = db.query(func.coalesce(func.sum(models.Refund.amount), 0)).filter(
             models.Refund.payment_id == payment.id,
             models.Refund.status == "processed"
-        ).all()
-        total_refunded = sum(r.amount for r in all_processed_refunds)
+        ).scalar()
 
         # 6. Update payment record if fully refunded
-        if total_refunded >= payment.amount:
+        fully_refunded = payment.status == "success" and total_refunded >= payment.amount
+        if fully_refunded:
             payment.status = "refunded"
-            
-        db.commit()
 
-        # 7. Enqueue webhook delivery for 'refund.processed' event
+        # 7. Enqueue webhook delivery for 'refund.processed' event (with the commit below)
         webhook_payload = {
             "event": "refund.processed",
             "timestamp": int(time.time()),
@@ -175,6 +544,9 @@ def process_refund_job(refund_id: str):
                 }
             }
         }
-        deliver_webhook_job.delay(refund.merchant_id, "refund.processed", webhook_payload)
+        outbox.enqueue(db, deliver_webhook_job.name, str(refund.merchant_id), "refund.processed", webhook_payload)
+        db.commit()
+        if fully_refunded:
+            crud.record_payment_refunded(payment.merchant_id, payment.amount)
     finally:
         db.close()
\ No newline at end of file
@@ -1,8 +1,76 @@
-import secrets
+import os
+import time
 import string
+import threading
+
+ID_LENGTH = 16
+ALPHABET = string.ascii_letters + string.digits
+# Same 62 characters in byte order, so time-prefixed IDs sort chronologically
+SORTABLE_ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+# "sortable" makes generate_custom_id emit time-ordered IDs (append-mostly B-tree inserts)
+ID_STRATEGY = os.getenv("ID_STRATEGY", "random").lower()
+
+# Map random bytes straight onto the alphabet with bytes.translate. Bytes >= 248
+# (the largest multiple of 62 that fits in a byte) are dropped to avoid modulo bias.
+_ACCEPT_BELOW = 256 - (256 % len(ALPHABET))
+_REJECTED = bytes(range(_ACCEPT_BELOW, 256))
+
+def _translation(alphabet: str) -> bytes:
+    return bytes(ord(alphabet[b % len(alphabet)]) for b in range(256))
+
+_TABLES = {ALPHABET: _translation(ALPHABET), SORTABLE_ALPHABET: _translation(SORTABLE_ALPHABET)}
+
+# Characters are pre-drawn in blocks: one os.urandom call serves many IDs
+_BLOCK_SIZE = 4096
+_lock = threading.Lock()
+_pool = b""
+_pool_pos = 0
+_pool_pid = None
+
+def _random_chars(n: int) -> bytes:
+    """n unbiased characters from ALPHABET."""
+    global _pool, _pool_pos, _pool_pid
+    with _lock:
+        # A forked child must never reuse the parent's pre-drawn bytes
+        if _pool_pid != os.getpid():
+            _pool, _pool_pos, _pool_pid = b"", 0, os.getpid()
+        while len(_pool) - _pool_pos < n:
+            fresh = os.urandom(max(_BLOCK_SIZE, n * 2)).translate(_TABLES[ALPHABET], _REJECTED)
+            _pool = _pool[_pool_pos:] + fresh
+            _pool_pos = 0
+        chunk = _pool[_pool_pos:_pool_pos + n]
+        _pool_pos += n
+        return chunk
+
+# ALPHABET characters re-mapped position-for-position onto SORTABLE_ALPHABET
+_TO_SORTABLE = bytes.maketrans(ALPHABET.encode(), SORTABLE_ALPHABET.encode())
+
+def generate_random_id(prefix: str) -> str:
+    """Prefix followed by 16 uniformly random alphanumeric characters."""
+    return f"{prefix}{_random_chars(ID_LENGTH).decode()}"
+
+def generate_sortable_id(prefix: str) -> str:
+    """
+    Prefix followed by 16 characters: 7 of millisecond timestamp (base62, good
+    until ~2081) then 9 random. Consecutive IDs share a left edge in the index.
+    """
+    ms = int(time.time() * 1000)
+    stamp = []
+    for _ in range(7):
+        ms, rem = divmod(ms, 62)
+        stamp.append(SORTABLE_ALPHABET[rem])
+    random_part = _random_chars(ID_LENGTH - 7).translate(_TO_SORTABLE).decode()
+    return f"{prefix}{''.join(reversed(stamp))}{random_part}"
 
 def generate_custom_id(prefix: str) -> str:
     """Generates a prefix followed by exactly 16 alphanumeric characters."""
-    alphabet = string.ascii_letters + string.digits
-    unique_part = ''.join(secrets.choice(alphabet) for _ in range(16))
-    return f"{prefix}{unique_part}"
\ No newline at end of file
+    if ID_STRATEGY == "sortable":
+        return generate_sortable_id(prefix)
+    return generate_random_id(prefix)
+
+def generate_custom_ids(prefix: str, count: int) -> list:
+    """Batch variant of generate_custom_id for bulk inserts."""
+    if ID_STRATEGY == "sortable":
+        return [generate_sortable_id(prefix) for _ in range(count)]
+    chars = _random_chars(ID_LENGTH * count).decode()
+    return [f"{prefix}{chars[i:i + ID_LENGTH]}" for i in range(0, len(chars), ID_LENGTH)]
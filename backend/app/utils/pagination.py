@@ -0,0 +1,43 @@
+import base64
+from datetime import datetime
+from sqlalchemy import tuple_
+
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(created_at: datetime, row_id) -> str:
+    """Opaque cursor pointing at the last row of a page, keyed on (created_at, id)."""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    """Reverses encode_cursor. Raises ValueError on malformed input."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), row_id
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+def keyset_paginate(stmt, model, cursor=None, limit: int = 10):
+    """
+    Orders a Query/Select newest-first on (created_at, id) and seeks past the cursor.
+    Fetches one extra row so the caller can tell whether another page exists.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        # Cursor ids are strings; coerce to the column's type (e.g. UUID for webhook_logs)
+        row_id = model.id.type.python_type(row_id)
+        stmt = stmt.where(tuple_(model.created_at, model.id) < tuple_(created_at, row_id))
+    return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+def split_page(rows, limit: int):
+    """Returns (rows for this page, cursor for the next page or None)."""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.created_at, last.id)
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
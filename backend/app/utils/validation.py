@@ -1,7 +1,21 @@
+import os
 import re
+import csv
+from bisect import bisect_right
 from datetime import datetime
 
-import re
+try:
+    import numpy as np
+except ImportError: # Optional: only used to vectorise batch Luhn checks
+    np = None
+
+# Regex: Alphanumeric (including . -) before @, and alphabetic after @
+# Standard length: 2-256 chars for username, 2-64 for handle
+VPA_PATTERN = re.compile(r"^[a-zA-Z0-9.-]{2,256}@[a-zA-Z]{2,64}$")
+# ASCII only: \D and str.isdigit() also accept other scripts' digits (e.g. "١٢٣")
+_NON_DIGITS = re.compile(r"[^0-9]")
+# Luhn contribution of a doubled digit: 2*d, minus 9 when that exceeds 9
+_LUHN_DOUBLED = (0, 2, 4, 6, 8, 1, 3, 5, 7, 9)
 
 def validate_vpa(vpa: str) -> bool:
     """
@@ -10,62 +24,117 @@ def validate_vpa(vpa: str) -> bool:
     """
     if not vpa or "@" not in vpa:
         return False
-    
-    # Regex: Alphanumeric (including . -) before @, and alphabetic after @
-    # Standard length: 2-256 chars for username, 2-64 for handle
-    vpa_regex = r"^[a-zA-Z0-9.-]{2,256}@[a-zA-Z]{2,64}$"
-    return bool(re.match(vpa_regex, vpa))
+    return VPA_PATTERN.match(vpa) is not None
+
+def _digits_only(card_number: str) -> str:
+    if card_number.isascii() and card_number.isdigit():
+        return card_number
+    return _NON_DIGITS.sub("", card_number)
+
+def _luhn_ok(digits: str) -> bool:
+    # Walk from the check digit leftwards, doubling every second digit
+    total = 0
+    double = False
+    for ch in reversed(digits):
+        d = ord(ch) - 48
+        total += _LUHN_DOUBLED[d] if double else d
+        double = not double
+    return total % 10 == 0
 
 def validate_luhn(card_number: str) -> bool:
     """Implements the mathematical Mod 10 Luhn check."""
-    # Remove any non-digit characters
-    card_number = "".join(filter(str.isdigit, card_number))
-    
-    if not card_number or not (13 <= len(card_number) <= 19):
+    digits = _digits_only(card_number)
+    if not (13 <= len(digits) <= 19):
         return False
+    return _luhn_ok(digits)
 
-    # Convert to list of integers
-    digits = [int(d) for d in card_number]
-    
-    # Luhn logic: reverse and double every second digit
-    # We start from the right (check digit) and move left
-    check_digits = digits[::-1]
-    for i in range(1, len(check_digits), 2):
-        check_digits[i] *= 2
-        if check_digits[i] > 9:
-            check_digits[i] -= 9
-            
-    return sum(check_digits) % 10 == 0
+# --- BIN/IIN range table ---
+# Ranges are widened to IIN_WIDTH digits and flattened into sorted, non-overlapping
+# intervals, so a lookup is one bisect instead of a chain of prefix comparisons.
+IIN_WIDTH = 8
+DEFAULT_BIN_TABLE_PATH = os.path.join(os.path.dirname(__file__), "bin_ranges.csv")
 
+class BinTable:
+    def __init__(self, ranges):
+        """ranges: iterable of (start_prefix, end_prefix, network) strings."""
+        spans = []
+        for start_prefix, end_prefix, network in ranges:
+            width = len(start_prefix)
+            lo = int(start_prefix.ljust(IIN_WIDTH, "0"))
+            hi = int(end_prefix.ljust(IIN_WIDTH, "9"))
+            spans.append((lo, hi, width, network))
 
+        # Split at every boundary and keep the most specific network per segment
+        points = sorted({lo for lo, _, _, _ in spans} | {hi + 1 for _, hi, _, _ in spans})
+        self._starts, self._ends, self._networks, self._widths = [], [], [], []
+        for lo, next_lo in zip(points, points[1:]):
+            covering = [(width, network) for s_lo, s_hi, width, network in spans if s_lo <= lo <= s_hi]
+            if not covering:
+                continue
+            width, network = max(covering)
+            if (self._networks and self._networks[-1] == network
+                    and self._widths[-1] == width and self._ends[-1] == lo - 1):
+                self._ends[-1] = next_lo - 1
+            else:
+                self._starts.append(lo)
+                self._ends.append(next_lo - 1)
+                self._networks.append(network)
+                self._widths.append(width)
+
+    @classmethod
+    def from_file(cls, path: str):
+        with open(path, newline="") as f:
+            rows = [row for row in csv.reader(f) if row and not row[0].startswith("#")]
+        return cls((start.strip(), end.strip(), network.strip()) for start, end, network in rows)
+
+    def lookup(self, digits: str) -> str:
+        if not digits:
+            return "unknown"
+        iin = int(digits[:IIN_WIDTH].ljust(IIN_WIDTH, "0"))
+        i = bisect_right(self._starts, iin) - 1
+        # Numbers shorter than the matching prefix cannot be classified yet
+        if i >= 0 and iin <= self._ends[i] and len(digits) >= self._widths[i]:
+            return self._networks[i]
+        return "unknown"
+
+bin_table = BinTable.from_file(os.getenv("CARD_BIN_TABLE_PATH", DEFAULT_BIN_TABLE_PATH))
 
 def detect_card_network(card_number: str) -> str:
     """Detects card brand based on leading digits (IIN/BIN)."""
-    # Clean the input
-    n = "".join(filter(str.isdigit, card_number))
-    if not n:
-        return "unknown"
-        
-    # Visa: Starts with 4
-    if n.startswith('4'):
-        return "visa"
-    
-    # Mastercard: 51–55 OR 2221–2720
-    prefix2 = int(n[:2]) if len(n) >= 2 else 0
-    prefix4 = int(n[:4]) if len(n) >= 4 else 0
-    
-    if (51 <= prefix2 <= 55) or (2221 <= prefix4 <= 2720):
-        return "mastercard"
-        
-    # Amex: 34 or 37
-    if prefix2 in [34, 37]:
-        return "amex"
-        
-    # RuPay: 60, 65, or 81–89
-    if prefix2 in [60, 65] or (81 <= prefix2 <= 89):
-        return "rupay"
-        
-    return "unknown"
+    return bin_table.lookup(_digits_only(card_number))
+
+# --- Batch API ---
+def luhn_batch(card_numbers) -> list:
+    """Luhn results for many numbers; vectorised per card length when NumPy is available."""
+    cleaned = [_digits_only(n) for n in card_numbers]
+    results = [False] * len(cleaned)
+    if np is None:
+        for i, digits in enumerate(cleaned):
+            results[i] = 13 <= len(digits) <= 19 and _luhn_ok(digits)
+        return results
+
+    by_length = {}
+    for i, digits in enumerate(cleaned):
+        if 13 <= len(digits) <= 19:
+            by_length.setdefault(len(digits), []).append(i)
+
+    doubled = np.array(_LUHN_DOUBLED, dtype=np.int64)
+    for length, indices in by_length.items():
+        raw = "".join(cleaned[i] for i in indices).encode()
+        matrix = (np.frombuffer(raw, dtype=np.uint8).reshape(len(indices), length) - 48)[:, ::-1].astype(np.int64)
+        matrix[:, 1::2] = doubled[matrix[:, 1::2]]
+        ok = matrix.sum(axis=1) % 10 == 0
+        for i, valid in zip(indices, ok.tolist()):
+            results[i] = valid
+    return results
+
+def validate_cards_batch(card_numbers) -> list:
+    """Validates and classifies many card numbers at once: [{"valid": bool, "network": str}, ...]."""
+    valid = luhn_batch(card_numbers)
+    return [
+        {"valid": ok, "network": bin_table.lookup(_digits_only(n))}
+        for n, ok in zip(card_numbers, valid)
+    ]
 
 def validate_expiry(month, year):
     """Checks if the card expiry date is valid and in the future."""
@@ -93,4 +162,10 @@ def validate_expiry(month, year):
             
         return True
     except (ValueError, TypeError):
-        return False
\ No newline at end of file
+        return False
+
+def describe_validation_error(exc) -> str:
+    """Flattens the first error of a pydantic ValidationError into 'field: message'."""
+    err = exc.errors()[0]
+    field = ".".join(str(part) for part in err.get("loc", ()))
+    return f"{field}: {err['msg']}" if field else err["msg"]
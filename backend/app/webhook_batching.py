@@ -0,0 +1,41 @@
+import json
+from .redis_client import redis_client
+
+# Per-merchant event buffers for webhook batch mode.
+# Events are appended in the order they were produced, so a batch preserves
+# the per-payment ordering (payment.created -> payment.success -> refund.processed).
+# Batches are delivered one at a time per merchant: the next one is only taken off
+# the buffer once the previous batch is delivered or has used up its retries.
+BATCH_EVENT = "webhook.batch"
+FLUSH_LOCK_TTL = 30
+
+def _buffer_key(merchant_id) -> str:
+    return f"webhook_batch:{merchant_id}"
+
+def _flush_lock_key(merchant_id) -> str:
+    return f"webhook_batch_flush:{merchant_id}"
+
+def acquire_flush_lock(merchant_id) -> bool:
+    """Only one flush per merchant at a time may check for and start the next batch."""
+    return bool(redis_client.set(_flush_lock_key(merchant_id), 1, nx=True, ex=FLUSH_LOCK_TTL))
+
+def release_flush_lock(merchant_id):
+    redis_client.delete(_flush_lock_key(merchant_id))
+
+def buffer_event(merchant_id, event: str, payload) -> int:
+    """Appends an event to the merchant's buffer and returns the new buffer length."""
+    item = json.dumps({"event": event, "payload": payload}, separators=(',', ':'))
+    return redis_client.rpush(_buffer_key(merchant_id), item)
+
+def pop_batch(merchant_id, max_events: int):
+    """
+    Atomically takes up to `max_events` of the oldest buffered events.
+    Returns (events, number still buffered).
+    """
+    key = _buffer_key(merchant_id)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.lrange(key, 0, max_events - 1)
+    pipe.ltrim(key, max_events, -1)
+    pipe.llen(key)
+    items, _, remaining = pipe.execute()
+    return [json.loads(item) for item in items], remaining
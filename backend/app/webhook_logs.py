@@ -0,0 +1,67 @@
+import time
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from . import models
+
+class WebhookLogWriter:
+    """
+    Buffers webhook_logs writes and flushes them in bulk (one executemany per
+    statement type, one commit) once `max_rows` are queued or `max_delay`
+    seconds have passed since the first buffered row.
+
+    The first attempt of a delivery inserts its row; retries update the same row.
+    """
+
+    def __init__(self, db: Session, max_rows: int = 500, max_delay: float = 1.0):
+        self.db = db
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.commits = 0
+        self.rows_written = 0
+        self._inserts = []
+        self._updates = []
+        self._first_buffered_at = None
+
+    def record(self, log_id, merchant_id, event: str, payload: dict, values: dict, is_new: bool):
+        if is_new:
+            self._inserts.append({
+                "id": log_id, "merchant_id": merchant_id,
+                "event": event, "payload": payload, **values
+            })
+        else:
+            self._updates.append({"id": log_id, **values})
+
+        if self._first_buffered_at is None:
+            self._first_buffered_at = time.monotonic()
+        if self.pending >= self.max_rows or time.monotonic() - self._first_buffered_at >= self.max_delay:
+            self.flush()
+
+    @property
+    def pending(self) -> int:
+        return len(self._inserts) + len(self._updates)
+
+    def flush(self):
+        if not self.pending:
+            return
+        if self._inserts:
+            self.db.execute(insert(models.WebhookLog), self._inserts)
+        if self._updates:
+            self.db.execute(update(models.WebhookLog), self._updates)
+        self.db.commit()
+
+        self.commits += 1
+        self.rows_written += self.pending
+        self._inserts, self._updates = [], []
+        self._first_buffered_at = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+def save_webhook_attempt(db: Session, log_id, merchant_id, event: str, payload: dict, values: dict, is_new: bool):
+    """Unbuffered variant: writes one attempt as a single statement and commit."""
+    with WebhookLogWriter(db, max_rows=1) as writer:
+        writer.record(log_id, merchant_id, event, payload, values, is_new)
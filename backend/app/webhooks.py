@@ -0,0 +1,165 @@
+import os
+import asyncio
+import threading
+from collections import defaultdict
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from redis.exceptions import RedisError
+from .redis_client import redis_client
+
+# Webhook HTTP transport shared by the Celery webhook tasks.
+# Connections are kept alive per host, so repeated events to the same merchant
+# endpoint skip the TCP/TLS handshake.
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", 5))
+WEBHOOK_POOL_HOSTS = int(os.getenv("WEBHOOK_POOL_HOSTS", 100))
+WEBHOOK_POOL_SIZE_PER_HOST = int(os.getenv("WEBHOOK_POOL_SIZE_PER_HOST", 10))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 200))
+WEBHOOK_MERCHANT_CONCURRENCY = int(os.getenv("WEBHOOK_MERCHANT_CONCURRENCY", 5))
+# Fairness across the webhook workers: at most this many deliveries per merchant
+# in flight at once; extra ones are deferred instead of occupying a worker slot
+WEBHOOK_MERCHANT_INFLIGHT = int(os.getenv("WEBHOOK_MERCHANT_INFLIGHT", 4))
+WEBHOOK_FAIRNESS_DEFER = float(os.getenv("WEBHOOK_FAIRNESS_DEFER", 2))
+# A batch task sends at most (granted slots x this) events per merchant, so a dead
+# endpoint holds it for a few timeouts, well inside the retry lease
+WEBHOOK_BATCH_MERCHANT_ROUNDS = int(os.getenv("WEBHOOK_BATCH_MERCHANT_ROUNDS", 4))
+# Slots held by a crashed worker free themselves once the key expires
+SLOT_TTL = int(WEBHOOK_TIMEOUT * (WEBHOOK_BATCH_MERCHANT_ROUNDS + 1)) + 1
+
+def webhook_headers(signature: str) -> dict:
+    return {
+        "Content-Type": "application/json",
+        "X-Webhook-Signature": signature
+    }
+
+def acquire_merchant_slots(merchant_id: str, wanted: int) -> int:
+    """Claims up to `wanted` of the merchant's in-flight slots; returns how many it got."""
+    key = f"webhooks:inflight:{merchant_id}"
+    try:
+        pipe = redis_client.pipeline()
+        pipe.incrby(key, wanted)
+        # NX: the TTL is set when the key is created, not pushed out by every acquire
+        pipe.expire(key, SLOT_TTL, nx=True)
+        in_flight, _ = pipe.execute()
+        excess = min(max(in_flight - WEBHOOK_MERCHANT_INFLIGHT, 0), wanted)
+        if excess:
+            redis_client.decrby(key, excess)
+        return wanted - excess
+    except RedisError:
+        return wanted # No fairness bookkeeping is better than no deliveries
+
+def release_merchant_slots(merchant_id: str, count: int):
+    key = f"webhooks:inflight:{merchant_id}"
+    try:
+        if redis_client.decrby(key, count) < 0:
+            # The slot outlived its key; never leave a negative, TTL-less counter behind
+            redis_client.delete(key)
+    except RedisError:
+        pass
+
+def acquire_merchant_slot(merchant_id: str) -> bool:
+    """Claims one of the merchant's in-flight slots; True when it may send now."""
+    return acquire_merchant_slots(merchant_id, 1) == 1
+
+def release_merchant_slot(merchant_id: str):
+    release_merchant_slots(merchant_id, 1)
+
+# --- Sync path (one delivery per task) ---
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """Process-wide keep-alive session, rebuilt after fork so pools are never shared."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=WEBHOOK_POOL_HOSTS, pool_maxsize=WEBHOOK_POOL_SIZE_PER_HOST)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+def post_webhook(url: str, payload: dict, signature: str):
+    return get_http_session().post(url, json=payload, headers=webhook_headers(signature), timeout=WEBHOOK_TIMEOUT)
+
+# --- Async path (many in-flight deliveries per worker slot) ---
+SKIPPED = object() # send_many result for a delivery that was never sent
+class WebhookDispatcher:
+    """
+    Sends webhooks concurrently over a shared httpx connection pool.
+    Each merchant is capped at `merchant_concurrency` in-flight requests so one
+    slow endpoint cannot take every connection.
+    """
+
+    def __init__(self, max_connections: int = WEBHOOK_MAX_CONNECTIONS,
+                 merchant_concurrency: int = WEBHOOK_MERCHANT_CONCURRENCY,
+                 timeout: float = WEBHOOK_TIMEOUT):
+        self.max_connections = max_connections
+        self.merchant_concurrency = merchant_concurrency
+        self.timeout = timeout
+        self._client = None
+        self._semaphores = defaultdict(lambda: asyncio.Semaphore(self.merchant_concurrency))
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    async def send(self, merchant_id: str, url: str, payload: dict, signature: str):
+        async with self._semaphores[merchant_id]:
+            return await self._get_client().post(url, json=payload, headers=webhook_headers(signature))
+
+    async def send_many(self, deliveries, limits=None, halted=(), on_result=None):
+        """
+        deliveries: iterable of (merchant_id, url, payload, signature).
+        Returns results in the same order: the response, the exception a failed send
+        raised, or SKIPPED if the merchant was added to `halted` (e.g. its breaker
+        opened) before the delivery's turn came. `limits` overrides the per-merchant
+        concurrency for this call; `on_result(index, result)` runs as each one finishes.
+        """
+        deliveries = list(deliveries)
+        semaphores = {
+            merchant_id: asyncio.Semaphore(limit) for merchant_id, limit in (limits or {}).items()
+        }
+
+        async def deliver(index, merchant_id, url, payload, signature):
+            async with semaphores.get(merchant_id) or self._semaphores[merchant_id]:
+                if merchant_id in halted:
+                    result = SKIPPED
+                else:
+                    try:
+                        result = await self._get_client().post(url, json=payload, headers=webhook_headers(signature))
+                    except Exception as e:
+                        result = e
+            # Runs before the next waiter for this merchant is scheduled, so it can halt it
+            if on_result is not None:
+                on_result(index, result)
+            return result
+
+        return await asyncio.gather(*(deliver(i, *delivery) for i, delivery in enumerate(deliveries)))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# One event loop and dispatcher per worker process (per thread under the threads
+# pool, since a loop can only run in one thread at a time), reused across tasks so
+# the httpx pool (bound to its loop) keeps its connections warm between batches.
+_local = threading.local()
+
+def run_deliveries(deliveries, **options):
+    """Blocking WebhookDispatcher.send_many on the worker's event loop."""
+    loop = getattr(_local, "loop", None)
+    if loop is None or loop.is_closed() or _local.pid != os.getpid():
+        loop = _local.loop = asyncio.new_event_loop()
+        _local.dispatcher = WebhookDispatcher()
+        _local.pid = os.getpid()
+    return loop.run_until_complete(_local.dispatcher.send_many(deliveries, **options))
@@ -1,7 +1,9 @@
 import os
 from celery import Celery
-
-REDIS_URL = os.getenv("REDIS_URL", "redis://redis_v2:6379/0")
+from celery.signals import worker_process_init
+from .metrics import instrument_celery
+from .job_status import track_job_status
+from .redis_client import REDIS_URL
 
 celery_app = Celery(
     "payment_gateway_v2",
@@ -16,8 +18,59 @@ celery_app.conf.update(
     timezone='UTC',
     enable_utc=True,
     task_acks_late=True,
-    include=['app.tasks']
+    include=['app.tasks'],
+    # Dedicated queues so a webhook backlog (e.g. retries to a dead endpoint) never
+    # sits in front of payment processing. Run a worker per queue group so each gets
+    # its own concurrency and prefetch, e.g.
+    #   celery -A app.worker.celery_app worker -Q payments,refunds,maintenance --beat
+    #   celery -A app.worker.celery_app worker -Q webhooks --prefetch-multiplier=4
+    # Priorities order messages within a queue; on Redis, 0 is served first.
+    task_routes={
+        "app.tasks.process_payment": {"queue": "payments", "priority": 0},
+        "app.tasks.complete_payment": {"queue": "payments", "priority": 0},
+        "app.tasks.process_refund": {"queue": "refunds", "priority": 3},
+        "app.tasks.complete_refund": {"queue": "refunds", "priority": 3},
+        "app.tasks.deliver_webhook": {"queue": "webhooks", "priority": 3},
+        "app.tasks.flush_webhook_batch": {"queue": "webhooks", "priority": 3},
+        "app.tasks.deliver_webhook_batch": {"queue": "webhooks", "priority": 6},
+        "app.tasks.dispatch_webhook_retries": {"queue": "maintenance"},
+        "app.tasks.relay_outbox": {"queue": "maintenance"},
+        "app.tasks.sweep_idempotency_keys": {"queue": "maintenance"},
+    },
+    task_default_priority=5,
+    broker_transport_options={
+        "priority_steps": list(range(10)),
+        "sep": ":",
+        # Queues listed first in -Q are drained first
+        "queue_order_strategy": "priority",
+    },
+    # Short payment tasks should not be reserved behind each other; override per
+    # worker with --prefetch-multiplier
+    worker_prefetch_multiplier=int(os.getenv("CELERY_PREFETCH_MULTIPLIER", 1)),
+    beat_schedule={
+        "dispatch-webhook-retries": {
+            "task": "app.tasks.dispatch_webhook_retries",
+            "schedule": float(os.getenv("WEBHOOK_RETRY_POLL_INTERVAL", 5)),
+        },
+        "relay-outbox": {
+            "task": "app.tasks.relay_outbox",
+            "schedule": float(os.getenv("OUTBOX_RELAY_INTERVAL", 1)),
+        },
+        "sweep-idempotency-keys": {
+            "task": "app.tasks.sweep_idempotency_keys",
+            "schedule": float(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL", 300)),
+        },
+    }
 )
 
+instrument_celery(celery_app)
+track_job_status(celery_app)
+
+@worker_process_init.connect(weak=False)
+def reset_db_pool(**kwargs):
+    # Prefork children must never share the parent's sockets
+    from .database import dispose_after_fork
+    dispose_after_fork()
+
 if __name__ == "__main__":
     celery_app.start()
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+p50/p99 request latency under N concurrent clients: blocking Session vs AsyncSession.
+
+    python -m benchmarks.async_db
+
+Two otherwise identical async routes run the same page query plus a statement that
+keeps the database busy for BENCH_QUERY_MS:
+  blocking - SessionLocal inside `async def`, as the handlers did before the port,
+             so each query stalls the event loop
+  async    - AsyncSessionLocal, as the ported handlers now do
+A third client probes a no-I/O route every 10 ms while the load runs; its p99 shows
+how long the event loop was unavailable to everyone else.
+BENCH_CLIENTS is a comma-separated list of concurrency levels; each client sends
+BENCH_REQUESTS requests back to back over HTTP to one uvicorn server (one event
+loop, as one API worker) running in this process.
+"""
+import time
+import asyncio
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import event, select, text
+from benchmarks.common import MERCHANT_ID, env_int, env_ints, is_postgres, setup_database, serve, latency_summary, print_table
+
+from app import models
+from app.database import engine, async_engine, SessionLocal, AsyncSessionLocal
+
+CLIENTS = env_ints("BENCH_CLIENTS", "1,10,50,100")
+REQUESTS = env_int("BENCH_REQUESTS", 20)
+QUERY_MS = env_int("BENCH_QUERY_MS", 10)
+
+def page_query():
+    return select(models.Refund).where(models.Refund.merchant_id == MERCHANT_ID).limit(10)
+
+# SQLite has no sleep(); give each connection one, so both sessions wait on the
+# database the way they would on a network round trip
+def add_sqlite_sleep(dbapi_connection, connection_record):
+    dbapi_connection.create_function("sleep_ms", 1, lambda ms: time.sleep(ms / 1000))
+
+def slow_statement():
+    """A statement the database spends about QUERY_MS on."""
+    if is_postgres():
+        return text("SELECT pg_sleep(:seconds)").bindparams(seconds=QUERY_MS / 1000)
+    return text("SELECT sleep_ms(:ms)").bindparams(ms=QUERY_MS)
+
+bench_app = FastAPI()
+
+@bench_app.get("/blocking")
+async def blocking():
+    db = SessionLocal()
+    try:
+        rows = db.execute(page_query()).scalars().all()
+        db.execute(slow_statement())
+        return {"count": len(rows)}
+    finally:
+        db.close()
+
+@bench_app.get("/async")
+async def non_blocking():
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(page_query())).scalars().all()
+        await db.execute(slow_statement())
+        return {"count": len(rows)}
+
+@bench_app.get("/live")
+async def live():
+    return {"status": "alive"}
+
+async def load(base_url: str, path: str, clients: int) -> dict:
+    limits = httpx.Limits(max_connections=clients + 1, max_keepalive_connections=clients + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        durations, probes, done = [], [], asyncio.Event()
+
+        async def worker():
+            for _ in range(REQUESTS):
+                started = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                durations.append(time.perf_counter() - started)
+
+        async def probe():
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get("/live")
+                probes.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+
+        prober = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await prober
+
+    summary = latency_summary(durations)
+    return {
+        "mode": path.strip("/"), "clients": clients,
+        "p50_ms": summary["p50_ms"], "p99_ms": summary["p99_ms"],
+        "req_per_s": round(len(durations) / elapsed, 1),
+        "probe_p99_ms": latency_summary(probes)["p99_ms"],
+    }
+
+def main():
+    setup_database()
+    if not is_postgres():
+        event.listen(engine, "connect", add_sqlite_sleep)
+        event.listen(async_engine.sync_engine, "connect", add_sqlite_sleep)
+        # Pooled connections opened by setup_database predate the listener
+        engine.dispose()
+    results = []
+    with serve(bench_app) as base_url:
+        for clients in CLIENTS:
+            for path in ("/blocking", "/async"):
+                results.append(asyncio.run(load(base_url, path, clients)))
+    print_table(results, f"{REQUESTS} requests per client, ~{QUERY_MS} ms of database time per request")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Auth latency with and without the merchant credential cache (auth.merchant_cache).
+
+    python -m benchmarks.auth_cache
+
+BENCH_ITERATIONS calls of get_authenticated_merchant per mode. "uncached" clears
+the cache before every call, so each one queries merchants as it did before the cache.
+"""
+import time
+from benchmarks.common import AUTH_HEADERS, env_int, setup_database, latency_summary, print_table, run
+
+from app import auth
+from app.database import AsyncSessionLocal
+
+ITERATIONS = env_int("BENCH_ITERATIONS", 2000)
+
+async def authenticate(db):
+    return await auth.get_authenticated_merchant(
+        x_api_key=AUTH_HEADERS["X-Api-Key"], x_api_secret=AUTH_HEADERS["X-Api-Secret"], db=db
+    )
+
+async def measure(cached: bool) -> list:
+    durations = []
+    auth.merchant_cache.clear()
+    for _ in range(ITERATIONS):
+        if not cached:
+            auth.merchant_cache.clear()
+        # One session per call, like the request dependency
+        async with AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            await authenticate(db)
+            durations.append(time.perf_counter() - started)
+    return durations
+
+async def main():
+    setup_database()
+    # Warm up the pool and the import-time machinery outside the measurement
+    async with AsyncSessionLocal() as db:
+        await authenticate(db)
+
+    results = []
+    for cached in (False, True):
+        before = auth.merchant_cache.stats()
+        durations = await measure(cached)
+        after = auth.merchant_cache.stats()
+        results.append({
+            "mode": "cached" if cached else "uncached",
+            **latency_summary(durations),
+            "hits": after["hits"] - before["hits"],
+            "misses": after["misses"] - before["misses"],
+        })
+    print_table(results, f"get_authenticated_merchant, {ITERATIONS} calls per mode")
+
+if __name__ == "__main__":
+    run(main())
@@ -0,0 +1,69 @@
+"""
+BENCH_ITEMS single create calls vs one batch call of the same size, for orders and payments.
+
+    python -m benchmarks.batch_create
+
+Single calls go out BENCH_CONCURRENCY at a time (default 1, one after another).
+Against BENCH_BASE_URL this creates real orders and payments for the test merchant.
+"""
+import time
+import asyncio
+from benchmarks.common import AUTH_HEADERS, BASE_URL, env_int, setup_database, client, print_table, run
+
+ITEMS = env_int("BENCH_ITEMS", 1000)
+CONCURRENCY = env_int("BENCH_CONCURRENCY", 1)
+
+def order_item(i: int) -> dict:
+    return {"amount": 50000, "currency": "INR", "receipt": f"bench_{i}"}
+
+def payment_item(order_id: str) -> dict:
+    return {"order_id": order_id, "method": "upi", "vpa": "bench@okhdfc"}
+
+async def post_each(http, path: str, items: list) -> list:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def post(item):
+        async with semaphore:
+            response = await http.post(path, json=item, headers=AUTH_HEADERS)
+            response.raise_for_status()
+            return response.json()
+
+    return await asyncio.gather(*(post(item) for item in items))
+
+async def post_batch(http, path: str, items: list) -> list:
+    response = await http.post(f"{path}/batch", json={"items": items}, headers=AUTH_HEADERS)
+    response.raise_for_status()
+    body = response.json()
+    assert body["failed"] == 0, body
+    return body["data"]
+
+def row(kind: str, mode: str, requests: int, elapsed: float) -> dict:
+    return {
+        "resource": kind, "mode": mode, "items": ITEMS, "requests": requests,
+        "seconds": round(elapsed, 3), "items_per_s": round(ITEMS / elapsed, 1),
+    }
+
+async def main():
+    if not BASE_URL:
+        setup_database()
+    results = []
+    async with client(timeout=300) as http:
+        started = time.perf_counter()
+        orders = await post_each(http, "/api/v1/orders", [order_item(i) for i in range(ITEMS)])
+        results.append(row("orders", "single", ITEMS, time.perf_counter() - started))
+
+        started = time.perf_counter()
+        await post_each(http, "/api/v1/payments", [payment_item(order["id"]) for order in orders])
+        results.append(row("payments", "single", ITEMS, time.perf_counter() - started))
+
+        started = time.perf_counter()
+        created = await post_batch(http, "/api/v1/orders", [order_item(i) for i in range(ITEMS)])
+        results.append(row("orders", "batch", 1, time.perf_counter() - started))
+
+        started = time.perf_counter()
+        await post_batch(http, "/api/v1/payments", [payment_item(item["order"]["id"]) for item in created])
+        results.append(row("payments", "batch", 1, time.perf_counter() - started))
+    print_table(results, f"{ITEMS} items, single calls {CONCURRENCY} at a time")
+
+if __name__ == "__main__":
+    run(main())
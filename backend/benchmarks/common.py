@@ -0,0 +1,115 @@
+import os
+import sys
+import uuid
+import time
+import socket
+import asyncio
+import tempfile
+import threading
+import contextlib
+
+# Same setup as tests/conftest.py: a throwaway SQLite database unless
+# BENCH_DATABASE_URL points at Postgres. Import this module before anything from app.
+_tmpdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{_tmpdir}/bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from app.database import Base, engine, SessionLocal, async_engine
+from app import models
+
+MERCHANT_ID = uuid.UUID("550e8400-e29b-41d4-a716-446655440000")
+AUTH_HEADERS = {"X-Api-Key": "key_test_abc123", "X-Api-Secret": "secret_test_xyz789"}
+# A running API (e.g. the docker-compose stack) instead of the app in-process
+BASE_URL = os.getenv("BENCH_BASE_URL")
+
+def env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+def env_ints(name: str, default: str) -> list:
+    return [int(value) for value in os.getenv(name, default).split(",")]
+
+def setup_database(webhook_url: str = None):
+    """Recreates every table and seeds the test merchant. Point BENCH_DATABASE_URL at a scratch database."""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(models.Merchant(
+        id=MERCHANT_ID, name="Test Merchant", email="test@example.com",
+        api_key="key_test_abc123", api_secret="secret_test_xyz789",
+        webhook_url=webhook_url, webhook_secret="whsec_test_abc123"
+    ))
+    db.commit()
+    db.close()
+
+def is_postgres() -> bool:
+    return engine.dialect.name == "postgresql"
+
+def client(**options) -> httpx.AsyncClient:
+    """Client for BENCH_BASE_URL, or for the app in-process (no lifespan, so setup_database first)."""
+    if BASE_URL:
+        return httpx.AsyncClient(base_url=BASE_URL, **options)
+    from app.main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", **options)
+
+@contextlib.contextmanager
+def serve(asgi_app):
+    """
+    Runs an ASGI app under uvicorn on a background thread (its own event loop) and
+    yields its base URL. Clients then time real HTTP requests, including any wait
+    for a server whose loop is blocked.
+    """
+    import uvicorn
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+def run(coroutine):
+    """asyncio.run that also drops the async pool, whose connections belong to that loop."""
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def latency_summary(seconds) -> dict:
+    """count, mean, p50, p99 and max of a list of durations, in milliseconds."""
+    samples = [s * 1000 for s in seconds]
+    return {
+        "count": len(samples),
+        "mean_ms": round(sum(samples) / len(samples), 3) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "max_ms": round(max(samples), 3) if samples else 0.0,
+    }
+
+def print_table(rows: list, title: str = None):
+    """Prints a list of dicts as an aligned text table (keys of the first row as columns)."""
+    if title:
+        print(f"\n{title}")
+    if not rows:
+        print("(no results)")
+        return
+    columns = list(rows[0])
+    widths = {c: max(len(str(c)), *(len(str(row.get(c, ""))) for row in rows)) for c in columns}
+    print("  ".join(str(c).ljust(widths[c]) for c in columns).rstrip())
+    print("  ".join("-" * widths[c] for c in columns))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(widths[c]) for c in columns).rstrip())
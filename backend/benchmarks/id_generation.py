@@ -0,0 +1,80 @@
+"""
+ID generation speed and insert throughput by ID strategy.
+
+    python -m benchmarks.id_generation
+
+Generation: BENCH_IDS IDs from
+  secrets_choice - the previous generate_custom_id (16 secrets.choice draws)
+  random         - generate_random_id (pre-drawn urandom block)
+  random_batch   - generate_custom_ids (one call for all of them)
+  sortable       - generate_sortable_id (time-ordered)
+Inserts: BENCH_INSERT_ROWS orders in multi-row batches of 1000, keyed by random vs
+sortable IDs, reporting rows/s and, on Postgres, the size of the primary key index.
+"""
+import time
+import string
+import secrets
+from sqlalchemy import insert, text
+from benchmarks.common import MERCHANT_ID, env_int, is_postgres, setup_database, print_table
+
+from app import models
+from app.database import SessionLocal
+from app.utils.id_generator import generate_random_id, generate_sortable_id, generate_custom_ids
+
+IDS = env_int("BENCH_IDS", 200_000)
+INSERT_ROWS = env_int("BENCH_INSERT_ROWS", 200_000)
+CHUNK = 1000
+
+def secrets_choice(prefix: str) -> str:
+    alphabet = string.ascii_letters + string.digits
+    return prefix + "".join(secrets.choice(alphabet) for _ in range(16))
+
+def generation_results() -> list:
+    results = []
+    for name, generate in (
+        ("secrets_choice", lambda: [secrets_choice("pay_") for _ in range(IDS)]),
+        ("random", lambda: [generate_random_id("pay_") for _ in range(IDS)]),
+        ("random_batch", lambda: generate_custom_ids("pay_", IDS)),
+        ("sortable", lambda: [generate_sortable_id("pay_") for _ in range(IDS)]),
+    ):
+        started = time.perf_counter()
+        ids = generate()
+        elapsed = time.perf_counter() - started
+        assert len(set(ids)) == IDS and all(len(i) == 20 for i in ids)
+        results.append({"strategy": name, "ids": IDS, "seconds": round(elapsed, 3), "ids_per_s": round(IDS / elapsed)})
+    return results
+
+def insert_results() -> list:
+    results = []
+    for name, generate in (("random", generate_random_id), ("sortable", generate_sortable_id)):
+        db = SessionLocal()
+        try:
+            # TRUNCATE also resets the index, so each strategy starts from an empty B-tree
+            if is_postgres():
+                db.execute(text("TRUNCATE orders CASCADE"))
+            else:
+                db.query(models.Order).delete()
+            db.commit()
+            started = time.perf_counter()
+            for first in range(0, INSERT_ROWS, CHUNK):
+                db.execute(insert(models.Order), [
+                    {"id": generate("order_"), "merchant_id": MERCHANT_ID, "amount": 50000, "status": "created"}
+                    for _ in range(min(CHUNK, INSERT_ROWS - first))
+                ])
+                db.commit()
+            elapsed = time.perf_counter() - started
+            row = {"strategy": name, "rows": INSERT_ROWS, "seconds": round(elapsed, 2), "rows_per_s": round(INSERT_ROWS / elapsed)}
+            if is_postgres():
+                row["pkey_mb"] = round(db.scalar(text("SELECT pg_relation_size('orders_pkey')")) / 2**20, 1)
+            results.append(row)
+        finally:
+            db.close()
+    return results
+
+def main():
+    setup_database()
+    print_table(generation_results(), "ID generation")
+    print_table(insert_results(), f"Inserting {INSERT_ROWS} orders in batches of {CHUNK}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Rows purged per second and idempotency_keys size over a simulated week of traffic.
+
+    python -m benchmarks.idempotency_sweep
+
+Each simulated hour inserts BENCH_KEYS_PER_HOUR keys (24h expiry) and then runs the
+sweeper as beat would, with the clock set to that hour. Reported per simulated day:
+live rows (and how many there would be without a sweeper), rows purged, the purge
+rate, and on Postgres the table and index footprint. Set IDEMPOTENCY_PARTITIONED=true
+(Postgres) to also create and drop daily partitions the way the sweep task does.
+"""
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select
+from benchmarks.common import MERCHANT_ID, env_int, is_postgres, setup_database, print_table
+
+from app import models, maintenance
+from app.database import SessionLocal
+
+KEYS_PER_HOUR = env_int("BENCH_KEYS_PER_HOUR", 5000)
+DAYS = env_int("BENCH_DAYS", 7)
+
+def insert_hour(db, hour_start: datetime):
+    rows = []
+    for i in range(KEYS_PER_HOUR):
+        created_at = hour_start + timedelta(seconds=3600 * i / KEYS_PER_HOUR)
+        rows.append({
+            "key": uuid.uuid4().hex, "merchant_id": MERCHANT_ID,
+            "response": {"id": f"pay_bench{i:011d}", "status": "pending"},
+            "created_at": created_at, "expires_at": created_at + timedelta(hours=24),
+        })
+    db.execute(insert(models.IdempotencyKey), rows)
+    db.commit()
+
+def sweep(db, now: datetime) -> dict:
+    """What sweep_idempotency_keys_job does, at a simulated time."""
+    if models.IDEMPOTENCY_PARTITIONED:
+        maintenance.ensure_idempotency_partitions(db, now)
+        maintenance.drop_expired_idempotency_partitions(db, now)
+    return maintenance.sweep_expired_idempotency_keys(db, now=now)
+
+def main():
+    setup_database()
+    db = SessionLocal()
+    try:
+        start = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        if models.IDEMPOTENCY_PARTITIONED:
+            maintenance.ensure_idempotency_partitions(db, start)
+
+        results = []
+        for day in range(DAYS):
+            purged, sweep_seconds = 0, 0.0
+            for hour in range(24):
+                now = start + timedelta(days=day, hours=hour)
+                insert_hour(db, now)
+                stats = sweep(db, now + timedelta(hours=1))
+                purged += stats["purged"]
+                sweep_seconds += stats["seconds"]
+
+            live = db.scalar(select(func.count()).select_from(models.IdempotencyKey))
+            row = {
+                "day": day + 1, "live_rows": live,
+                "rows_without_sweeper": KEYS_PER_HOUR * 24 * (day + 1),
+                "purged": purged, "sweep_seconds": round(sweep_seconds, 2),
+                "purged_per_s": round(purged / sweep_seconds, 1) if sweep_seconds else 0.0,
+            }
+            if is_postgres():
+                sizes = maintenance.idempotency_table_size(db)
+                row.update(table_mb=round(sizes["table_bytes"] / 2**20, 1), index_mb=round(sizes["index_bytes"] / 2**20, 1))
+            db.rollback()
+            results.append(row)
+            print(f"Simulated day {day + 1} done")
+        mode = "partitioned" if models.IDEMPOTENCY_PARTITIONED else "unpartitioned"
+        print_table(results, f"{KEYS_PER_HOUR} keys/hour, swept hourly ({mode})")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
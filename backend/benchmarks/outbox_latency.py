@@ -0,0 +1,103 @@
+"""
+create_payment latency with the transactional outbox vs publishing to the broker in the request.
+
+    python -m benchmarks.outbox_latency
+
+  direct - the handler as it was before the outbox: commit, then
+           process_payment_job.delay and deliver_webhook_job.delay inline
+  outbox - the current POST /api/v1/payments (jobs written in the same transaction)
+BENCH_REQUESTS sequential requests per mode, in-process. The broker is the app's
+and result backend (REDIS_URL) unless BENCH_BROKER_URL overrides them; memory:// has
+no round trip, so only a real broker shows what the direct mode costs.
+"""
+import os
+import time
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException
+import httpx
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from benchmarks.common import AUTH_HEADERS, MERCHANT_ID, env_int, setup_database, latency_summary, print_table, run
+
+from app import auth, crud, database, models, schemas
+from app.main import app
+from app.tasks import process_payment_job, deliver_webhook_job
+from app.worker import celery_app
+from app.database import SessionLocal
+from app.utils.id_generator import generate_custom_id, generate_custom_ids
+
+REQUESTS = env_int("BENCH_REQUESTS", 500)
+if os.getenv("BENCH_BROKER_URL"):
+    # .delay() also subscribes to the result backend, so it moves along with the broker
+    celery_app.conf.update(broker_url=os.getenv("BENCH_BROKER_URL"), result_backend="cache+memory://")
+
+# Mounted on the real app, so both modes pass through the same middleware
+direct = APIRouter()
+
+@direct.post("", status_code=201)
+async def create_payment_direct(
+    payment_in: schemas.PaymentCreate,
+    db: AsyncSession = Depends(database.get_async_db),
+    merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
+):
+    result = await db.execute(select(models.Order).where(
+        models.Order.id == payment_in.order_id, models.Order.merchant_id == merchant.id
+    ))
+    order = result.scalars().first()
+    if not order: raise HTTPException(status_code=404, detail="Order not found")
+
+    payment_id = generate_custom_id("pay_")
+    response_data = {
+        "id": payment_id, "order_id": order.id, "merchant_id": str(merchant.id), "amount": order.amount,
+        "currency": order.currency, "status": "pending", "method": payment_in.method,
+        "created_at": datetime.utcnow().isoformat() + "Z"
+    }
+    db.add(models.Payment(
+        id=payment_id, order_id=order.id, merchant_id=merchant.id,
+        amount=order.amount, currency=order.currency, method=payment_in.method,
+        status="pending", captured=False
+    ))
+    await db.commit()
+    await crud.record_payments_created(merchant.id)
+    process_payment_job.delay(payment_id)
+    deliver_webhook_job.delay(str(merchant.id), "payment.created", response_data)
+    return response_data
+
+app.include_router(direct, prefix="/bench/direct-payments")
+
+def create_orders(count: int) -> list:
+    db = SessionLocal()
+    try:
+        ids = generate_custom_ids("order_", count)
+        db.execute(insert(models.Order), [
+            {"id": order_id, "merchant_id": MERCHANT_ID, "amount": 50000, "status": "created"} for order_id in ids
+        ])
+        db.commit()
+        return ids
+    finally:
+        db.close()
+
+async def measure(path: str, order_ids: list) -> list:
+    durations = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as http:
+        for order_id in order_ids:
+            started = time.perf_counter()
+            response = await http.post(path, json={"order_id": order_id, "method": "upi", "vpa": "bench@okhdfc"}, headers=AUTH_HEADERS)
+            durations.append(time.perf_counter() - started)
+            assert response.status_code == 201, response.text
+    return durations
+
+async def main():
+    setup_database()
+    # Warm-up: pool, credential cache, broker connection
+    modes = (("direct", "/bench/direct-payments"), ("outbox", "/api/v1/payments"))
+    for mode, path in modes:
+        await measure(path, create_orders(5))
+
+    results = []
+    for mode, path in modes:
+        results.append({"mode": mode, **latency_summary(await measure(path, create_orders(REQUESTS)))})
+    print_table(results, f"POST /api/v1/payments, {REQUESTS} sequential requests per mode (broker: {celery_app.conf.broker_url})")
+
+if __name__ == "__main__":
+    run(main())
@@ -0,0 +1,93 @@
+"""
+Page fetch time vs page depth over a seeded refunds table: OFFSET + count vs keyset cursor.
+
+    python -m benchmarks.pagination
+
+Seeds BENCH_ROWS refunds for the test merchant (default one million), then for
+each depth in BENCH_DEPTHS fetches one page of 10 rows:
+  offset - ORDER BY ... OFFSET depth plus the exact count(*), as list_refunds did
+  keyset - keyset_paginate with a cursor for the row just before that depth
+Times are the median of BENCH_REPEAT runs. The count is reported separately, since
+include_total=false now skips it.
+"""
+import time
+import statistics
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select
+from benchmarks.common import MERCHANT_ID, env_int, env_ints, setup_database, print_table
+
+from app import models
+from app.database import SessionLocal
+from app.utils.id_generator import generate_custom_ids
+from app.utils.pagination import keyset_paginate, encode_cursor
+
+ROWS = env_int("BENCH_ROWS", 1_000_000)
+DEPTHS = env_ints("BENCH_DEPTHS", "0,1000,10000,100000,500000,990000")
+REPEAT = env_int("BENCH_REPEAT", 5)
+PAGE_SIZE = 10
+CHUNK = 10_000
+
+def seed(db):
+    order_id, payment_id = "order_bench0000000001", "pay_bench00000000001"
+    db.add(models.Order(id=order_id, merchant_id=MERCHANT_ID, amount=ROWS, status="paid"))
+    db.add(models.Payment(id=payment_id, order_id=order_id, merchant_id=MERCHANT_ID, amount=ROWS, method="upi", status="success"))
+    db.commit()
+
+    started = datetime.utcnow() - timedelta(seconds=ROWS)
+    for first in range(0, ROWS, CHUNK):
+        count = min(CHUNK, ROWS - first)
+        ids = generate_custom_ids("rfnd_", count)
+        db.execute(insert(models.Refund), [{
+            "id": ids[i], "payment_id": payment_id, "merchant_id": MERCHANT_ID,
+            "amount": 1, "status": "processed", "created_at": started + timedelta(seconds=first + i)
+        } for i in range(count)])
+        db.commit()
+
+def median_ms(run) -> float:
+    durations = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - started)
+    return round(statistics.median(durations) * 1000, 3)
+
+def main():
+    setup_database()
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        seed(db)
+        print(f"Seeded {ROWS} refunds in {time.perf_counter() - started:.1f}s")
+
+        base = select(models.Refund).where(models.Refund.merchant_id == MERCHANT_ID)
+        newest_first = base.order_by(models.Refund.created_at.desc(), models.Refund.id.desc())
+        count_query = select(func.count()).select_from(base.subquery())
+
+        results = []
+        for depth in DEPTHS:
+            if depth >= ROWS:
+                continue
+            cursor = None
+            if depth:
+                before = db.execute(newest_first.offset(depth - 1).limit(1)).scalars().one()
+                cursor = encode_cursor(before.created_at, before.id)
+
+            offset_query = newest_first.offset(depth).limit(PAGE_SIZE)
+            keyset_query = keyset_paginate(base, models.Refund, cursor, PAGE_SIZE)
+            # Both strategies must return the same page
+            assert [r.id for r in db.execute(offset_query).scalars()] == \
+                   [r.id for r in db.execute(keyset_query).scalars()][:PAGE_SIZE]
+
+            results.append({
+                "depth": depth,
+                "offset_ms": median_ms(lambda: db.execute(offset_query).scalars().all()),
+                "count_ms": median_ms(lambda: db.execute(count_query).scalar()),
+                "keyset_ms": median_ms(lambda: db.execute(keyset_query).scalars().all()),
+            })
+            db.rollback()
+        print_table(results, f"One page of {PAGE_SIZE} out of {ROWS} rows (median of {REPEAT})")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Payments completed per second by one Celery worker.
+
+    python -m benchmarks.payment_worker
+
+Starts an in-process worker (solo pool, one slot) on the payments queue and feeds it
+pending payments:
+  blocking   - a task that sleeps the bank delay and then completes the payment,
+               the shape process_payment_job had before the state machine
+  scheduled  - process_payment_job, which schedules complete_payment_job with a
+               countdown and frees the slot meanwhile
+The bank delay is TEST_PROCESSING_DELAY (ms, TEST_MODE is forced on). The broker
+is BENCH_BROKER_URL: Celery's in-memory transport by default, or e.g. the local
+Redis. Workers also need REDIS_URL for status publishing and stats.
+"""
+import os
+import time
+from datetime import datetime
+
+os.environ["TEST_MODE"] = "true"
+os.environ.setdefault("TEST_PROCESSING_DELAY", "1000")
+
+from benchmarks.common import MERCHANT_ID, env_int, setup_database, latency_summary, print_table
+from celery.contrib.testing.worker import start_worker
+from sqlalchemy import func, insert, select
+
+from app import models, tasks
+from app.database import SessionLocal
+from app.worker import celery_app
+from app.utils.id_generator import generate_custom_ids
+
+PAYMENTS = env_int("BENCH_PAYMENTS", 200)
+# Each blocking payment holds the slot for the whole delay, so fewer are needed
+BLOCKING_PAYMENTS = env_int("BENCH_BLOCKING_PAYMENTS", 10)
+BROKER_URL = os.getenv("BENCH_BROKER_URL", "memory://")
+
+celery_app.conf.update(broker_url=BROKER_URL, result_backend="cache+memory://")
+
+@celery_app.task(name="benchmarks.blocking_process_payment")
+def blocking_process_payment(payment_id: str):
+    time.sleep(tasks.bank_response_delay())
+    tasks.complete_payment_job(payment_id)
+
+def create_pending_payments(count: int) -> list:
+    db = SessionLocal()
+    try:
+        order_id = generate_custom_ids("order_", 1)[0]
+        db.add(models.Order(id=order_id, merchant_id=MERCHANT_ID, amount=100, status="created"))
+        ids = generate_custom_ids("pay_", count)
+        db.execute(insert(models.Payment), [{
+            "id": payment_id, "order_id": order_id, "merchant_id": MERCHANT_ID,
+            "amount": 100, "method": "upi", "status": "pending"
+        } for payment_id in ids])
+        db.commit()
+        return ids
+    finally:
+        db.close()
+
+def wait_until_final(ids: list, timeout: float) -> list:
+    """Polls until no payment is pending; returns their final updated_at values."""
+    deadline = time.monotonic() + timeout
+    db = SessionLocal()
+    try:
+        while time.monotonic() < deadline:
+            pending = db.scalar(select(func.count()).where(
+                models.Payment.id.in_(ids), models.Payment.status == "pending"
+            ))
+            db.rollback()
+            if not pending:
+                return db.scalars(select(models.Payment.updated_at).where(models.Payment.id.in_(ids))).all()
+            time.sleep(0.05)
+        raise TimeoutError(f"{pending} payments still pending after {timeout}s")
+    finally:
+        db.close()
+
+def measure(mode: str, count: int) -> dict:
+    ids = create_pending_payments(count)
+    enqueued_at = datetime.utcnow()
+    started = time.perf_counter()
+    for payment_id in ids:
+        if mode == "blocking":
+            blocking_process_payment.apply_async(args=[payment_id], queue="payments")
+        else:
+            tasks.process_payment_job.delay(payment_id)
+    delay = tasks.bank_response_delay()
+    finished = wait_until_final(ids, timeout=count * (delay + 1) + 30)
+    elapsed = time.perf_counter() - started
+    summary = latency_summary([(at - enqueued_at).total_seconds() for at in finished])
+    return {
+        "mode": mode, "payments": count, "bank_delay_s": delay,
+        "seconds": round(elapsed, 2), "payments_per_s": round(count / elapsed, 2),
+        "p50_to_final_ms": summary["p50_ms"], "p99_to_final_ms": summary["p99_ms"],
+    }
+
+def main():
+    setup_database()
+    results = []
+    with start_worker(celery_app, concurrency=1, pool="solo", perform_ping_check=False, queues=["payments"]):
+        results.append(measure("blocking", BLOCKING_PAYMENTS))
+        results.append(measure("scheduled", PAYMENTS))
+    print_table(results, "One worker, one slot (solo pool)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+API throughput and latency at 50/200/1000 concurrent requests, with pool saturation.
+
+    python -m benchmarks.pool_throughput
+
+BENCH_CONCURRENCY clients (comma-separated levels) send GET /api/v1/payments/refunds
+?include_total=false back to back for BENCH_SECONDS each, against the app under
+uvicorn in this process (one worker) or BENCH_BASE_URL. /metrics is scraped every
+250 ms for the db_pool_checked_out and db_pool_capacity gauges; "peak_checked_out"
+reaching capacity means requests were queueing for a connection (and failing after
+DB_POOL_TIMEOUT). Compare pool settings by re-running with DB_POOL_SIZE,
+DB_MAX_OVERFLOW, DB_POOL_PRE_PING or PGBOUNCER_MODE set.
+"""
+import time
+import asyncio
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+from sqlalchemy import insert
+from benchmarks.common import AUTH_HEADERS, MERCHANT_ID, BASE_URL, env_int, env_ints, setup_database, serve, latency_summary, print_table
+
+from app import models, database
+from app.database import SessionLocal
+from app.utils.id_generator import generate_custom_ids
+
+CONCURRENCY = env_ints("BENCH_CONCURRENCY", "50,200,1000")
+SECONDS = env_int("BENCH_SECONDS", 10)
+PATH = "/api/v1/payments/refunds?include_total=false&limit=10"
+
+def seed_refunds(count: int = 100):
+    db = SessionLocal()
+    try:
+        order_id, payment_id = "order_bench0000000001", "pay_bench00000000001"
+        db.add(models.Order(id=order_id, merchant_id=MERCHANT_ID, amount=count, status="paid"))
+        db.add(models.Payment(id=payment_id, order_id=order_id, merchant_id=MERCHANT_ID, amount=count, method="upi", status="success"))
+        db.execute(insert(models.Refund), [
+            {"id": refund_id, "payment_id": payment_id, "merchant_id": MERCHANT_ID, "amount": 1, "status": "processed"}
+            for refund_id in generate_custom_ids("rfnd_", count)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+def pool_gauges(body: str) -> dict:
+    """{engine: (checked_out, capacity)} from a /metrics scrape."""
+    gauges = {}
+    for family in text_string_to_metric_families(body):
+        if family.name in ("db_pool_checked_out", "db_pool_capacity"):
+            for sample in family.samples:
+                gauges.setdefault(sample.labels["engine"], {})[family.name] = sample.value
+    return {name: (values.get("db_pool_checked_out", 0), values.get("db_pool_capacity", 0)) for name, values in gauges.items()}
+
+async def scrape(base_url: str, stop: asyncio.Event, peaks: dict):
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as http:
+        while not stop.is_set():
+            try:
+                response = await http.get("/metrics")
+                for name, (checked_out, capacity) in pool_gauges(response.text).items():
+                    peak, _ = peaks.get(name, (0, 0))
+                    peaks[name] = (max(peak, checked_out), capacity)
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+
+async def measure(base_url: str, concurrency: int) -> dict:
+    durations, errors = [], 0
+    deadline = time.monotonic() + SECONDS
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def worker(http):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await http.get(PATH, headers=AUTH_HEADERS)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                durations.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    stop, peaks = asyncio.Event(), {}
+    scraper = asyncio.create_task(scrape(base_url, stop, peaks))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    stop.set()
+    await scraper
+
+    summary = latency_summary(durations)
+    checked_out, capacity = peaks.get("async", (0, 0))
+    row = {
+        "concurrency": concurrency, "requests": summary["count"], "errors": errors,
+        "req_per_s": round(summary["count"] / elapsed, 1),
+        "p50_ms": summary["p50_ms"], "p99_ms": summary["p99_ms"],
+        "peak_checked_out": int(checked_out), "pool_capacity": int(capacity),
+    }
+    # With a replica configured the list is served from its pool
+    if "async_read" in peaks:
+        row["peak_read_checked_out"], row["read_pool_capacity"] = map(int, peaks["async_read"])
+    return row
+
+async def measure_all(base_url: str) -> list:
+    # Warm-up: credential cache, pool connections
+    async with httpx.AsyncClient(base_url=base_url) as http:
+        (await http.get(PATH, headers=AUTH_HEADERS)).raise_for_status()
+    results = []
+    for concurrency in CONCURRENCY:
+        results.append(await measure(base_url, concurrency))
+        print(f"{concurrency} concurrent done")
+    return results
+
+def main():
+    if BASE_URL:
+        results = asyncio.run(measure_all(BASE_URL))
+    else:
+        setup_database()
+        seed_refunds()
+        from app.main import app
+        with serve(app) as base_url:
+            results = asyncio.run(measure_all(base_url))
+    options = database.engine_options(database.ASYNC_DATABASE_URL, is_async=True)
+    if "poolclass" in options:
+        settings = "PgBouncer mode, no client pool"
+    else:
+        settings = ", ".join(f"{key} {value}" for key, value in options.items()) or "driver default pool"
+    print_table(results, f"GET {PATH} for {SECONDS}s per level ({settings})")
+
+if __name__ == "__main__":
+    main()
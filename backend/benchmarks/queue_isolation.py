@@ -0,0 +1,162 @@
+"""
+Payment processing latency while webhooks to dead endpoints pile up.
+
+    python -m benchmarks.queue_isolation
+
+In-process Celery workers (thread pools) on BENCH_BROKER_URL (in-memory by default):
+  shared   - one worker with BENCH_SLOTS slots consuming payments and webhooks,
+             like the single default queue before routing
+  isolated - a payments worker with one slot and a webhooks worker with the rest,
+             as worker.py's routing is deployed
+Each scenario first enqueues BENCH_FAILING_WEBHOOKS deliveries, as deliver_webhook_batch
+tasks of BENCH_FLOOD_BATCH (the way the outbox relay publishes them), to
+BENCH_DEAD_MERCHANTS fresh merchants whose endpoint accepts connections and never
+answers: each attempt waits WEBHOOK_TIMEOUT (BENCH_WEBHOOK_TIMEOUT here) until their
+circuit breakers open. It then submits BENCH_PAYMENTS payments
+every BENCH_PAYMENT_INTERVAL_MS. Latency is submit-to-final-status minus the
+simulated bank delay (TEST_PROCESSING_DELAY), so a flat line means no queueing.
+"""
+import os
+import time
+import uuid
+import socket
+import contextlib
+from datetime import datetime
+
+os.environ["TEST_MODE"] = "true"
+os.environ.setdefault("TEST_PROCESSING_DELAY", "100")
+os.environ["WEBHOOK_TIMEOUT"] = os.getenv("BENCH_WEBHOOK_TIMEOUT", "1")
+
+from benchmarks.common import MERCHANT_ID, env_int, setup_database, latency_summary, print_table
+from celery.contrib.testing.worker import start_worker
+from sqlalchemy import insert, select
+
+from app import models, tasks
+from app.database import SessionLocal
+from app.worker import celery_app
+from app.utils.id_generator import generate_custom_ids
+
+SLOTS = env_int("BENCH_SLOTS", 4)
+FAILING_WEBHOOKS = env_int("BENCH_FAILING_WEBHOOKS", 200)
+DEAD_MERCHANTS = env_int("BENCH_DEAD_MERCHANTS", 20)
+PAYMENTS = env_int("BENCH_PAYMENTS", 50)
+PAYMENT_INTERVAL_MS = env_int("BENCH_PAYMENT_INTERVAL_MS", 100)
+FLOOD_BATCH = env_int("BENCH_FLOOD_BATCH", 20)
+
+celery_app.conf.update(broker_url=os.getenv("BENCH_BROKER_URL", "memory://"), result_backend="cache+memory://")
+# The in-memory transport polls its queues once a second by default
+celery_app.conf.broker_transport_options = {**celery_app.conf.broker_transport_options, "polling_interval": 0.01}
+
+def blackhole_url() -> str:
+    """An endpoint that completes the TCP handshake and then never answers."""
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(4096)
+    blackhole_url.listener = listener # kept open for the whole run
+    return f"http://127.0.0.1:{listener.getsockname()[1]}/webhooks"
+
+def seed_dead_merchants(url: str) -> list:
+    db = SessionLocal()
+    try:
+        merchant_ids = [uuid.uuid4() for _ in range(DEAD_MERCHANTS)]
+        for merchant_id in merchant_ids:
+            db.add(models.Merchant(
+                id=merchant_id, name="Dead Endpoint", email=f"{merchant_id}@example.com",
+                api_key=f"key_{merchant_id.hex}", api_secret="secret", webhook_url=url, webhook_secret="whsec_bench"
+            ))
+        db.commit()
+        return [str(merchant_id) for merchant_id in merchant_ids]
+    finally:
+        db.close()
+
+def create_pending_payments(count: int) -> list:
+    db = SessionLocal()
+    try:
+        order_id = generate_custom_ids("order_", 1)[0]
+        db.add(models.Order(id=order_id, merchant_id=MERCHANT_ID, amount=100, status="created"))
+        ids = generate_custom_ids("pay_", count)
+        db.execute(insert(models.Payment), [{
+            "id": payment_id, "order_id": order_id, "merchant_id": MERCHANT_ID,
+            "amount": 100, "method": "upi", "status": "pending"
+        } for payment_id in ids])
+        db.commit()
+        return ids
+    finally:
+        db.close()
+
+def worker(concurrency: int, queues: list, hostname: str):
+    # The threads pool's consume loop only applies the prefetch bump for an ETA task
+    # (complete_payment's countdown) when its 2s drain times out, so the limit is
+    # lifted here; the pool still runs what it reserved in arrival order.
+    return start_worker(celery_app, concurrency=concurrency, pool="threads", prefetch_multiplier=0,
+                        perform_ping_check=False, queues=queues, hostname=hostname)
+
+@contextlib.contextmanager
+def workers(scenario: str):
+    with contextlib.ExitStack() as stack:
+        if scenario == "shared":
+            stack.enter_context(worker(SLOTS, ["payments", "webhooks"], "shared@bench"))
+        else:
+            stack.enter_context(worker(1, ["payments"], "payments@bench"))
+            stack.enter_context(worker(max(SLOTS - 1, 1), ["webhooks"], "webhooks@bench"))
+        yield
+
+def run_scenario(scenario: str, url: str, failing: int) -> dict:
+    # Fresh merchants, so no breaker is already open from an earlier scenario
+    dead_merchants = seed_dead_merchants(url)
+    payment_ids = create_pending_payments(PAYMENTS)
+    with workers(scenario):
+        deliveries = [
+            [dead_merchants[i % len(dead_merchants)], "payment.success",
+             {"event": "payment.success", "data": {"payment": {"id": f"pay_dead{i:012d}"}}}, 1]
+            for i in range(failing)
+        ]
+        for first in range(0, failing, FLOOD_BATCH):
+            tasks.deliver_webhook_batch_job.delay(deliveries[first:first + FLOOD_BATCH])
+
+        submitted = {}
+        for payment_id in payment_ids:
+            submitted[payment_id] = datetime.utcnow()
+            tasks.process_payment_job.delay(payment_id)
+            time.sleep(PAYMENT_INTERVAL_MS / 1000)
+
+        finished = wait_until_final(payment_ids, timeout=600)
+    # Drop what is left of the flood (workers hand unfinished messages back on shutdown)
+    with celery_app.connection_for_write() as connection:
+        for queue in ("payments", "webhooks"):
+            connection.default_channel.queue_purge(queue)
+
+    delay = tasks.bank_response_delay()
+    summary = latency_summary([(finished[p] - submitted[p]).total_seconds() - delay for p in payment_ids])
+    return {
+        "scenario": scenario, "failing_webhooks": failing, "payments": PAYMENTS,
+        "p50_queueing_ms": summary["p50_ms"], "p99_queueing_ms": summary["p99_ms"], "max_queueing_ms": summary["max_ms"],
+    }
+
+def wait_until_final(ids: list, timeout: float) -> dict:
+    deadline = time.monotonic() + timeout
+    db = SessionLocal()
+    try:
+        while time.monotonic() < deadline:
+            rows = db.execute(select(models.Payment.id, models.Payment.status, models.Payment.updated_at)
+                              .where(models.Payment.id.in_(ids))).all()
+            db.rollback()
+            if all(status != "pending" for _, status, _ in rows):
+                return {payment_id: updated_at for payment_id, _, updated_at in rows}
+            time.sleep(0.05)
+        raise TimeoutError(f"payments still pending after {timeout}s")
+    finally:
+        db.close()
+
+def main():
+    setup_database()
+    url = blackhole_url()
+    results = [
+        run_scenario("isolated", url, failing=0),
+        run_scenario("shared", url, failing=FAILING_WEBHOOKS),
+        run_scenario("isolated", url, failing=FAILING_WEBHOOKS),
+    ]
+    print_table(results, f"{SLOTS} worker slots, webhook timeout {os.environ['WEBHOOK_TIMEOUT']}s")
+
+if __name__ == "__main__":
+    main()
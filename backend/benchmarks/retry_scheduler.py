@@ -0,0 +1,98 @@
+"""
+Scheduling lag of the durable webhook retry scheduler with a deep backlog.
+
+    python -m benchmarks.retry_scheduler
+
+Seeds BENCH_PENDING pending webhook_logs rows (default 100k) over BENCH_MERCHANTS
+merchants, all due within the last BENCH_DUE_SPREAD seconds, then runs
+BENCH_SCHEDULERS concurrent claim loops (claim_due_webhook_retries, the core of
+dispatch_webhook_retries_job) until nothing is due. Publishing to the broker is
+left out. Lag is the time from when a row became due (or from the start, for rows
+already due then) until a scheduler claimed it.
+Use Postgres for more than one scheduler: SQLite has no SKIP LOCKED.
+"""
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from benchmarks.common import env_int, is_postgres, setup_database, latency_summary, print_table
+
+from app import models, tasks
+from app.database import SessionLocal
+
+PENDING = env_int("BENCH_PENDING", 100_000)
+MERCHANTS = env_int("BENCH_MERCHANTS", 100)
+DUE_SPREAD = env_int("BENCH_DUE_SPREAD", 60)
+SCHEDULERS = env_int("BENCH_SCHEDULERS", 4 if is_postgres() else 1)
+CHUNK = 10_000
+# log id -> when it became due for this run (the later of next_retry_at and the start)
+seeded_due = {}
+
+def seed(db):
+    merchant_ids = [uuid.uuid4() for _ in range(MERCHANTS)]
+    for merchant_id in merchant_ids:
+        db.add(models.Merchant(
+            id=merchant_id, name="Bench Merchant", email=f"{merchant_id}@example.com",
+            api_key=f"key_{merchant_id.hex}", api_secret="secret", webhook_url="http://127.0.0.1:9/"
+        ))
+    db.commit()
+
+    now = datetime.utcnow()
+    for first in range(0, PENDING, CHUNK):
+        db.execute(insert(models.WebhookLog), [{
+            "id": uuid.uuid4(), "merchant_id": merchant_ids[i % MERCHANTS],
+            "event": "payment.success", "payload": {"event": "payment.success"},
+            "status": "pending", "attempts": 1,
+            "next_retry_at": now - timedelta(seconds=DUE_SPREAD * i / PENDING),
+        } for i in range(first, min(first + CHUNK, PENDING))])
+        db.commit()
+
+def scheduler(claims: list, lags: list):
+    db = SessionLocal()
+    try:
+        while True:
+            started = time.perf_counter()
+            deliveries = tasks.claim_due_webhook_retries(db, tasks.WEBHOOK_RETRY_BATCH_SIZE)
+            claims.append(time.perf_counter() - started)
+            if not deliveries:
+                return
+            claimed_at = datetime.utcnow()
+            # next_retry_at now holds the lease; the due time comes from the seed
+            lags.extend((claimed_at - seeded_due[delivery[4]]).total_seconds() for delivery in deliveries)
+    finally:
+        db.close()
+
+def main():
+    setup_database()
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        seed(db)
+        print(f"Seeded {PENDING} pending retries in {time.perf_counter() - started:.1f}s")
+        start = datetime.utcnow()
+        for log_id, due_at in db.query(models.WebhookLog.id, models.WebhookLog.next_retry_at):
+            seeded_due[str(log_id)] = max(due_at, start)
+    finally:
+        db.close()
+
+    claims, lags = [], []
+    threads = [threading.Thread(target=scheduler, args=(claims, lags)) for _ in range(SCHEDULERS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    claim_summary, lag_summary = latency_summary(claims), latency_summary(lags)
+    print_table([{
+        "pending": PENDING, "schedulers": SCHEDULERS, "batch_size": tasks.WEBHOOK_RETRY_BATCH_SIZE,
+        "claimed": len(lags), "claims": len(claims), "seconds": round(elapsed, 2),
+        "claimed_per_s": round(len(lags) / elapsed, 1),
+        "claim_p50_ms": claim_summary["p50_ms"], "claim_p99_ms": claim_summary["p99_ms"],
+        "lag_p50_ms": lag_summary["p50_ms"], "lag_p99_ms": lag_summary["p99_ms"],
+    }], "Draining a backlog of due retries")
+
+if __name__ == "__main__":
+    main()
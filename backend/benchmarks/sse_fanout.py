@@ -0,0 +1,137 @@
+"""
+Checkout status delivery to many concurrent waiters: SSE fan-out vs polling.
+
+    python -m benchmarks.sse_fanout
+
+BENCH_SUBSCRIBERS pending payments each get one waiting client against the app
+under uvicorn (or BENCH_BASE_URL, which must share DATABASE_URL and REDIS_URL):
+  sse  - GET /api/v1/payments/{id}/events, one open stream per payment
+  poll - GET /api/v1/payments/{id}/public every BENCH_POLL_MS (2000, as the
+         checkout page's fallback does)
+Once every client is waiting they are held for BENCH_HOLD seconds, then all
+payments are set to success and published with payment_events.publish_status, as
+complete_payment_job does. Delivery latency is publish to the client seeing the
+final status. Queries are the API's (async engine), in-process only.
+"""
+import time
+import asyncio
+from types import SimpleNamespace
+import httpx
+from sqlalchemy import event, insert, update
+from benchmarks.common import MERCHANT_ID, BASE_URL, env_int, env_ints, setup_database, serve, latency_summary, print_table
+
+from app import models, payment_events
+from app.database import SessionLocal, async_engine
+from app.utils.id_generator import generate_custom_ids
+
+SUBSCRIBERS = env_ints("BENCH_SUBSCRIBERS", "100,1000")
+HOLD = env_int("BENCH_HOLD", 10)
+POLL_MS = env_int("BENCH_POLL_MS", 2000)
+
+queries = 0
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def count_query(*args):
+    global queries
+    queries += 1
+
+def create_pending_payments(count: int) -> tuple:
+    db = SessionLocal()
+    try:
+        order_id = generate_custom_ids("order_", 1)[0]
+        db.add(models.Order(id=order_id, merchant_id=MERCHANT_ID, amount=50000, status="created"))
+        ids = generate_custom_ids("pay_", count)
+        db.execute(insert(models.Payment), [{
+            "id": payment_id, "order_id": order_id, "merchant_id": MERCHANT_ID,
+            "amount": 50000, "method": "upi", "status": "pending"
+        } for payment_id in ids])
+        db.commit()
+        return order_id, ids
+    finally:
+        db.close()
+
+def finalize(order_id: str, ids: list, published: dict):
+    """The end of complete_payment_job: the status update, then one publish per payment."""
+    db = SessionLocal()
+    try:
+        db.execute(update(models.Payment).where(models.Payment.id.in_(ids)).values(status="success"))
+        db.commit()
+    finally:
+        db.close()
+    committed = time.time()
+    for payment_id in ids:
+        published[payment_id] = committed
+        payment_events.publish_status(SimpleNamespace(
+            id=payment_id, order_id=order_id, status="success", error_code=None, error_description=None
+        ))
+
+async def sse_client(http, payment_id: str, waiting: asyncio.Event, counter: list, received: dict):
+    async with http.stream("GET", f"/api/v1/payments/{payment_id}/events") as response:
+        response.raise_for_status()
+        counter[0] += 1
+        if counter[0] == counter[1]:
+            waiting.set()
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                received[payment_id] = time.time()
+                return
+
+async def poll_client(http, payment_id: str, waiting: asyncio.Event, counter: list, received: dict):
+    counter[0] += 1
+    if counter[0] == counter[1]:
+        waiting.set()
+    while True:
+        try:
+            response = await http.get(f"/api/v1/payments/{payment_id}/public")
+            response.raise_for_status()
+            if payment_events.is_final(response.json()["status"]):
+                received[payment_id] = time.time()
+                return
+        except httpx.TransportError:
+            pass # like the checkout page: try again on the next tick
+        await asyncio.sleep(POLL_MS / 1000)
+
+async def measure(base_url: str, mode: str, subscribers: int) -> dict:
+    global queries
+    order_id, ids = create_pending_payments(subscribers)
+    received, published, counter = {}, {}, [0, subscribers]
+    waiting = asyncio.Event()
+    limits = httpx.Limits(max_connections=subscribers, max_keepalive_connections=subscribers)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=None) as http:
+        waiter = sse_client if mode == "sse" else poll_client
+        clients = [asyncio.create_task(waiter(http, payment_id, waiting, counter, received)) for payment_id in ids]
+        await asyncio.wait_for(waiting.wait(), timeout=300)
+
+        queries = 0
+        await asyncio.sleep(HOLD)
+        held_queries = queries
+
+        await asyncio.to_thread(finalize, order_id, ids, published)
+        await asyncio.wait_for(asyncio.gather(*clients), timeout=300)
+    summary = latency_summary([received[p] - published[p] for p in ids])
+    return {
+        "mode": mode, "subscribers": subscribers,
+        "queries_per_s_waiting": round(held_queries / HOLD, 1) if not BASE_URL else "n/a",
+        "p50_delivery_ms": summary["p50_ms"], "p99_delivery_ms": summary["p99_ms"], "max_delivery_ms": summary["max_ms"],
+    }
+
+async def measure_all(base_url: str) -> list:
+    results = []
+    for subscribers in SUBSCRIBERS:
+        for mode in ("sse", "poll"):
+            results.append(await measure(base_url, mode, subscribers))
+            print(f"{mode} with {subscribers} subscribers done")
+    return results
+
+def main():
+    if BASE_URL:
+        results = asyncio.run(measure_all(BASE_URL))
+    else:
+        setup_database()
+        from app.main import app
+        with serve(app) as base_url:
+            results = asyncio.run(measure_all(base_url))
+    print_table(results, f"Waiting {HOLD}s for the final status, polling every {POLL_MS} ms")
+
+if __name__ == "__main__":
+    main()
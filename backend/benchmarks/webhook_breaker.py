@@ -0,0 +1,151 @@
+"""
+Requests, connections and worker time spent on dead webhook endpoints, with and
+without the per-merchant circuit breaker.
+
+    python -m benchmarks.webhook_breaker
+
+BENCH_EVENTS first-attempt events for BENCH_MERCHANTS merchants go through
+deliver_webhook_batch_job, then for BENCH_DURATION seconds the retry scheduler's
+claim (claim_due_webhook_retries) feeds due retries back into it, on the test retry
+ladder (WEBHOOK_RETRY_INTERVALS_TEST, 5 attempts within 50s). Two endpoints:
+  dead     - accepts the connection and never answers (each request waits
+             WEBHOOK_TIMEOUT, BENCH_WEBHOOK_TIMEOUT here)
+  slow_503 - answers 503 after BENCH_STUB_DELAY_MS
+With the breaker off (threshold never reached) every event runs the whole ladder.
+"worker_seconds" is the time spent inside the batch task, i.e. worker slot time.
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import threading
+from collections import Counter
+
+os.environ["WEBHOOK_RETRY_INTERVALS_TEST"] = "true"
+os.environ["WEBHOOK_TIMEOUT"] = os.getenv("BENCH_WEBHOOK_TIMEOUT", "1")
+
+from sqlalchemy import func, select
+from benchmarks.common import env_int, setup_database, print_table
+
+from app import circuit_breaker, models, tasks
+from app.database import SessionLocal
+
+EVENTS = env_int("BENCH_EVENTS", 200)
+MERCHANTS = env_int("BENCH_MERCHANTS", 4)
+DURATION = env_int("BENCH_DURATION", 60)
+STUB_DELAY_MS = env_int("BENCH_STUB_DELAY_MS", 500)
+BATCH = 50
+
+class Endpoint:
+    """A local HTTP endpoint that counts the connections and requests it gets."""
+
+    def __init__(self, answer: bool):
+        self.answer = answer
+        self.stats = Counter()
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        threading.Thread(target=self._run, args=(started,), daemon=True).start()
+        started.wait()
+
+    def _run(self, started):
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0, backlog=4096))
+        self.url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/webhooks"
+        started.set()
+        self.loop.run_forever()
+
+    async def _handle(self, reader, writer):
+        self.stats["connections"] += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                self.stats["requests"] += 1
+                if not self.answer:
+                    await reader.read() # hold the connection until the client gives up
+                    return
+                length = next((int(line.split(b":")[1]) for line in head.split(b"\r\n")
+                               if line.lower().startswith(b"content-length:")), 0)
+                await reader.readexactly(length)
+                await asyncio.sleep(STUB_DELAY_MS / 1000)
+                writer.write(b"HTTP/1.1 503 Service Unavailable\r\ncontent-length: 0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def take(self) -> Counter:
+        stats, self.stats = self.stats, Counter()
+        return stats
+
+def seed_merchants(url: str) -> list:
+    """Fresh merchants per run, so no breaker state carries over."""
+    db = SessionLocal()
+    try:
+        merchant_ids = [uuid.uuid4() for _ in range(MERCHANTS)]
+        for merchant_id in merchant_ids:
+            db.add(models.Merchant(
+                id=merchant_id, name="Dead Endpoint", email=f"{merchant_id}@example.com",
+                api_key=f"key_{merchant_id.hex}", api_secret="secret", webhook_url=url, webhook_secret="whsec_bench"
+            ))
+        db.commit()
+        return merchant_ids
+    finally:
+        db.close()
+
+def deliver(deliveries: list) -> float:
+    started = time.perf_counter()
+    for first in range(0, len(deliveries), BATCH):
+        tasks.deliver_webhook_batch_job(deliveries[first:first + BATCH])
+    return time.perf_counter() - started
+
+def run(endpoint: Endpoint, name: str, breaker: bool) -> dict:
+    circuit_breaker.WEBHOOK_BREAKER_THRESHOLD = int(os.getenv("WEBHOOK_BREAKER_THRESHOLD", 5)) if breaker else sys.maxsize
+    merchant_ids = seed_merchants(endpoint.url)
+    endpoint.take()
+
+    worker_seconds = deliver([
+        [str(merchant_ids[i % MERCHANTS]), "payment.success",
+         {"event": "payment.success", "data": {"payment": {"id": f"pay_bench{i:011d}"}}}, 1]
+        for i in range(EVENTS)
+    ])
+    db = SessionLocal()
+    try:
+        deadline = time.monotonic() + DURATION
+        while time.monotonic() < deadline:
+            due = tasks.claim_due_webhook_retries(db, tasks.WEBHOOK_RETRY_BATCH_SIZE)
+            if due:
+                worker_seconds += deliver(due)
+            else:
+                time.sleep(0.2)
+
+        statuses = dict(db.execute(
+            select(models.WebhookLog.status, func.count())
+            .where(models.WebhookLog.merchant_id.in_(merchant_ids))
+            .group_by(models.WebhookLog.status)
+        ).all())
+        db.rollback()
+    finally:
+        db.close()
+
+    seen = endpoint.take()
+    return {
+        "endpoint": name, "breaker": "on" if breaker else "off", "events": EVENTS,
+        "http_requests": seen["requests"], "connections": seen["connections"],
+        "worker_seconds": round(worker_seconds, 1),
+        "failed": statuses.get("failed", 0), "pending": statuses.get("pending", 0),
+    }
+
+def main():
+    setup_database()
+    results = []
+    for name, endpoint in (("dead", Endpoint(answer=False)), ("slow_503", Endpoint(answer=True))):
+        for breaker in (False, True):
+            results.append(run(endpoint, name, breaker))
+            print(f"{name}, breaker {'on' if breaker else 'off'} done")
+    print_table(results, f"{EVENTS} events over {MERCHANTS} merchants for {DURATION}s, "
+                         f"webhook timeout {os.environ['WEBHOOK_TIMEOUT']}s")
+
+if __name__ == "__main__":
+    main()
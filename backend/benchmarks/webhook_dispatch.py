@@ -0,0 +1,150 @@
+"""
+Webhook deliveries/sec and p99 delivery lag against a local stub endpoint.
+
+    python -m benchmarks.webhook_dispatch
+
+The stub answers every POST after BENCH_STUB_DELAY_MS and records how long after
+enqueueing each event arrived. BENCH_EVENTS events are sent, spread over
+BENCH_MERCHANTS merchants, in four ways:
+  per_call    - a new requests.post per event, one at a time (one worker slot before)
+  keep_alive  - webhooks.post_webhook, one at a time over the pooled session
+  dispatcher  - webhooks.run_deliveries, all in flight at once on the httpx pool
+  batch_task  - deliver_webhook_batch_job end to end: breaker checks, fairness
+                slots and webhook_logs writes included
+"connections" counts the TCP connections the stub served during each run. The
+dispatcher's pool is warmed up first, as it is in a long-lived worker.
+"""
+import json
+import time
+import uuid
+import socket
+import asyncio
+import multiprocessing
+import requests
+from benchmarks.common import MERCHANT_ID, env_int, setup_database, latency_summary, print_table
+
+from app import models, tasks, webhooks
+from app.database import SessionLocal
+
+EVENTS = env_int("BENCH_EVENTS", 500)
+MERCHANTS = env_int("BENCH_MERCHANTS", 50)
+STUB_DELAY_MS = env_int("BENCH_STUB_DELAY_MS", 20)
+
+# The stub runs in its own process (asyncio, so hundreds of open connections cost
+# little) and reports what it saw at GET /stats
+def stub_app(delay: float):
+    lags, clients = [], set()
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["method"] == "GET":
+            body = json.dumps({"lags": lags, "connections": len(clients)}).encode()
+            lags.clear()
+            clients.clear()
+        else:
+            chunks, more = [], True
+            while more:
+                message = await receive()
+                chunks.append(message.get("body", b""))
+                more = message.get("more_body", False)
+            payload = json.loads(b"".join(chunks))
+            await asyncio.sleep(delay)
+            lags.append(time.time() - payload["enqueued_at"])
+            # One client address per TCP connection
+            clients.add(tuple(scope["client"]))
+            body = b"ok"
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+    return app
+
+def run_stub(port: int):
+    import uvicorn
+    uvicorn.run(stub_app(STUB_DELAY_MS / 1000), host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+def start_stub() -> tuple:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    process = multiprocessing.Process(target=run_stub, args=(port,), daemon=True)
+    process.start()
+    url = f"http://127.0.0.1:{port}"
+    while True:
+        try:
+            requests.get(url, timeout=1)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.05)
+
+def seed_merchants(url: str) -> list:
+    db = SessionLocal()
+    try:
+        merchant_ids = [MERCHANT_ID] + [uuid.uuid4() for _ in range(MERCHANTS - 1)]
+        db.query(models.Merchant).update({"webhook_url": url})
+        for merchant_id in merchant_ids[1:]:
+            db.add(models.Merchant(
+                id=merchant_id, name="Bench Merchant", email=f"{merchant_id}@example.com",
+                api_key=f"key_{merchant_id.hex}", api_secret="secret", webhook_url=url,
+                webhook_secret="whsec_bench"
+            ))
+        db.commit()
+        return [str(merchant_id) for merchant_id in merchant_ids]
+    finally:
+        db.close()
+
+def make_events(merchant_ids: list) -> list:
+    now = time.time()
+    return [(merchant_ids[i % len(merchant_ids)], {
+        "event": "payment.success", "timestamp": int(now), "enqueued_at": now,
+        "data": {"payment": {"id": f"pay_bench{i:011d}", "amount": 50000, "status": "success"}}
+    }) for i in range(EVENTS)]
+
+def per_call(url, events):
+    for merchant_id, payload in events:
+        signature = tasks.generate_webhook_signature(payload, "whsec_bench")
+        requests.post(url, json=payload, headers=webhooks.webhook_headers(signature), timeout=webhooks.WEBHOOK_TIMEOUT)
+
+def keep_alive(url, events):
+    for merchant_id, payload in events:
+        webhooks.post_webhook(url, payload, tasks.generate_webhook_signature(payload, "whsec_bench"))
+
+def dispatcher(url, events):
+    webhooks.run_deliveries([
+        (merchant_id, url, payload, tasks.generate_webhook_signature(payload, "whsec_bench"))
+        for merchant_id, payload in events
+    ])
+
+def batch_task(url, events):
+    tasks.deliver_webhook_batch_job([[merchant_id, payload["event"], payload, 1] for merchant_id, payload in events])
+
+def main():
+    setup_database()
+    stub, base_url = start_stub()
+    url = f"{base_url}/webhooks"
+    merchant_ids = seed_merchants(url)
+
+    results = []
+    try:
+        for send in (per_call, keep_alive, dispatcher, batch_task):
+            if send is dispatcher:
+                # Worker processes keep the httpx pool across tasks; measure it warm
+                dispatcher(url, make_events(merchant_ids))
+                requests.get(base_url)
+            events = make_events(merchant_ids)
+            started = time.perf_counter()
+            send(url, events)
+            elapsed = time.perf_counter() - started
+            seen = requests.get(base_url).json()
+            summary = latency_summary(seen["lags"])
+            results.append({
+                "mode": send.__name__, "delivered": summary["count"], "failed": EVENTS - summary["count"],
+                "deliveries_per_s": round(summary["count"] / elapsed, 1),
+                "p50_lag_ms": summary["p50_ms"], "p99_lag_ms": summary["p99_ms"],
+                "connections": seen["connections"],
+            })
+    finally:
+        stub.terminate()
+    print_table(results, f"{EVENTS} events over {MERCHANTS} merchants, endpoint answers in {STUB_DELAY_MS} ms")
+
+if __name__ == "__main__":
+    main()
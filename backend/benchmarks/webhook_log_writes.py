@@ -0,0 +1,116 @@
+"""
+Write amplification and commits/sec of webhook_logs persistence.
+
+    python -m benchmarks.webhook_log_writes
+
+BENCH_DELIVERIES deliveries are logged; BENCH_RETRY_PERCENT of them fail once and
+succeed on their second attempt. Three ways of writing the same attempts:
+  legacy    - what deliver_webhook_job did before: insert the row and commit,
+              commit again with the status, once more when scheduling a retry;
+              every retry inserts a new row
+  per_write - save_webhook_attempt: one statement and one commit per attempt,
+              retries update the first row
+  buffered  - WebhookLogWriter: bulk executemany per statement type, one commit
+              per 500 rows
+Statements and commits are counted on the engine.
+"""
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, select
+from benchmarks.common import MERCHANT_ID, env_int, setup_database, print_table
+
+from app import models, tasks
+from app.database import engine, SessionLocal
+from app.webhook_logs import WebhookLogWriter, save_webhook_attempt
+
+DELIVERIES = env_int("BENCH_DELIVERIES", 5000)
+RETRY_PERCENT = env_int("BENCH_RETRY_PERCENT", 30)
+
+counts = {"statements": 0, "commits": 0}
+
+@event.listens_for(engine, "before_cursor_execute")
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    counts["statements"] += 1
+
+@event.listens_for(engine, "commit")
+def count_commit(conn):
+    counts["commits"] += 1
+
+def delivered_values(attempt: int) -> dict:
+    return {
+        "status": "success", "attempts": attempt, "last_attempt_at": datetime.utcnow(),
+        "response_code": 200, "response_body": "ok", "next_retry_at": None,
+    }
+
+def attempts():
+    """(delivery index, attempt number, values) in the order a worker would log them."""
+    retried = DELIVERIES * RETRY_PERCENT // 100
+    for i in range(DELIVERIES):
+        if i < retried:
+            # The endpoint did not answer: a retry is scheduled
+            yield i, 1, tasks.webhook_attempt_values(1, None)[0]
+        else:
+            yield i, 1, delivered_values(1)
+    for i in range(retried):
+        yield i, 2, delivered_values(2)
+
+def payload(i: int) -> dict:
+    return {"event": "payment.success", "data": {"payment": {"id": f"pay_bench{i:011d}"}}}
+
+def legacy(db):
+    for i, attempt, values in attempts():
+        log = models.WebhookLog(merchant_id=MERCHANT_ID, event="payment.success", payload=payload(i), status="pending", attempts=attempt)
+        db.add(log)
+        db.commit()
+        log.last_attempt_at = values["last_attempt_at"]
+        log.response_code = values["response_code"]
+        log.status = values["status"]
+        db.commit()
+        if values["status"] == "pending":
+            log.next_retry_at = datetime.utcnow() + timedelta(seconds=60)
+            db.commit()
+
+def per_write(db):
+    log_ids = {}
+    for i, attempt, values in attempts():
+        is_new = i not in log_ids
+        log_ids.setdefault(i, uuid.uuid4())
+        save_webhook_attempt(db, log_ids[i], MERCHANT_ID, "payment.success", payload(i), values, is_new)
+
+def buffered(db):
+    log_ids = {}
+    with WebhookLogWriter(db) as writer:
+        for i, attempt, values in attempts():
+            is_new = i not in log_ids
+            log_ids.setdefault(i, uuid.uuid4())
+            writer.record(log_ids[i], MERCHANT_ID, "payment.success", payload(i), values, is_new)
+
+def main():
+    setup_database()
+    total_attempts = sum(1 for _ in attempts())
+    results = []
+    for write in (legacy, per_write, buffered):
+        db = SessionLocal()
+        try:
+            db.query(models.WebhookLog).delete()
+            db.commit()
+            counts.update(statements=0, commits=0)
+            started = time.perf_counter()
+            write(db)
+            elapsed = time.perf_counter() - started
+            statements, commits = counts["statements"], counts["commits"]
+            rows = db.scalar(select(func.count()).select_from(models.WebhookLog))
+        finally:
+            db.close()
+        results.append({
+            "mode": write.__name__, "attempts": total_attempts, "rows": rows,
+            "statements": statements, "commits": commits,
+            "statements_per_attempt": round(statements / total_attempts, 3),
+            "commits_per_s": round(commits / elapsed, 1),
+            "attempts_per_s": round(total_attempts / elapsed, 1),
+        })
+    print_table(results, f"{DELIVERIES} deliveries, {RETRY_PERCENT}% retried once")
+
+if __name__ == "__main__":
+    main()
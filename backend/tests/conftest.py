@@ -0,0 +1,50 @@
+import os
+import sys
+import uuid
+import tempfile
+
+# Point the app at a throwaway database before it is imported. Set TEST_DATABASE_URL
+# to a Postgres database to exercise real row locking and concurrency.
+_tmpdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", f"sqlite:///{_tmpdir}/test.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from app.database import Base, engine, SessionLocal
+from app import models
+
+MERCHANT_ID = uuid.UUID("550e8400-e29b-41d4-a716-446655440000")
+AUTH_HEADERS = {"X-Api-Key": "key_test_abc123", "X-Api-Secret": "secret_test_xyz789"}
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(models.Merchant(
+        id=MERCHANT_ID, name="Test Merchant", email="test@example.com",
+        api_key="key_test_abc123", api_secret="secret_test_xyz789",
+        webhook_secret="whsec_test_abc123"
+    ))
+    db.commit()
+    db.close()
+    yield
+    engine.dispose()
+
+@pytest.fixture
+def settled_payment():
+    """Factory for a captured, successful payment of the given amount."""
+    def make(amount: int) -> str:
+        db = SessionLocal()
+        try:
+            order = models.Order(id=f"order_{uuid.uuid4().hex[:16]}", merchant_id=MERCHANT_ID, amount=amount, status="created")
+            payment = models.Payment(
+                id=f"pay_{uuid.uuid4().hex[:16]}", order_id=order.id, merchant_id=MERCHANT_ID,
+                amount=amount, method="upi", status="success"
+            )
+            db.add_all([order, payment])
+            db.commit()
+            return payment.id
+        finally:
+            db.close()
+    return make
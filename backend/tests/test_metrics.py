@@ -0,0 +1,41 @@
+import asyncio
+
+import httpx
+
+from app.main import app
+from app.database import async_engine
+from conftest import AUTH_HEADERS
+
+def request_all(calls):
+    """Runs (method, path) calls in order against the app and returns the responses."""
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return [await client.request(method, path, headers=AUTH_HEADERS, **kwargs) for method, path, kwargs in calls]
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(run())
+
+def test_request_latency_is_labelled_with_full_route_templates():
+    *_, scrape = request_all([
+        ("GET", "/api/v1/orders", {}),
+        ("GET", "/api/v1/payments", {}),
+        ("POST", "/api/v1/orders/batch", {"json": {"items": []}}),
+        ("POST", "/api/v1/payments/batch", {"json": {"items": []}}),
+        ("GET", "/api/v1/orders/order_missing/public", {}),
+        ("GET", "/api/v1/payments/pay_missing/public", {}),
+        ("GET", "/no/such/path", {}),
+        ("GET", "/metrics", {}),
+    ])
+    body = scrape.text
+
+    for route in (
+        "/api/v1/orders", "/api/v1/payments",
+        "/api/v1/orders/batch", "/api/v1/payments/batch",
+        "/api/v1/orders/{order_id}/public", "/api/v1/payments/{payment_id}/public",
+        "unmatched",
+    ):
+        assert f'route="{route}"' in body, route
+    assert 'route="/batch"' not in body
+    assert "order_missing" not in body and "pay_missing" not in body
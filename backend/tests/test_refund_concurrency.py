@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from unittest import mock
+
+import httpx
+
+from app.main import app
+from app.database import SessionLocal, async_engine
+from app import models, tasks
+from conftest import AUTH_HEADERS
+
+def post_refunds(payment_id: str, amounts):
+    """Fires all refund requests at once and returns the responses."""
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await asyncio.gather(*(
+                    client.post(f"/api/v1/payments/{payment_id}/refunds", json={"amount": amount}, headers=AUTH_HEADERS)
+                    for amount in amounts
+                ))
+        finally:
+            # Pooled async connections belong to this event loop
+            await async_engine.dispose()
+    return asyncio.run(run())
+
+def load_payment(payment_id: str):
+    db = SessionLocal()
+    try:
+        return db.query(models.Payment).filter(models.Payment.id == payment_id).first()
+    finally:
+        db.close()
+
+def refund_webhooks(refund_ids):
+    """refund.processed deliveries waiting in the outbox for these refunds."""
+    db = SessionLocal()
+    try:
+        messages = db.query(models.OutboxMessage).filter(
+            models.OutboxMessage.task_name == tasks.deliver_webhook_job.name
+        ).all()
+        return [m for m in messages if m.args[1] == "refund.processed" and m.args[2]["data"]["refund"]["id"] in refund_ids]
+    finally:
+        db.close()
+
+def test_parallel_refunds_never_exceed_payment_amount(settled_payment):
+    payment_id = settled_payment(1000)
+
+    responses = post_refunds(payment_id, [300] * 20)
+
+    created = [r for r in responses if r.status_code == 201]
+    assert len(created) == 3
+    assert all(
+        r.json()["detail"]["error"]["description"] == "Refund amount exceeds available amount"
+        for r in responses if r.status_code != 201
+    )
+    assert load_payment(payment_id).refunded_amount == 900
+
+def test_non_positive_refunds_are_rejected(settled_payment):
+    payment_id = settled_payment(50000)
+
+    responses = post_refunds(payment_id, [-50000, 0])
+    assert [r.status_code for r in responses] == [422, 422]
+
+    # The reservation is untouched, so a full refund still fits but nothing more
+    assert post_refunds(payment_id, [100000])[0].status_code == 400
+    assert post_refunds(payment_id, [50000])[0].status_code == 201
+    assert load_payment(payment_id).refunded_amount == 50000
+
+def test_concurrent_completions_mark_payment_refunded_once(settled_payment):
+    payment_id = settled_payment(1000)
+    refund_ids = [r.json()["id"] for r in post_refunds(payment_id, [250] * 4)]
+
+    with mock.patch.object(tasks.crud, "record_payment_refunded") as rollup:
+        barrier = threading.Barrier(len(refund_ids))
+
+        def complete(refund_id):
+            barrier.wait()
+            tasks.complete_refund_job(refund_id)
+
+        # Every refund is completed twice, as an at-least-once relay may do
+        threads = [threading.Thread(target=complete, args=(rid,)) for rid in refund_ids]
+        threads += [threading.Thread(target=tasks.complete_refund_job, args=(rid,)) for rid in refund_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert load_payment(payment_id).status == "refunded"
+    assert rollup.call_count == 1
+    assert len(refund_webhooks(refund_ids)) == len(refund_ids)
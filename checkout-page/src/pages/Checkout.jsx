@@ -26,7 +26,8 @@ const Checkout = () => {
     // 1. PUBLIC ENDPOINT: Fetch order details
     useEffect(() => {
         if (orderId) {
-            axios.get(`http://localhost:8000/api/v1/orders/${orderId}/public`)
+            // Same origin: nginx serves repeat loads from its cache of the public order view
+            axios.get(`/api/v1/orders/${orderId}/public`)
                 .then(res => setOrder(res.data))
                 .catch(() => setView('error'));
         }
@@ -49,8 +50,8 @@ const Checkout = () => {
             const res = await axios.post('http://localhost:8000/api/v1/payments/public', 
                 { order_id: orderId, ...payload }
             );
-            // Polling is started using the ID returned by the async backend
-            pollStatus(res.data.payment_id); 
+            // The final status is pushed by the backend; polling is only a fallback
+            watchStatus(res.data.payment_id);
         } catch (err) {
             const errorDesc = err.response?.data?.detail?.error?.description || "Payment failed";
             setErrorMessage(errorDesc);
@@ -61,32 +62,56 @@ const Checkout = () => {
         }
     };
 
-    // 3. POLLING: Detect status change from Async Workers
+    // 3. STATUS: Final outcome from the async workers. Anything but 'pending' is final;
+    // a payment already refunded by the time we hear about it did go through.
+    const handleFinalStatus = (data) => {
+        if (!data.status || data.status === 'pending') return false;
+
+        if (data.status === 'success' || data.status === 'refunded') {
+            setPaymentData(data);
+            setView('success');
+
+            // Trigger SDK success callback
+            sendMessageToParent('payment_success', {
+                paymentId: data.id,
+                orderId: orderId
+            });
+            return true;
+        }
+
+        const desc = data.error_description ||
+            (data.status === 'failed' ? "Transaction declined by bank" : `Payment ${data.status}`);
+        setErrorMessage(desc);
+        setView('error');
+
+        // Trigger SDK failure callback
+        sendMessageToParent('payment_failed', { error: desc });
+        return true;
+    };
+
+    // Server-Sent Events: one pushed message instead of a poll every 2 seconds
+    const watchStatus = (id) => {
+        if (!window.EventSource) {
+            pollStatus(id);
+            return;
+        }
+        const source = new EventSource(`http://localhost:8000/api/v1/payments/${id}/events`);
+        source.addEventListener('status', (e) => {
+            source.close();
+            handleFinalStatus(JSON.parse(e.data));
+        });
+        source.onerror = () => {
+            // EventSource reconnects by itself after a server-side timeout; only
+            // give up on the stream once the browser has closed it for good
+            if (source.readyState === EventSource.CLOSED) pollStatus(id);
+        };
+    };
+
     const pollStatus = (id) => {
         const interval = setInterval(async () => {
             try {
-                // Notice the '/public' at the end to match the new API route
                 const res = await axios.get(`http://localhost:8000/api/v1/payments/${id}/public`);
-                
-                if (res.data.status === 'success') {
-                    setPaymentData(res.data);
-                    setView('success');
-                    clearInterval(interval);
-                    
-                    // Trigger SDK success callback
-                    sendMessageToParent('payment_success', { 
-                        paymentId: res.data.id,
-                        orderId: orderId 
-                    });
-                } else if (res.data.status === 'failed') {
-                    const desc = res.data.error_description || "Transaction declined by bank";
-                    setErrorMessage(desc);
-                    setView('error');
-                    clearInterval(interval);
-                    
-                    // Trigger SDK failure callback
-                    sendMessageToParent('payment_failed', { error: desc });
-                }
+                if (handleFinalStatus(res.data)) clearInterval(interval);
             } catch (err) {
                 // Don't stop on 404, the record might still be enqueuing
                 console.log("Waiting for status update...");